@@ -1,129 +1,393 @@
-from datetime import datetime
+from pymysql.converters import escape_item
 
-from .data import TimeseriesGroupOperation
-from .Constants import MYSQL_DATETIME_FORMAT
+from .data import Data, Aggregate, to_group_operation
+from .rollup import ROLLUP_RESOLUTIONS, rollup_ranges
 from .AdapterError import InvalidDataAdapterError
 
-_MYSQL_5MIN_TIMESERIES = \
-    "SELECT " \
-        "REPLACE(" \
-            "MAX(time), " \
-            "SUBSTRING_INDEX(MAX(time), ' ', -1), " \
-            "SEC_TO_TIME((TIME_TO_SEC(MAX(time)) DIV 300) * 300)) as datetime, " \
-        "%s(value) as value " \
-    "FROM curw_iot.data " \
-    "WHERE " \
-        "id = '%s' " \
-        "and " \
-        "time <= '%s' " \
-        "and " \
-        "time > '%s' " \
-    "GROUP BY UNIX_TIMESTAMP(time) DIV 300 " \
-    "ORDER BY datetime;"
-
-_MYSQL_1MIN_TIMESERIES = \
-    "SELECT " \
-        "DATE_FORMAT(MAX(time), '%s') as datetime, " \
-        "%s(value) as value " \
-    "FROM curw_iot.data " \
-    "WHERE " \
-        "id = '%s' " \
-        "and " \
-        "time <= '%s' " \
-        "and " \
-        "time > '%s' " \
-    "GROUP BY UNIX_TIMESTAMP(time) DIV 60 " \
-    "ORDER BY datetime;"
-
-
-def _1min_sum(event_id, start_date, end_date):
-    """
-    Returns mysql query for retrieving timeseries in between start_date and end_date
-    for a given event_id in 1 min intervals.
-    :param event_id: timeseries id
-    :param start_date: starting datetime (early datetime) [exclusive], format: "%Y-%m-%d %H:%M:%S"
-    :param end_date: ending datetime (late datetime) [inclusive], format: "%Y-%m-%d %H:%M:%S"
-    :return: mysql query to retrieve timeseries in 1min interval
+MYSQL_SELECT_RUN_EXISTS = "SELECT 1 FROM `run` WHERE `id`=%s"
+MYSQL_INSERT_RUN = \
+    "INSERT INTO `run` (`id`, `name`, `station`, `variable`, `unit`, `type`, `source`) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+MYSQL_DELETE_RUN = "DELETE FROM `run` WHERE `id`=%s"
+
+
+def select_existing_runs_query(count):
+    """
+    Returns mysql query for selecting which of the given number of run ids exist.
     """
-    return _MYSQL_1MIN_TIMESERIES % (MYSQL_DATETIME_FORMAT, 'SUM', event_id, end_date, start_date)
+    return "SELECT `id` FROM `run` WHERE `id` IN (%s)" % ','.join(['%s'] * count)
 
 
-def _1min_max(event_id, start_date, end_date):
+def insert_runs_query(count):
     """
-    Returns mysql query for retrieving timeseries in between start_date and end_date
-    for a given event_id 1 min intervals.
-    :param event_id: timeseries id
-    :param start_date: starting datetime (early datetime) [exclusive], format: "%Y-%m-%d %H:%M:%S"
-    :param end_date: ending datetime (late datetime) [inclusive], format: "%Y-%m-%d %H:%M:%S"
-    :return: mysql query to retrieve timeseries in 1min interval
+    Returns mysql query for inserting given number of runs with a single statement. Existing runs are kept.
+    Values of each run should be passed in the order of MYSQL_INSERT_RUN.
     """
-    return _MYSQL_1MIN_TIMESERIES % (MYSQL_DATETIME_FORMAT, 'MAX', event_id, end_date, start_date)
+    return "INSERT INTO `run` (`id`, `name`, `station`, `variable`, `unit`, `type`, `source`) " \
+           "VALUES %s ON DUPLICATE KEY UPDATE `id`=`id`" % ','.join(['(%s, %s, %s, %s, %s, %s, %s)'] * count)
+
+
+# Widen run start_date and end_date to include the ranges of newly inserted data
+_MYSQL_UPDATE_RUNS_DATES = \
+    "UPDATE `run` JOIN (%s) as `bounds` ON `run`.`id`=`bounds`.`id` SET " \
+        "`run`.`start_date`=LEAST(COALESCE(`run`.`start_date`, `bounds`.`start_date`), `bounds`.`start_date`), " \
+        "`run`.`end_date`=GREATEST(COALESCE(`run`.`end_date`, `bounds`.`end_date`), `bounds`.`end_date`)"
+
+_MYSQL_RUN_DATES_ROW = "SELECT %s as `id`, CAST(%s AS DATETIME) as `start_date`, CAST(%s AS DATETIME) as `end_date`"
 
-def _1min_avg(event_id, start_date, end_date):
+
+def update_runs_dates(run_dates):
     """
-    Returns mysql query for retrieving timeseries in between start_date and end_date
-    for a given event_id 1 min intervals.
-    :param event_id: timeseries id
-    :param start_date: starting datetime (early datetime) [exclusive], format: "%Y-%m-%d %H:%M:%S"
-    :param end_date: ending datetime (late datetime) [inclusive], format: "%Y-%m-%d %H:%M:%S"
-    :return: mysql query to retrieve timeseries in 1min interval
+    Returns mysql query and its arguments for widening start_date and end_date of several runs
+    in a single statement.
+    :param run_dates: dict of {event_id: (start_date, end_date)}
+    :return: tuple of (mysql query, list of query arguments)
     """
-    return _MYSQL_1MIN_TIMESERIES % (MYSQL_DATETIME_FORMAT, 'AVG', event_id, end_date, start_date)
+    sql = _MYSQL_UPDATE_RUNS_DATES % ' UNION ALL '.join([_MYSQL_RUN_DATES_ROW] * len(run_dates))
+    args = []
+    for event_id, (start_date, end_date) in run_dates.items():
+        args.extend((event_id, start_date, end_date))
+    return sql, args
 
 
-def _5min_sum(event_id, start_date, end_date):
+def select_runs_dates_query(event_count):
     """
-    Returns mysql query for retrieving timeseries in between start_date and end_date
-    for a given event_id 5 min intervals.
-    :param event_id: timeseries id
-    :param start_date: starting datetime (early datetime) [exclusive], format: "%Y-%m-%d %H:%M:%S"
-    :param end_date: ending datetime (late datetime) [inclusive], format: "%Y-%m-%d %H:%M:%S"
-    :return: mysql query to retrieve timeseries in 5min interval
+    Returns mysql query for selecting (id, start_date, end_date) of several runs.
+    Event ids should be passed as the query arguments.
+    """
+    return "SELECT `id`, `start_date`, `end_date` FROM `run` WHERE `id` IN (%s)" % ','.join(['%s'] * event_count)
+
+
+# Full scan of both data tables, in order to recompute run start_date and end_date
+MYSQL_SELECT_RUN_DATES = \
+    "SELECT MIN(`start_date`), MAX(`end_date`) FROM (" \
+        "SELECT MIN(`time`) as `start_date`, MAX(`time`) as `end_date` FROM `data` WHERE `id`=%s " \
+        "UNION ALL " \
+        "SELECT MIN(`time`) as `start_date`, MAX(`time`) as `end_date` FROM `processed_data` WHERE `id`=%s" \
+    ") as `bounds`"
+
+# Maximum number of event ids in the IN list of a single timeseries query
+MAX_EVENTS_PER_QUERY = 500
+
+
+# Select times as epoch seconds and values as DOUBLE for columnar output. TIMESTAMPDIFF does not depend on
+# the session time zone, unlike UNIX_TIMESTAMP, thus times are read back as they were stored.
+_COLUMNAR_TIME = "TIMESTAMPDIFF(SECOND, '1970-01-01 00:00:00', `%s`)"
+_COLUMNAR_VALUE = "`%s`+0E0"
+
+
+def retrieve_timeseries_query(data_table, event_count, from_date=None, to_date=None, columnar=False):
+    """
+    Returns mysql query and its date arguments for retrieving the timeseries of several events in a single
+    query, ordered by event id and time.
+    :param string data_table: `data` | `processed_data`
+    :param int event_count: Number of event ids. Event ids should be passed as the first query arguments.
+    :param from_date: start datetime [inclusive]
+    :param to_date: end datetime [inclusive]
+    :param boolean columnar: If True, select times as epoch seconds and values as DOUBLE
+    :return: tuple of (mysql query, list of query arguments after event ids)
     """
-    return _MYSQL_5MIN_TIMESERIES % ('SUM', event_id, end_date, start_date)
+    columns = "`id`,%s,%s" % (_COLUMNAR_TIME % 'time', _COLUMNAR_VALUE % 'value') if columnar else "`id`,`time`,`value`"
+    sql = "SELECT %s FROM `%s` WHERE `id` IN (%s) " % (columns, data_table, ','.join(['%s'] * event_count))
+    args = []
+    if from_date:
+        sql += "AND `time`>=%s "
+        args.append(from_date)
+    if to_date:
+        sql += "AND `time`<=%s "
+        args.append(to_date)
+    sql += "ORDER BY `id`, `time`"
+    return sql, args
 
-def _5min_max(event_id, start_date, end_date):
+
+def retrieve_timeseries_queries(data_table, event_ids, from_date=None, to_date=None, columnar=False):
     """
-    Returns mysql query for retrieving timeseries in between start_date and end_date
-    for a given event_id 5 min intervals.
-    :param event_id: timeseries id
-    :param start_date: starting datetime (early datetime) [exclusive], format: "%Y-%m-%d %H:%M:%S"
-    :param end_date: ending datetime (late datetime) [inclusive], format: "%Y-%m-%d %H:%M:%S"
-    :return: mysql query to retrieve timeseries in 5min interval
+    Returns mysql queries for retrieving the timeseries of given events, a query per MAX_EVENTS_PER_QUERY events.
+    Refer to retrieve_timeseries_query for the parameters.
+    :param list event_ids: list of event ids
+    :return: generator of (mysql query, list of query arguments) tuples
     """
-    return _MYSQL_5MIN_TIMESERIES % ('MAX', event_id, end_date, start_date)
+    for i in range(0, len(event_ids), MAX_EVENTS_PER_QUERY):
+        batch = list(event_ids[i:i + MAX_EVENTS_PER_QUERY])
+        sql, args = retrieve_timeseries_query(data_table, len(batch), from_date, to_date, columnar)
+        yield sql, batch + args
+
+
+# Aggregates of the values of a time bucket which are not SQL aggregate functions.
+# GROUP_CONCAT truncates at group_concat_max_len, but keeps the leading value which is selected.
+_GROUP_AGGREGATES = {
+    Aggregate.first: "CAST(SUBSTRING_INDEX(GROUP_CONCAT(`value` ORDER BY `time`), ',', 1) AS DECIMAL(8,3))",
+    Aggregate.last: "CAST(SUBSTRING_INDEX(GROUP_CONCAT(`value` ORDER BY `time` DESC), ',', 1) AS DECIMAL(8,3))",
+}
+# Aggregates of a time bucket over the `sum`, `min`, `max` and `count` columns of rollup rows.
+# They give the same values and types as the aggregates over the raw values.
+_ROLLUP_GROUP_AGGREGATES = {
+    Aggregate.sum: "SUM(`sum`)",
+    Aggregate.min: "MIN(`min`)",
+    Aggregate.max: "MAX(`max`)",
+    Aggregate.count: "CAST(SUM(`count`) AS SIGNED)",
+    Aggregate.avg: "SUM(`sum`) / SUM(`count`)",
+}
+_EPOCH = '1970-01-01 00:00:00'
 
-def _5min_avg(event_id, start_date, end_date):
+
+def _bucket(interval, offset=0):
+    return "FLOOR((TIMESTAMPDIFF(SECOND, '%s', `time`) - %d) / %d)" % (_EPOCH, offset, interval)
+
+
+def _grouped_query(group_operation, aggregate, sql, columnar):
+    """Aggregate the rows of sql into the time buckets of group_operation, and select the bucket start times"""
+    interval, offset = group_operation.interval, group_operation.offset
+    if columnar:
+        columns = "`bucket` * %d + %d as `time`, %s" % (interval, offset, _COLUMNAR_VALUE % 'value')
+    else:
+        columns = "TIMESTAMPADD(SECOND, `bucket` * %d + %d, '%s') as `datetime`, `value`" % (interval, offset, _EPOCH)
+    return "SELECT `id`, %s FROM (" \
+           "SELECT `id`, %s as `bucket`, %s as `value` FROM (%s) as `timeseries` GROUP BY `id`, `bucket`" \
+           ") as `buckets` ORDER BY `id`, `bucket`" % (columns, _bucket(interval, offset), aggregate, sql)
+
+
+def grouped_timeseries_query(data_table, group_operation, event_count, start_date, end_date, columnar=False):
     """
-    Returns mysql query for retrieving timeseries in between start_date and end_date
-    for a given event_id 5 min intervals.
-    :param event_id: timeseries id
+    Returns mysql query for retrieving the timeseries of events in between start_date and end_date,
+    aggregated into the time buckets of group_operation with a single GROUP BY `id`, bucket.
+    Rows are (id, datetime, value) ordered by id and datetime, where datetime is the start of the bucket.
+    :param str data_table: Name of the data table. Should be a value of Data enum.
+    :param GroupOperation group_operation: bucket interval, offset and aggregate
+    :param int event_count: Number of event ids. Event ids should be passed as the first query arguments.
     :param start_date: starting datetime (early datetime) [exclusive], format: "%Y-%m-%d %H:%M:%S"
     :param end_date: ending datetime (late datetime) [inclusive], format: "%Y-%m-%d %H:%M:%S"
-    :return: mysql query to retrieve timeseries in 5min interval
+    :param boolean columnar: If True, select bucket start times as epoch seconds and values as DOUBLE
+    :return: tuple of (mysql query, list of query arguments after event ids)
     """
-    return _MYSQL_5MIN_TIMESERIES % ('AVG', event_id, end_date, start_date)
+    aggregate = _GROUP_AGGREGATES.get(group_operation.aggregate, '%s(`value`)' % group_operation.aggregate.value)
+    sql = "SELECT `id`, `time`, `value` FROM `%s` WHERE `id` IN (%s) AND `time`>%%s AND `time`<=%%s" \
+          % (data_table, ','.join(['%s'] * event_count))
+    return _grouped_query(group_operation, aggregate, sql, columnar), [start_date, end_date]
+
 
 def get_query(group_operation, event_id, start_date, end_date):
     """
-    Returns the corresponding sql query for the given group_operation
-    :param group_operation: should be of TimeseriesGroupOperation
-    :param event_id: timeseries id
+    Returns mysql query for retrieving the grouped timeseries of an event, with the arguments inlined.
+    Kept for the callers of the TimeseriesGroupOperation presets. Prefer grouped_timeseries_query.
+    :param group_operation: TimeseriesGroupOperation preset, or GroupOperation
+    :param str event_id: timeseries id
     :param start_date: starting datetime (early datetime) [exclusive], format: "%Y-%m-%d %H:%M:%S"
     :param end_date: ending datetime (late datetime) [inclusive], format: "%Y-%m-%d %H:%M:%S"
-    :return: mysql query string
-    """
-    if group_operation is TimeseriesGroupOperation.mysql_1min_sum:
-        return _1min_sum(event_id, start_date, end_date)
-    elif group_operation is TimeseriesGroupOperation.mysql_1min_max:
-        return _1min_max(event_id, start_date, end_date)
-    elif group_operation is TimeseriesGroupOperation.mysql_1min_avg:
-        return _1min_avg(event_id, start_date, end_date)
-    elif group_operation is TimeseriesGroupOperation.mysql_5min_sum:
-        return _5min_sum(event_id, start_date, end_date)
-    elif group_operation is TimeseriesGroupOperation.mysql_5min_max:
-        return _5min_max(event_id, start_date, end_date)
-    elif group_operation is TimeseriesGroupOperation.mysql_5min_avg:
-        return _5min_avg(event_id, start_date, end_date)
+    :return: mysql query selecting (datetime, value) rows, where datetime is the start of the bucket,
+    formatted as "%Y-%m-%d %H:%M:%S"
+    """
+    sql, args = grouped_timeseries_query(Data.data.value, to_group_operation(group_operation), 1, start_date, end_date)
+    sql = sql % tuple(escape_item(arg, 'utf8') for arg in [event_id] + args)
+    return "SELECT DATE_FORMAT(`datetime`, '%%Y-%%m-%%d %%H:%%i:%%s') as `datetime`, `value` " \
+           "FROM (%s) as `grouped` ORDER BY `datetime`" % sql
+
+
+def rollup_grouped_timeseries_query(data_table, group_operation, event_ids, resolution, rollup_start, rollup_end,
+                                    start_date, end_date, columnar=False):
+    """
+    Same as grouped_timeseries_query, but read the buckets of [rollup_start, rollup_end) from the rollup table of
+    given resolution, and only the edges of (start_date, end_date] outside of them from the data table.
+    The interval and offset of group_operation should be multiples of the resolution, and the aggregate should be
+    one of rollup.ROLLUP_AGGREGATES.
+    :param list event_ids: list of event ids
+    :param int resolution: Bucket size of the rollup rows in seconds
+    :param datetime rollup_start: start datetime of the rollup buckets [inclusive]
+    :param datetime rollup_end: end datetime of the rollup buckets [exclusive]
+    :return: tuple of (mysql query, list of query arguments)
+    """
+    event_id_params = ','.join(['%s'] * len(event_ids))
+    sql = "SELECT `id`, `time`, `sum`, `min`, `max`, `count` FROM `%s_rollup` " \
+          "WHERE `id` IN (%s) AND `resolution`=%d AND `time`>=%%s AND `time`<%%s " \
+          "UNION ALL " \
+          "SELECT `id`, `time`, `value`, `value`, `value`, 1 FROM `%s` " \
+          "WHERE `id` IN (%s) AND ((`time`>%%s AND `time`<%%s) OR (`time`>=%%s AND `time`<=%%s))" \
+          % (data_table, event_id_params, resolution, data_table, event_id_params)
+    args = list(event_ids) + [rollup_start, rollup_end] + list(event_ids) + [start_date, rollup_start, rollup_end,
+                                                                              end_date]
+    return _grouped_query(group_operation, _ROLLUP_GROUP_AGGREGATES[group_operation.aggregate], sql, columnar), args
+
+
+def grouped_timeseries_queries(data_table, group_operation, event_ids, start_date, end_date, columnar=False,
+                               rollup=None):
+    """
+    Returns mysql queries for retrieving the grouped timeseries of given events, a query per MAX_EVENTS_PER_QUERY
+    events. Refer to grouped_timeseries_query for the parameters.
+    :param list event_ids: list of event ids
+    :param tuple rollup: (resolution, rollup_start, rollup_end) returned by rollup.plan_rollup, in order to read
+    the buckets in between from the rollup table with rollup_grouped_timeseries_query. If None, read raw data only.
+    :return: generator of (mysql query, list of query arguments) tuples
+    """
+    for i in range(0, len(event_ids), MAX_EVENTS_PER_QUERY):
+        batch = list(event_ids[i:i + MAX_EVENTS_PER_QUERY])
+        if rollup is None:
+            sql, args = grouped_timeseries_query(data_table, group_operation, len(batch), start_date, end_date,
+                                                 columnar)
+            yield sql, batch + args
+        else:
+            resolution, rollup_start, rollup_end = rollup
+            yield rollup_grouped_timeseries_query(data_table, group_operation, batch, resolution, rollup_start,
+                                                  rollup_end, start_date, end_date, columnar)
+
+
+def update_rollups_query(data_table, resolution, ranges, source_resolution=None):
+    """
+    Returns mysql query and its arguments for recomputing the rollup buckets of given resolution which are in
+    the time ranges of several events, in a single statement.
+    :param str data_table: Name of the data table. Should be a value of Data enum.
+    :param int resolution: Bucket size of the rollup rows in seconds
+    :param dict ranges: dict of {event_id: (start datetime [inclusive], end datetime [exclusive])}.
+    Ranges should be aligned to the buckets.
+    :param int source_resolution: If given, aggregate the finer rollup rows of this resolution,
+    instead of the data table
+    :return: tuple of (mysql query, list of query arguments)
+    """
+    where = ' OR '.join(["(`id`=%s AND `time`>=%s AND `time`<%s)"] * len(ranges))
+    if source_resolution is None:
+        sql = "SELECT `id`, %s as `bucket`, SUM(`value`) as `sum`, MIN(`value`) as `min`, MAX(`value`) as `max`, " \
+              "COUNT(*) as `count` FROM `%s` WHERE %s GROUP BY `id`, `bucket`" \
+              % (_bucket(resolution), data_table, where)
     else:
-        raise InvalidDataAdapterError("Invalid group_operation type: %s" % group_operation)
+        sql = "SELECT `id`, %s as `bucket`, SUM(`sum`) as `sum`, MIN(`min`) as `min`, MAX(`max`) as `max`, " \
+              "SUM(`count`) as `count` FROM `%s_rollup` WHERE `resolution`=%d AND (%s) GROUP BY `id`, `bucket`" \
+              % (_bucket(resolution), data_table, source_resolution, where)
+    sql = "INSERT INTO `%s_rollup` (`id`, `resolution`, `time`, `sum`, `min`, `max`, `count`) " \
+          "SELECT `id`, %d, TIMESTAMPADD(SECOND, `bucket` * %d, '%s'), `sum`, `min`, `max`, `count` " \
+          "FROM (%s) as `buckets` " \
+          "ON DUPLICATE KEY UPDATE `sum`=VALUES(`sum`), `min`=VALUES(`min`), `max`=VALUES(`max`), " \
+          "`count`=VALUES(`count`)" % (data_table, resolution, resolution, _EPOCH, sql)
+    args = []
+    for event_id, (start, end) in ranges.items():
+        args.extend((event_id, start, end))
+    return sql, args
+
+
+def update_rollups_queries(data_table, run_dates):
+    """
+    Returns mysql queries for recomputing the rollup buckets of all the resolutions which contain given time
+    ranges, a query per resolution for up to MAX_EVENTS_PER_QUERY events. Each resolution is aggregated from
+    the previous one, thus the queries should be executed in order.
+    :param str data_table: Name of the data table. Should be a value of Data enum.
+    :param dict run_dates: Dict of {event_id: (start_date, end_date)}
+    :return: generator of (mysql query, list of query arguments) tuples
+    """
+    event_ids = list(run_dates.keys())
+    for i in range(0, len(event_ids), MAX_EVENTS_PER_QUERY):
+        batch = dict((event_id, run_dates[event_id]) for event_id in event_ids[i:i + MAX_EVENTS_PER_QUERY])
+        source_resolution = None
+        for resolution in ROLLUP_RESOLUTIONS:
+            yield update_rollups_query(data_table, resolution, rollup_ranges(batch, resolution), source_resolution)
+            source_resolution = resolution
+
+
+def stitched_timeseries_query(data_table, run_filters, type_ids, from_date=None, to_date=None, columnar=False):
+    """
+    Returns mysql query for stitching the timeseries of several runs into a single timeseries, ordered by time.
+    For each time, take the value of the run with the most preferred type. Among the runs of the same type,
+    take the latest run by start_date.
+    :param str data_table: Name of the data table. Should be a value of Data enum.
+    :param dict run_filters: Values of the `run` columns s.t. {'station': 1, 'variable': 2, 'source': 3}
+    :param list type_ids: Type ids of the runs in the order of preference
+    :param from_date: start datetime [inclusive]
+    :param to_date: end datetime [inclusive]
+    :param boolean columnar: If True, select times as epoch seconds and values as DOUBLE
+    :return: tuple of (mysql query, list of query arguments)
+    """
+    type_params = ','.join(['%s'] * len(type_ids))
+    # GROUP_CONCAT truncates at group_concat_max_len, but keeps the leading value which is selected
+    sql = "SELECT `data`.`time` as `time`, CAST(SUBSTRING_INDEX(GROUP_CONCAT(`data`.`value` " \
+          "ORDER BY FIELD(`run`.`type`, %s), `run`.`start_date` DESC, `run`.`id`), ',', 1) AS DECIMAL(8,3)) " \
+          "as `value` FROM `run` JOIN `%s` as `data` ON `data`.`id`=`run`.`id` WHERE `run`.`type` IN (%s) " \
+          % (type_params, data_table, type_params)
+    args = list(type_ids) + list(type_ids)
+    for key, value in run_filters.items():
+        sql += "AND `run`.`%s`=%%s " % key
+        args.append(value)
+    if from_date:
+        sql += "AND `data`.`time`>=%s "
+        args.append(from_date)
+    if to_date:
+        sql += "AND `data`.`time`<=%s "
+        args.append(to_date)
+    sql += "GROUP BY `data`.`time`"
+    if columnar:
+        sql = "SELECT %s, %s FROM (%s) as `timeseries`" % (_COLUMNAR_TIME % 'time', _COLUMNAR_VALUE % 'value', sql)
+    return sql + " ORDER BY `time`", args
+
+
+# Columns of the `station` and `source` tables, in the order of the INSERT statements
+STATION_KEYS = ['id', 'stationId', 'name', 'latitude', 'longitude', 'resolution', 'description']
+SOURCE_KEYS = ['id', 'source', 'parameters']
+
+MYSQL_SELECT_STATION_MAX_ID = "SELECT max(id) FROM `station` WHERE %s <= id AND id < %s"
+MYSQL_INSERT_STATION = \
+    "INSERT INTO `station` (`id`, `stationId`, `name`, `latitude`, `longitude`, `resolution`, `description`) " \
+    "VALUES (%s, %s, %s, %s, %s, %s, %s)"
+MYSQL_DELETE_STATION = "DELETE FROM `station` WHERE `id`=%s"
+MYSQL_DELETE_STATION_BY_STATION_ID = "DELETE FROM `station` WHERE `stationId`=%s"
+
+MYSQL_SELECT_SOURCE_MAX_ID = "SELECT max(id) FROM `source`"
+MYSQL_INSERT_SOURCE = "INSERT INTO `source` (`id`, `source`, `parameters`) VALUES (%s, %s, %s)"
+MYSQL_DELETE_SOURCE = "DELETE FROM `source` WHERE `id`=%s"
+
+# Bounds of get_stations_in_area query s.t. {'latitude_lower': ('latitude', '>='), ...}
+_AREA_BOUNDS = {
+    'latitude_lower': ('latitude', '>='),
+    'longitude_lower': ('longitude', '>='),
+    'latitude_upper': ('latitude', '<='),
+    'longitude_upper': ('longitude', '<='),
+}
+
+
+def _select_columns(table, keys):
+    return "SELECT %s FROM `%s` " % (','.join("`%s` as `%s`" % (key, key) for key in keys), table)
+
+
+def select_station_query(query, keys=STATION_KEYS):
+    """
+    Returns mysql query and its arguments for getting a station.
+    :param dict query: Dict of column values s.t. {'stationId': 'curw_hanwella'}
+    :param list keys: Output columns
+    :return: tuple of (mysql query, list of query arguments)
+    """
+    sql = _select_columns('station', keys)
+    args = []
+    if query:
+        for key in query:
+            if key not in STATION_KEYS:
+                raise InvalidDataAdapterError("Invalid station query key %s. Should be one of %s"
+                                              % (key, STATION_KEYS))
+        sql += "WHERE " + ' AND '.join("`%s`=%%s" % key for key in query) + " "
+        args = [query[key] for key in query]
+    return sql, args
+
+
+def select_stations_in_area_query(query, keys=STATION_KEYS):
+    """
+    Returns mysql query and its arguments for getting the stations inside an area.
+    :param dict query: Dict with any of latitude_lower, longitude_lower, latitude_upper, longitude_upper
+    :param list keys: Output columns
+    :return: tuple of (mysql query, list of query arguments)
+    """
+    sql = _select_columns('station', keys)
+    conditions = []
+    args = []
+    for key in query or {}:
+        if key in _AREA_BOUNDS:
+            conditions.append("`%s`%s%%s" % _AREA_BOUNDS[key])
+            args.append(query[key])
+    if conditions:
+        sql += "WHERE " + ' AND '.join(conditions) + " "
+    return sql, args
+
+
+def select_source_query(source_id=0, name='', keys=SOURCE_KEYS):
+    """
+    Returns mysql query and its arguments for getting a source by its id or name.
+    :return: tuple of (mysql query, list of query arguments)
+    """
+    sql = _select_columns('source', keys)
+    if source_id > 0:
+        return sql + "WHERE `id`=%s", [source_id]
+    if name:
+        return sql + "WHERE `source`=%s", [name]
+    return sql, []
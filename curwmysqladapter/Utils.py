@@ -1,6 +1,10 @@
+import hashlib
+import json
+import re
 from datetime import datetime
 
 from .Constants import  COMMON_DATETIME_FORMAT
+from .AdapterError import InvalidDataAdapterError
 
 def validate_common_datetime(date_text):
     try:
@@ -8,3 +12,57 @@ def validate_common_datetime(date_text):
         return True
     except ValueError:
         return False
+
+
+_DATETIME_PATTERN = re.compile(r'^(\d{4}-\d{1,2}-\d{1,2})(?:[ _T]([\d:]*))?')
+
+
+def to_datetime(time):
+    """
+    Convert a timeseries time into datetime.
+    :param time: datetime, or datetime string s.t. '2017-05-01 00:00:00', '2017-05-01_00:00:00', '2017-05-01T00:00'
+    :return: datetime
+    """
+    if isinstance(time, datetime):
+        return time
+    # Accept common delimiters between date and time, e.g. '2017-05-30_00:00:00' or '2017-05-30T00:00:00',
+    # and fields without zero padding, e.g. '2017-5-30 1:00:00'. Fractions of seconds are dropped.
+    match = _DATETIME_PATTERN.match(str(time).strip())
+    if match is None:
+        raise InvalidDataAdapterError("Unable to parse datetime: %s" % time)
+    time = match.group(1) + ' ' + (match.group(2) or '')
+    for datetime_format in (COMMON_DATETIME_FORMAT, '%Y-%m-%d %H:%M', '%Y-%m-%d '):
+        try:
+            return datetime.strptime(time, datetime_format)
+        except ValueError:
+            pass
+    raise InvalidDataAdapterError("Unable to parse datetime: %s" % time)
+
+
+def format_times(timeseries):
+    """
+    Format the times of a timeseries as strings, in the way TimeseriesGroupOperation presets return the bucket times.
+    :param list timeseries: [[datetime, value], [datetime, value], ...]
+    :return: [['%Y-%m-%d %H:%M:%S', value], ['%Y-%m-%d %H:%M:%S', value], ...]
+    """
+    return [[time.strftime(COMMON_DATETIME_FORMAT), value] for time, value in timeseries]
+
+
+# Meta data fields which are used to generate the event id
+META_DATA_HASH_KEYS = ['name', 'source', 'station', 'type', 'unit', 'variable']
+
+
+def get_event_hash(meta_data):
+    """
+    Generate the event id for given meta data.
+    NOTE: Only 'station', 'variable', 'unit', 'type', 'source', 'name' fields use for generate hash value
+    :param dict meta_data: Dict of Meta Data
+    :return: sha256 hash value in hex format (length of 64 characters)
+    """
+    hash_data = {}
+    for key in META_DATA_HASH_KEYS:
+        hash_data[key] = meta_data[key]
+
+    m = hashlib.sha256()
+    m.update(json.dumps(hash_data, sort_keys=True).encode("ascii"))
+    return m.hexdigest()
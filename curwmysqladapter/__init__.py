@@ -1,3 +1,5 @@
 from .mysqladapter import MySQLAdapter
 from .station import Station
-from .data import Data, TimeseriesGroupOperation
+from .data import Data, TimeseriesGroupOperation, GroupOperation, Aggregate, InsertMethod, UPSERT_CHANGES
+from .writebehind import WriteBehindWriter
+from .asyncadapter import AsyncMySQLAdapter
@@ -0,0 +1,429 @@
+import asyncio
+import logging
+import traceback
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+from .station import Station
+from .data import Data, TimeseriesGroupOperation, to_group_operation
+from .Constants import COMMON_DATETIME_FORMAT
+from .Utils import validate_common_datetime, format_times, get_event_hash
+from .SQLQueries import grouped_timeseries_queries, update_runs_dates, update_rollups_queries, \
+    retrieve_timeseries_queries, select_station_query, select_stations_in_area_query, select_source_query, \
+    MYSQL_SELECT_RUN_EXISTS, MYSQL_INSERT_RUN, MYSQL_DELETE_RUN, STATION_KEYS, SOURCE_KEYS, \
+    MYSQL_SELECT_STATION_MAX_ID, MYSQL_INSERT_STATION, MYSQL_DELETE_STATION, MYSQL_DELETE_STATION_BY_STATION_ID, \
+    MYSQL_SELECT_SOURCE_MAX_ID, MYSQL_INSERT_SOURCE, MYSQL_DELETE_SOURCE
+from .AdapterError import InvalidDataAdapterError, DatabaseConstrainAdapterError, DatabaseAdapterError
+from .bulkinsert import DEFAULT_MAX_PACKET_SIZE, DEFAULT_CHUNK_SIZE, prepare_rows, chunks, time_bounds, \
+    values_statements
+from .columnar import to_columns, split_timeseries, validate_output, OUTPUT_LIST, OUTPUT_COLUMNAR
+from .dimensions import DimensionCache, DIMENSIONS, DEFAULT_TTL, MYSQL_SELECT_DIMENSIONS
+from .queryplanner import EventQueryPlanner, META_STRUCT, timeseries_events, set_timeseries
+from .pool import DEFAULT_MIN_SIZE, DEFAULT_MAX_SIZE
+from .rollup import plan_rollup
+
+
+class AsyncMySQLAdapter:
+    """
+    asyncio version of MySQLAdapter over an aiomysql connection pool. Requires aiomysql, which can be installed
+    with `pip install curwmysqladapter[async]`. Queries are built with the same SQLQueries and event ids are
+    hashed with the same Utils.get_event_hash as the MySQLAdapter, thus both can be used on the same database.
+
+        adapter = await AsyncMySQLAdapter.create(host='localhost', user='root', password='', db='curw')
+        event_id = await adapter.get_event_id(meta_data)
+        await adapter.close()
+    """
+
+    def __init__(self, host="localhost", user="root", password="", db="curw",
+                 max_packet_size=DEFAULT_MAX_PACKET_SIZE, dimension_cache_ttl=DEFAULT_TTL,
+                 pool_min_size=DEFAULT_MIN_SIZE, pool_max_size=DEFAULT_MAX_SIZE, rollups=False):
+        """Prepare the adapter. Open the connection pool with connect(), or create with AsyncMySQLAdapter.create().
+        Refer to MySQLAdapter for the parameters.
+        """
+        if aiomysql is None:
+            raise DatabaseAdapterError("aiomysql is required for AsyncMySQLAdapter. "
+                                       "Install with `pip install curwmysqladapter[async]`")
+        self.connection_params = {
+            'host': host,
+            'user': user,
+            'password': password,
+            'db': db,
+        }
+        self.max_packet_size = max_packet_size
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size
+        self.pool = None
+        self.rollups = rollups
+        self.meta_struct = dict(META_STRUCT)
+        self.dimensions = DimensionCache(ttl=dimension_cache_ttl)
+        self.planner = EventQueryPlanner(self.dimensions)
+
+    @classmethod
+    async def create(cls, **kwargs):
+        """Create an adapter and open its connection pool"""
+        adapter = cls(**kwargs)
+        await adapter.connect()
+        return adapter
+
+    async def connect(self):
+        self.pool = await aiomysql.create_pool(minsize=self.pool_min_size, maxsize=self.pool_max_size,
+                                               autocommit=False, **self.connection_params)
+        async with self._connection() as connection, connection.cursor() as cursor:
+            await cursor.execute("SELECT VERSION()")
+            data = await cursor.fetchone()
+        logging.info("Database version : %s " % data)
+
+    async def close(self):
+        # disconnect from server
+        self.pool.close()
+        await self.pool.wait_closed()
+
+    @asynccontextmanager
+    async def _connection(self):
+        """Check out a connection from the pool. Uncommitted changes are rolled back before returning it."""
+        async with self.pool.acquire() as connection:
+            try:
+                yield connection
+            finally:
+                if connection.get_transaction_status():
+                    await connection.rollback()
+
+    async def _refresh_dimensions(self, cursor, lookups=None):
+        """Reload the dimension cache if it's expired or any of the (dimension, name) lookups are missing"""
+        if self.dimensions.needs_refresh(lookups):
+            await cursor.execute(MYSQL_SELECT_DIMENSIONS)
+            self.dimensions.load(await cursor.fetchall(), lookups)
+
+    async def get_event_id(self, meta_data):
+        """Get the event id for given meta data. Refer to MySQLAdapter.get_event_id"""
+        event_id = None
+        possible_id = get_event_hash(meta_data)
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                await cursor.execute(MYSQL_SELECT_RUN_EXISTS, possible_id)
+                if await cursor.fetchone() is not None:
+                    event_id = possible_id
+        except Exception as e:
+            traceback.print_exc()
+        return event_id
+
+    async def create_event_id(self, meta_data):
+        """Create a new event id for given meta data. Refer to MySQLAdapter.create_event_id"""
+        event_id = get_event_hash(meta_data)
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                await self._refresh_dimensions(cursor, [(key, meta_data[key]) for key in DIMENSIONS])
+                await cursor.execute(MYSQL_INSERT_RUN, self.planner.run_values(None, event_id, meta_data))
+                await connection.commit()
+
+        except DatabaseConstrainAdapterError as ae:
+            logging.warning(ae.message)
+            raise ae
+        except Exception as e:
+            traceback.print_exc()
+            raise e
+
+        return event_id
+
+    async def insert_timeseries(self, event_id, timeseries, upsert=False, mode=Data.data,
+                                chunk_size=DEFAULT_CHUNK_SIZE):
+        """Insert timeseries into the db against given event_id with multi-row INSERT statements.
+        Refer to MySQLAdapter.insert_timeseries
+
+        :return int: Affected row count.
+        """
+        if not isinstance(mode, Data):
+            raise InvalidDataAdapterError("Provided Data type %s is invalid" % mode)
+
+        row_count = 0
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                for chunk in chunks(prepare_rows(timeseries), chunk_size):
+                    for sql in values_statements(connection.escape, mode.value, [(event_id, chunk)], upsert,
+                                                 self.max_packet_size):
+                        row_count += await cursor.execute(sql)
+                    run_dates = {event_id: time_bounds(chunk)}
+                    sql, sql_values = update_runs_dates(run_dates)
+                    await cursor.execute(sql, sql_values)
+                    if self.rollups:
+                        await self._update_rollups(cursor, mode, run_dates)
+                    await connection.commit()
+        except Exception as e:
+            traceback.print_exc()
+        return row_count
+
+    async def _update_rollups(self, cursor, mode, run_dates):
+        """Recompute the rollup buckets which contain given time ranges. Refer to MySQLAdapter._update_rollups"""
+        for sql, sql_values in update_rollups_queries(mode.value, run_dates):
+            await cursor.execute(sql, sql_values)
+
+    async def delete_timeseries(self, event_id):
+        """Delete given timeseries from the database. Refer to MySQLAdapter.delete_timeseries"""
+        row_count = 0
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                row_count = await cursor.execute(MYSQL_DELETE_RUN, event_id)
+                await connection.commit()
+        except Exception as e:
+            traceback.print_exc()
+        return row_count
+
+    async def get_event_ids(self, meta_query=None, opts=None):
+        """Get event ids set according to given meta data. Refer to MySQLAdapter.get_event_ids"""
+        if opts is None:
+            opts = {}
+        if meta_query is None:
+            meta_query = {}
+        lookups = []
+        for key, value in meta_query.items():
+            if key in DIMENSIONS:
+                lookups.extend((key, name) for name in (value if isinstance(value, (list, tuple)) else [value]))
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                await self._refresh_dimensions(cursor, lookups)
+                query = self.planner.plan(None, meta_query, opts)
+                if query is None:
+                    return []
+                await cursor.execute(query[0], query[1])
+                rows = await cursor.fetchall()
+                events = self.planner.to_events(None, rows, self.meta_struct)
+                if any(event[key] is None for event in events for key in DIMENSIONS):
+                    # Dimensions created after loading the snapshot
+                    self.dimensions.invalidate()
+                    await self._refresh_dimensions(cursor)
+                    events = self.planner.to_events(None, rows, self.meta_struct)
+                return events
+
+        except InvalidDataAdapterError:
+            raise
+        except Exception as e:
+            traceback.print_exc()
+
+    async def retrieve_timeseries(self, meta_query=None, opts=None):
+        """Get timeseries. Refer to MySQLAdapter.retrieve_timeseries for the meta query and options s.t.
+        from, to, mode and output.
+        """
+        if opts is None:
+            opts = {}
+        if meta_query is None:
+            meta_query = []
+
+        data_table = opts.get('mode', Data.data)
+        if isinstance(data_table, Data):
+            data_table = data_table.value
+        else:
+            raise InvalidDataAdapterError("Provided Data type %s is invalid" % data_table)
+        output = opts.get('output', OUTPUT_LIST)
+        validate_output(output)
+        columnar = output == OUTPUT_COLUMNAR
+
+        try:
+            if isinstance(meta_query, dict):
+                event_ids = await self.get_event_ids(meta_query)
+            else:
+                event_ids = list(meta_query)
+
+            response, events = timeseries_events(event_ids, columnar)
+            async with self._connection() as connection, connection.cursor() as cursor:
+                for sql, args in retrieve_timeseries_queries(data_table, list(events.keys()), opts.get('from'),
+                                                             opts.get('to'), columnar):
+                    await cursor.execute(sql, args)
+                    set_timeseries(events, split_timeseries(await cursor.fetchall(), columnar), columnar)
+
+            return response
+        except Exception as e:
+            traceback.print_exc()
+
+    async def extract_grouped_time_series(self, event_id, start_date, end_date, group_operation,
+                                          output=OUTPUT_LIST, mode=Data.data):
+        """Extract the grouped timeseries for the given event_id, or a list of event ids.
+        Refer to MySQLAdapter.extract_grouped_time_series.
+        """
+        event_ids = list(event_id) if isinstance(event_id, (list, tuple)) else [event_id]
+        timeseries_dict = await self.extract_grouped_time_series_bulk(event_ids, start_date, end_date,
+                                                                      group_operation, output, mode)
+        if isinstance(event_id, (list, tuple)):
+            return [timeseries_dict[item] for item in event_ids]
+        return timeseries_dict[event_id]
+
+    async def extract_grouped_time_series_bulk(self, event_ids, start_date, end_date, group_operation,
+                                               output=OUTPUT_LIST, mode=Data.data):
+        """Extract the grouped timeseries of several events with a query per MAX_EVENTS_PER_QUERY events.
+        Queries of the batches run concurrently, limited by the size of the connection pool. With `rollups`,
+        the buckets are read from the rollups where possible, in the same way as MySQLAdapter.
+        Refer to MySQLAdapter.extract_grouped_time_series_bulk.
+        """
+        validate_output(output)
+        preset = isinstance(group_operation, TimeseriesGroupOperation)
+        group_operation = to_group_operation(group_operation)
+        if not isinstance(mode, Data):
+            raise InvalidDataAdapterError("Provided Data type %s is invalid" % mode)
+        if not validate_common_datetime(start_date) or not validate_common_datetime(end_date):
+            raise InvalidDataAdapterError("Provided start_date: %s or end_date: %s is no in the '%s' format"
+                                          % (start_date, end_date, COMMON_DATETIME_FORMAT))
+        columnar = output == OUTPUT_COLUMNAR
+        rollup = plan_rollup(group_operation, start_date, end_date) if self.rollups else None
+
+        event_id_list = list(OrderedDict.fromkeys(event_ids))
+        response = OrderedDict((event_id, to_columns([]) if columnar else []) for event_id in event_id_list)
+        for timeseries_dict in await asyncio.gather(*[
+                self._select_grouped_timeseries(sql_query, args, columnar)
+                for sql_query, args in grouped_timeseries_queries(mode.value, group_operation, event_id_list,
+                                                                  start_date, end_date, columnar, rollup)]):
+            response.update(timeseries_dict)
+        if preset and not columnar:
+            response = OrderedDict((event_id, format_times(timeseries)) for event_id, timeseries in response.items())
+        return response
+
+    async def _select_grouped_timeseries(self, sql_query, args, columnar):
+        """Execute a query of SQLQueries.grouped_timeseries_queries with its own connection of the pool"""
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                await cursor.execute(sql_query, args)
+                rows = await cursor.fetchall()
+        except Exception as ex:
+            raise DatabaseAdapterError("An error occurred while executing sql query: %s, Exception Message: %s"
+                                       % (sql_query, ex))
+        return split_timeseries(rows, columnar)
+
+    async def create_station(self, station=None):
+        """Insert stations into the database. Refer to MySQLAdapter.create_station"""
+        if station is None:
+            station = []
+        row_count = 0
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                if isinstance(station, (list, tuple)) and isinstance(station[0], Station):
+                    station = list(station)
+                    await cursor.execute(MYSQL_SELECT_STATION_MAX_ID,
+                                         (station[0].value, station[0].value + Station.getRange(station[0])))
+                    last_id = await cursor.fetchone()
+                    if last_id[0] is not None:
+                        station[0] = last_id[0] + 1
+                    else:
+                        station[0] = station[0].value
+
+                row_count = await cursor.execute(MYSQL_INSERT_STATION, station)
+                await connection.commit()
+                self.dimensions.invalidate()
+
+        except Exception as e:
+            traceback.print_exc()
+        return row_count
+
+    async def get_station(self, query={}):
+        """Get matching station details for given query. Refer to MySQLAdapter.get_station"""
+        response = None
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                sql, sql_values = select_station_query(query, STATION_KEYS)
+                await cursor.execute(sql, sql_values)
+                station = await cursor.fetchone()
+                if station is not None:
+                    response = dict(zip(STATION_KEYS, station))
+        except Exception as e:
+            traceback.print_exc()
+        return response
+
+    async def delete_station(self, id=0, station_id=''):
+        """Delete given station from the database. Refer to MySQLAdapter.delete_station"""
+        row_count = 0
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                if id > 0:
+                    row_count = await cursor.execute(MYSQL_DELETE_STATION, id)
+                elif station_id:
+                    row_count = await cursor.execute(MYSQL_DELETE_STATION_BY_STATION_ID, station_id)
+                else:
+                    logging.warning('Unable to find station')
+                    return row_count
+                await connection.commit()
+                self.dimensions.invalidate()
+        except Exception as e:
+            traceback.print_exc()
+        return row_count
+
+    async def get_stations(self, query={}):
+        return []
+
+    async def get_stations_in_area(self, query={}):
+        """Get stations inside given area. Refer to MySQLAdapter.get_stations_in_area"""
+        try:
+            sorted_keys = sorted(STATION_KEYS)
+            async with self._connection() as connection, connection.cursor() as cursor:
+                sql, sql_values = select_stations_in_area_query(query, sorted_keys)
+                await cursor.execute(sql, sql_values)
+                return [dict(zip(sorted_keys, station)) for station in await cursor.fetchall()]
+        except Exception as e:
+            traceback.print_exc()
+
+    async def create_source(self, source=None):
+        """Create Source with given details. Refer to MySQLAdapter.create_source"""
+        if source is None:
+            source = []
+        if isinstance(source, str):
+            source = [source]
+
+        row_count = 0
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                if len(source) < 3:
+                    await cursor.execute(MYSQL_SELECT_SOURCE_MAX_ID)
+                    last_id = await cursor.fetchone()
+                    source = list(source)
+                    if last_id[0] is not None:
+                        source.insert(0, last_id[0] + 1)
+                    else:
+                        source.insert(0, 0)
+                    # If parameters are still missing, append
+                    if len(source) < 3:
+                        source.append(None)
+                    source = tuple(source)
+
+                row_count = await cursor.execute(MYSQL_INSERT_SOURCE, source)
+                await connection.commit()
+                self.dimensions.invalidate()
+        except Exception as e:
+            logging.warning(e)
+        return {
+            'status': row_count > 0,
+            'row_count': row_count,
+            'source': source
+        }
+
+    async def get_source(self, source_id=0, name=''):
+        """Get existing source. Refer to MySQLAdapter.get_source"""
+        response = {}
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                sql, sql_values = select_source_query(source_id, name, SOURCE_KEYS)
+                await cursor.execute(sql, sql_values)
+                source = await cursor.fetchone()
+                if source is not None:
+                    response = dict(zip(SOURCE_KEYS, source))
+        except Exception as e:
+            logging.warning(e)
+        return response
+
+    async def delete_source(self, id=0):
+        """Delete given source from the database. Refer to MySQLAdapter.delete_source"""
+        row_count = 0
+        try:
+            async with self._connection() as connection, connection.cursor() as cursor:
+                if id > 0:
+                    row_count = await cursor.execute(MYSQL_DELETE_SOURCE, id)
+                    await connection.commit()
+                    self.dimensions.invalidate()
+                else:
+                    logging.warning('Unable to find source')
+        except Exception as e:
+            logging.warning(e)
+        return {
+            'status': row_count > 0,
+            'row_count': row_count
+        }
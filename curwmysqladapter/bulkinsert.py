@@ -0,0 +1,173 @@
+import logging
+import math
+import os
+import tempfile
+from itertools import islice
+
+from .Constants import COMMON_DATETIME_FORMAT
+from .Utils import to_datetime
+
+# MySQL 5.5/5.6 servers ship with `max_allowed_packet` of 1MB/4MB. Stay below the smaller one by default.
+DEFAULT_MAX_PACKET_SIZE = 1000000
+# Number of rows to insert and commit at once, when streaming timeseries from an iterable.
+DEFAULT_CHUNK_SIZE = 10000
+
+_SQL_INSERT_VALUES = "INSERT INTO `%s` (`id`, `time`, `value`) VALUES "
+_SQL_UPSERT_VALUES = " ON DUPLICATE KEY UPDATE `value`=VALUES(`value`)"
+_SQL_LOAD_DATA = \
+    "LOAD DATA LOCAL INFILE %%s %s INTO TABLE `%s` " \
+    "FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' (`id`, `time`, `value`)"
+
+
+def prepare_rows(timeseries):
+    """
+    Validate and format timeseries rows for inserting.
+    :param timeseries: iterable of [time, value] items
+    :return: generator of (time, value) tuples, with value rounded into 3 decimal places
+    """
+    for t in timeseries:
+        if len(t) > 1:
+            value = round(float(t[1]), 3)
+            if math.isinf(value) or math.isnan(value):
+                logging.warning('Invalid timeseries value:: %s', t)
+                continue
+            yield t[0], value
+        else:
+            logging.warning('Invalid timeseries data:: %s', t)
+
+
+def chunks(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Split an iterable into lists of chunk_size items, without consuming more than one chunk at a time.
+    :param rows: any iterable or generator
+    :param chunk_size: maximum number of items in a chunk
+    :return: generator of lists
+    """
+    iterator = iter(rows)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+def time_bounds(rows):
+    """
+    Get the earliest and the latest time of given rows, in the same form as they were provided.
+    :param rows: non-empty list of (time, value) tuples, where time is a datetime or a datetime string
+    :return: tuple of (min_time, max_time)
+    """
+    return min(rows, key=lambda r: to_datetime(r[0]))[0], max(rows, key=lambda r: to_datetime(r[0]))[0]
+
+
+def literal_statements(table, literals, upsert=False, max_packet_size=DEFAULT_MAX_PACKET_SIZE):
+    """
+    Pack already escaped row literals s.t. "('<id>','2017-05-01 00:00:00',1.080)" into multi-row
+    `INSERT ... VALUES (...),(...)` statements. Each statement is kept below max_packet_size bytes.
+    :param table: name of the data table, e.g. 'data' or 'processed_data'
+    :param literals: iterable of row literals
+    :param upsert: If True, update existing values ON DUPLICATE KEY
+    :param max_packet_size: maximum length of a single statement in bytes
+    :return: generator of statements
+    """
+    head = _SQL_INSERT_VALUES % table
+    tail = _SQL_UPSERT_VALUES if upsert else ''
+    budget = max_packet_size - len(head) - len(tail)
+
+    values = []
+    size = 0
+    for literal in literals:
+        if values and size + len(literal) + 1 > budget:
+            yield head + ','.join(values) + tail
+            values = []
+            size = 0
+        values.append(literal)
+        size += len(literal) + 1
+    if values:
+        yield head + ','.join(values) + tail
+
+
+def values_statements(escape, table, events, upsert=False, max_packet_size=DEFAULT_MAX_PACKET_SIZE):
+    """
+    Pack rows of one or more events into multi-row `INSERT ... VALUES (...),(...)` statements.
+    Rows of different events are merged into the same statements.
+    :param escape: escape function of the connection
+    :param table: name of the data table, e.g. 'data' or 'processed_data'
+    :param events: iterable of (event_id, rows) where rows is an iterable of (time, value) tuples
+    as returned by prepare_rows
+    :param upsert: If True, update existing values ON DUPLICATE KEY
+    :param max_packet_size: maximum length of a single statement in bytes
+    :return: generator of statements
+    """
+    def literals():
+        for event_id, rows in events:
+            row_prefix = "(%s," % escape(event_id)
+            for time, value in rows:
+                yield "%s%s,%.3f)" % (row_prefix, escape(time), value)
+
+    return literal_statements(table, literals(), upsert, max_packet_size)
+
+
+def insert_literals(cursor, table, literals, upsert=False, max_packet_size=DEFAULT_MAX_PACKET_SIZE):
+    """
+    Insert already escaped row literals with multi-row statements. Refer to literal_statements.
+    :param cursor: pymysql cursor
+    :return: affected row count
+    """
+    row_count = 0
+    for sql in literal_statements(table, literals, upsert, max_packet_size):
+        row_count += cursor.execute(sql)
+    return row_count
+
+
+def insert_values(cursor, table, events, upsert=False, max_packet_size=DEFAULT_MAX_PACKET_SIZE):
+    """
+    Insert rows of one or more events with multi-row statements. Refer to values_statements.
+    :param cursor: pymysql cursor
+    :return: affected row count
+    """
+    row_count = 0
+    for sql in values_statements(cursor.connection.escape, table, events, upsert, max_packet_size):
+        row_count += cursor.execute(sql)
+    return row_count
+
+
+def load_data_lines(cursor, table, lines, upsert=False):
+    """
+    Stream tab separated lines s.t. "<id>\t2017-05-01 00:00:00\t1.080\n" into the table with
+    `LOAD DATA LOCAL INFILE`. Lines are written into a temporary file first, and the client sends it
+    to the server in chunks. The connection should be opened with `local_infile=True`.
+    NOTE: If upsert is False, duplicate rows are ignored (instead of failing the whole batch).
+    :param cursor: pymysql cursor
+    :param table: name of the data table, e.g. 'data' or 'processed_data'
+    :param lines: iterable of lines
+    :param upsert: If True, REPLACE existing values
+    :return: affected row count
+    """
+    tmp = tempfile.NamedTemporaryFile(mode='w', suffix='.tsv', delete=False)
+    try:
+        with tmp:
+            tmp.writelines(lines)
+        sql = _SQL_LOAD_DATA % ('REPLACE' if upsert else 'IGNORE', table)
+        return cursor.execute(sql, tmp.name)
+    finally:
+        os.remove(tmp.name)
+
+
+def load_data_infile(cursor, table, events, upsert=False):
+    """
+    Stream rows of one or more events into the table with `LOAD DATA LOCAL INFILE`.
+    :param cursor: pymysql cursor
+    :param table: name of the data table, e.g. 'data' or 'processed_data'
+    :param events: iterable of (event_id, rows) where rows is an iterable of (time, value) tuples
+    as returned by prepare_rows
+    :param upsert: If True, REPLACE existing values
+    :return: affected row count
+    """
+    def lines():
+        for event_id, rows in events:
+            for time, value in rows:
+                if not isinstance(time, str):
+                    time = time.strftime(COMMON_DATETIME_FORMAT)
+                yield "%s\t%s\t%.3f\n" % (event_id, time, value)
+
+    return load_data_lines(cursor, table, lines(), upsert)
@@ -0,0 +1,115 @@
+import logging
+from array import array
+from itertools import groupby
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .AdapterError import InvalidDataAdapterError
+
+# Output formats of timeseries reads
+OUTPUT_LIST = 'list'
+OUTPUT_COLUMNAR = 'columnar'
+OUTPUTS = (OUTPUT_LIST, OUTPUT_COLUMNAR)
+
+# Largest absolute value which fits into `value` DECIMAL(8,3) column
+DECIMAL_LIMIT = 99999.999
+
+
+def require_numpy():
+    if np is None:
+        raise InvalidDataAdapterError("numpy is required for columnar timeseries. Install with `pip install numpy`")
+
+
+def format_columns(times, values):
+    """
+    Vectorized validation and formatting of timeseries columns for inserting.
+    Values which are not finite or out of DECIMAL(8,3) range are skipped.
+    :param times: numpy datetime64 array, or a sequence of datetime objects or ISO 8601 datetime strings
+    :param values: numpy array or a sequence of numbers
+    :return: tuple of (times, values) numpy arrays of datetime64[s] and float64, rounded into 3 decimal places
+    """
+    require_numpy()
+    try:
+        times = np.asarray(times, dtype='datetime64[s]')
+        values = np.round(np.asarray(values, dtype=np.float64), 3)
+    except (TypeError, ValueError) as e:
+        raise InvalidDataAdapterError("Invalid timeseries columns: %s" % e)
+    if times.shape != values.shape or times.ndim != 1:
+        raise InvalidDataAdapterError("times %s and values %s should be 1-D arrays of the same length"
+                                      % (times.shape, values.shape))
+
+    valid = ~np.isnat(times) & np.isfinite(values) & (np.abs(values) <= DECIMAL_LIMIT)
+    if not valid.all():
+        logging.warning('Skipping %s invalid timeseries values', np.count_nonzero(~valid))
+        times = times[valid]
+        values = values[valid]
+    return times, values
+
+
+def row_literals(escaped_event_id, times, values):
+    """
+    Build SQL row literals s.t. "('<id>','2017-05-01T00:00:00',1.080)" for columns formatted with format_columns.
+    :param escaped_event_id: event_id escaped with connection.escape
+    :param times: numpy datetime64 array
+    :param values: numpy float array
+    :return: numpy string array of row literals
+    """
+    literals = np.char.add("(%s,'" % escaped_event_id, np.datetime_as_string(times, unit='s'))
+    literals = np.char.add(literals, "',")
+    literals = np.char.add(literals, np.char.mod('%.3f', values))
+    return np.char.add(literals, ')')
+
+
+def tsv_lines(event_id, times, values):
+    """
+    Build tab separated lines for `LOAD DATA LOCAL INFILE` for columns formatted with format_columns.
+    :return: numpy string array of lines s.t. "<id>\t2017-05-01T00:00:00\t1.080\n"
+    """
+    lines = np.char.add("%s\t" % event_id, np.datetime_as_string(times, unit='s'))
+    lines = np.char.add(lines, '\t')
+    lines = np.char.add(lines, np.char.mod('%.3f', values))
+    return np.char.add(lines, '\n')
+
+
+def validate_output(output):
+    if output not in OUTPUTS:
+        raise InvalidDataAdapterError("Invalid output %s. Should be one of %s" % (output, OUTPUTS))
+
+
+def to_columns(rows):
+    """
+    Build typed columns from rows of columnar queries, which select times as epoch seconds (BIGINT)
+    and values as DOUBLE, thus PyMySQL returns plain ints and floats instead of datetime and Decimal objects.
+    :param rows: iterable of (epoch seconds, value) tuples
+    :return: tuple of (times, values). With numpy, datetime64[s] and float64 numpy arrays.
+    Otherwise array.array('q') of epoch seconds and array.array('d') of values.
+    """
+    if np is not None:
+        columns = np.fromiter(rows, dtype=[('time', np.int64), ('value', np.float64)])
+        return columns['time'].astype('datetime64[s]'), columns['value'].copy()
+    times = array('q')
+    values = array('d')
+    for time, value in rows:
+        times.append(time)
+        values.append(value)
+    return times, values
+
+
+def split_timeseries(rows, columnar=False):
+    """
+    Split (id, time, value) rows which are ordered by id into the timeseries of each id.
+    :param rows: iterable of rows, s.t. a cursor
+    :param boolean columnar: If True, rows are of columnar queries, and timeseries are built with to_columns
+    :return dict: Dict of timeseries against the id, s.t. {'eventId1': [[datetime, value], ...]}.
+    Ids without any rows are omitted.
+    """
+    timeseries_dict = {}
+    for row_id, id_rows in groupby(rows, key=lambda row: row[0]):
+        if columnar:
+            timeseries_dict[row_id] = to_columns((time, value) for _, time, value in id_rows)
+        else:
+            timeseries_dict[row_id] = [[time, value] for _, time, value in id_rows]
+    return timeseries_dict
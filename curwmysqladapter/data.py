@@ -1,5 +1,8 @@
+from datetime import timedelta
 from enum import Enum
 
+from .AdapterError import InvalidDataAdapterError
+
 
 class Data(Enum):
     """
@@ -13,9 +16,61 @@ class Data(Enum):
     processed_data = 'processed_data'
 
 
+class Aggregate(Enum):
+    """
+    Enum types for aggregating the values of a time bucket
+
+    Aggregate Enum:
+    - sum, max, min, avg, count : Same as the SQL aggregate functions
+    - first : Value with the earliest time of the bucket
+    - last : Value with the latest time of the bucket
+    """
+    sum = 'SUM'
+    max = 'MAX'
+    min = 'MIN'
+    avg = 'AVG'
+    count = 'COUNT'
+    first = 'FIRST'
+    last = 'LAST'
+
+
+class GroupOperation:
+    """
+    Aggregate the values of a timeseries into fixed time buckets s.t. GroupOperation(timedelta(hours=3), Aggregate.sum)
+    Bucket boundaries are aligned to `1970-01-01 00:00:00 + offset + k * interval`, thus hourly buckets start at
+    the top of each hour and daily buckets at midnight. Each bucket is labeled with its start time.
+    """
+
+    def __init__(self, interval, aggregate, offset=0):
+        """
+        :param interval: Size of a bucket as a timedelta or in seconds
+        :param Aggregate aggregate: Aggregation of the values of a bucket
+        :param offset: Shift of the bucket boundaries as a timedelta or in seconds.
+        s.t. daily buckets of local (+05:30) days over times stored in UTC, offset=timedelta(hours=-5, minutes=-30)
+        """
+        self.interval = int(interval.total_seconds()) if isinstance(interval, timedelta) else int(interval)
+        self.offset = int(offset.total_seconds()) if isinstance(offset, timedelta) else int(offset)
+        self.aggregate = aggregate
+        if self.interval <= 0:
+            raise InvalidDataAdapterError("Invalid group interval: %s" % interval)
+        if not isinstance(aggregate, Aggregate):
+            raise InvalidDataAdapterError("Provided aggregate: %s is of not valid type" % aggregate)
+
+    def __eq__(self, other):
+        return isinstance(other, GroupOperation) and \
+            (self.interval, self.aggregate, self.offset) == (other.interval, other.aggregate, other.offset)
+
+    def __hash__(self):
+        return hash((self.interval, self.aggregate, self.offset))
+
+    def __repr__(self):
+        return 'GroupOperation(%s, %s, offset=%s)' % (self.interval, self.aggregate, self.offset)
+
+
 class TimeseriesGroupOperation(Enum):
     """
     Enum type for Timeseries Group Operations.
+    Presets of GroupOperation. Refer to `group_operation`.
     """
     mysql_1min_sum = '1min_sum'
     mysql_1min_max = '1min_max'
@@ -23,3 +78,37 @@ class TimeseriesGroupOperation(Enum):
     mysql_5min_sum = '5min_sum'
     mysql_5min_max = '5min_max'
     mysql_5min_avg = '5min_avg'
+
+    @property
+    def group_operation(self):
+        """Equivalent GroupOperation of the preset"""
+        minutes, aggregate = self.value.split('min_')
+        return GroupOperation(int(minutes) * 60, Aggregate(aggregate.upper()))
+
+
+def to_group_operation(group_operation):
+    """
+    :param group_operation: GroupOperation or a TimeseriesGroupOperation preset
+    :return GroupOperation:
+    """
+    if isinstance(group_operation, TimeseriesGroupOperation):
+        return group_operation.group_operation
+    if isinstance(group_operation, GroupOperation):
+        return group_operation
+    raise InvalidDataAdapterError("Provided group_operation: %s is of not valid type" % group_operation)
+
+
+class InsertMethod(Enum):
+    """
+    Enum types for bulk insert methods
+
+    Insert Method Enum:
+    - values : Insert with chunked multi-row `INSERT ... VALUES (...),(...)` statements
+    - load_data : Stream with `LOAD DATA LOCAL INFILE`. Suitable for very large timeseries.
+    """
+    values = 'values'
+    load_data = 'load_data'
+
+
+# Value of the `upsert` argument of MySQLAdapter.insert_timeseries, which upserts only the new or changed points
+UPSERT_CHANGES = 'changes'
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+
+# Dimension tables of the `run` table, and the column which holds the name of each row
+DIMENSIONS = {
+    'station': 'name',
+    'variable': 'variable',
+    'unit': 'unit',
+    'type': 'type',
+    'source': 'source',
+}
+DEFAULT_TTL = 300
+
+MYSQL_SELECT_DIMENSIONS = " UNION ALL ".join(
+    "SELECT '%s' as `dimension`, `id`, `%s` as `name` FROM `%s`" % (dimension, column, dimension)
+    for dimension, column in sorted(DIMENSIONS.items()))
+
+
+class DimensionCache:
+    """
+    In-process snapshot of the dimension tables (station, variable, unit, type and source) of `run` as
+    name to id mappings. The whole snapshot is reloaded with a single query after the TTL expires,
+    after invalidate() is called, or when a name is not found in the snapshot. Names which are still not found
+    after reloading are remembered as missing until the snapshot is reloaded again, thus looking up unknown names
+    repeatedly does not reload the snapshot on every lookup.
+    Names are matched case insensitively, same as the default collation of the database.
+    Lookups with cursor=None never reload the snapshot. Those are used by the AsyncMySQLAdapter, which reloads
+    the snapshot beforehand with needs_refresh() and load().
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        """
+        :param int ttl: Time to live of the snapshot in seconds. If 0, the snapshot is reloaded on every lookup.
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._names = {}
+        # (dimension, name) which were not found in the current snapshot, even after reloading it
+        self._missing = set()
+        self._loaded_at = None
+
+    def invalidate(self):
+        """Drop the snapshot. It'll be reloaded on the next lookup."""
+        with self._lock:
+            self._loaded_at = None
+
+    def _is_expired(self):
+        return self._loaded_at is None or time.time() - self._loaded_at >= self.ttl
+
+    def needs_refresh(self, lookups=None):
+        """
+        :param lookups: iterable of (dimension, name) which are going to be looked up
+        :return boolean: True if the snapshot is expired or any of the names are missing, and not known to be missing
+        """
+        if self._is_expired():
+            return True
+        return any(str(name).lower() not in self._ids.get(dimension, {}) and
+                   (dimension, str(name).lower()) not in self._missing for dimension, name in lookups or [])
+
+    def refresh(self, cursor, lookups=None):
+        """Reload the snapshot with given pymysql cursor. Refer to load for lookups."""
+        cursor.execute(MYSQL_SELECT_DIMENSIONS)
+        self.load(cursor.fetchall(), lookups)
+
+    def load(self, rows, lookups=None):
+        """
+        Replace the snapshot with the (dimension, id, name) rows of MYSQL_SELECT_DIMENSIONS
+        :param lookups: iterable of (dimension, name) which caused the reload. Those not in the new snapshot are
+        remembered as missing.
+        """
+        ids = dict((dimension, {}) for dimension in DIMENSIONS)
+        names = dict((dimension, {}) for dimension in DIMENSIONS)
+        for dimension, dimension_id, name in rows:
+            ids[dimension][name.lower()] = dimension_id
+            names[dimension][dimension_id] = name
+        missing = set((dimension, str(name).lower()) for dimension, name in lookups or [])
+        missing = set((dimension, key) for dimension, key in missing if key not in ids.get(dimension, {}))
+        with self._lock:
+            self._ids, self._names, self._missing = ids, names, missing
+            self._loaded_at = time.time()
+        logging.debug('Loaded dimensions: %s', dict((d, len(v)) for d, v in ids.items()))
+
+    def get_id(self, cursor, dimension, name):
+        """
+        Get the id of given dimension name.
+        :param cursor: pymysql cursor, which is used if the snapshot needs to be reloaded
+        :param string dimension: One of 'station', 'variable', 'unit', 'type', 'source'
+        :param string name: Name of the dimension s.t. 'Hanwella' for station
+        :return int: id of the dimension. If not found, return None.
+        """
+        return self.get_ids(cursor, dimension, [name])[0]
+
+    def get_ids(self, cursor, dimension, names):
+        """
+        Get the ids of given dimension names, in the same order. Missing names are None.
+        """
+        # Without a cursor, the snapshot can't be reloaded
+        refreshed = cursor is None
+        keys = [str(name).lower() for name in names]
+        if self._is_expired() and not refreshed:
+            self.refresh(cursor, [(dimension, key) for key in keys])
+            refreshed = True
+        ids = [self._ids.get(dimension, {}).get(key) for key in keys]
+        if not refreshed and any(i is None and (dimension, key) not in self._missing for i, key in zip(ids, keys)):
+            # Might be created after loading the snapshot
+            self.refresh(cursor, [(dimension, key) for i, key in zip(ids, keys) if i is None])
+            ids = [self._ids.get(dimension, {}).get(key) for key in keys]
+        return ids
+
+    def get_name(self, cursor, dimension, dimension_id):
+        """
+        Get the name of given dimension id. If not found, return None.
+        """
+        if cursor is not None and (self._is_expired() or dimension_id not in self._names.get(dimension, {})):
+            self.refresh(cursor)
+        return self._names.get(dimension, {}).get(dimension_id)
@@ -0,0 +1,191 @@
+"""
+Bulk load directories of timeseries CSV files into the database.
+
+    $ curw-load-timeseries <DIRECTORY> --mapping MAPPING.json [--config CONFIG.json] [--workers 4]
+
+CSV files should be named as <STATION>-<YYYY>-<MM>-<DD>.csv, and placed in sub directories of the DIRECTORY.
+The MAPPING file maps each sub directory to the meta data of its timeseries s.t.
+{
+    "Rainfall": {
+        "delimiter": " ",
+        "meta_data": {
+            "variable": "Precipitation",
+            "unit": "mm",
+            "source": "WRF",
+            "name": "Forecast Test"
+        },
+        "types": ["Forecast-0-d", "Forecast-1-d-after", "Forecast-2-d-after"],
+        "interval": 24
+    },
+    "Discharge": {
+        "delimiter": ",",
+        "meta_data": {
+            "variable": "Discharge",
+            "unit": "m3/s",
+            "type": "Forecast-0-d",
+            "source": "HEC-HMS",
+            "name": "Forecast Test"
+        }
+    }
+}
+If "types" is given, rows of each file are split into consecutive chunks of "interval" rows, and stored
+against each type in order. Otherwise the whole file is stored against the "type" of meta_data.
+The CONFIG file has the same format as tests/CONFIG.dist.json.
+
+Each worker process uses its own database connection, and each file is inserted in a single transaction.
+Loaded files are recorded in a state file (Default: <DIRECTORY>/.curw-load-state), thus restarting the loader
+with the same arguments resumes from the files which were not loaded.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+from glob import glob
+from multiprocessing import Pool, cpu_count
+from multiprocessing.util import Finalize
+
+from .mysqladapter import MySQLAdapter
+
+STATE_FILE = '.curw-load-state'
+
+_adapter = None
+
+
+def _init_worker(connection_params):
+    global _adapter
+    _adapter = MySQLAdapter(**connection_params)
+    # Worker processes exit without running atexit handlers, but run the finalizers of multiprocessing
+    Finalize(None, _adapter.close, exitpriority=10)
+
+
+def load_file(job):
+    """
+    Load a single CSV file with the adapter of the worker process.
+    :param tuple job: (relative path, absolute path, mapping of the sub directory, upsert)
+    :return: tuple of (relative path, number of rows, affected row count, seconds, error message or None)
+    """
+    rel_path, path, mapping, upsert = job
+    start = time.time()
+    try:
+        with open(path, 'r') as f:
+            timeseries = list(csv.reader(f, delimiter=mapping.get('delimiter', ','), skipinitialspace=True))
+
+        station = '-'.join(os.path.basename(path).split('.')[0].split('-')[:-3])
+        meta_data = dict(mapping['meta_data'])
+        meta_data['station'] = station
+
+        meta_data_list = []
+        chunks = []
+        if mapping.get('types'):
+            interval = mapping.get('interval', len(timeseries))
+            for i, timeseries_type in enumerate(mapping['types']):
+                chunk = timeseries[i * interval:(i + 1) * interval]
+                if chunk:
+                    meta_data_list.append(dict(meta_data, type=timeseries_type))
+                    chunks.append(chunk)
+        else:
+            meta_data_list.append(meta_data)
+            chunks.append(timeseries)
+        # Events and timeseries of the file are committed together, thus a failed file leaves no empty events
+        with _adapter.transaction():
+            timeseries_dict = dict(zip(_adapter.get_or_create_event_ids(meta_data_list), chunks))
+            row_count = _adapter.insert_timeseries_bulk(timeseries_dict, upsert, raise_errors=True)
+        return rel_path, len(timeseries), row_count, time.time() - start, None
+    except Exception as e:
+        traceback.print_exc()
+        return rel_path, 0, 0, time.time() - start, str(e)
+
+
+def find_jobs(directory, mapping, loaded, upsert):
+    jobs = []
+    for sub_dir in sorted(mapping.keys()):
+        for path in sorted(glob(os.path.join(directory, sub_dir, '*.csv'))):
+            rel_path = os.path.relpath(path, directory)
+            if rel_path not in loaded:
+                jobs.append((rel_path, path, mapping[sub_dir], upsert))
+    return jobs
+
+
+def read_state(state_file):
+    if not os.path.exists(state_file):
+        return set()
+    with open(state_file, 'r') as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def get_connection_params(args):
+    config = {}
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = json.loads(f.read())
+    return {
+        'host': config.get('MYSQL_HOST', 'localhost'),
+        'user': config.get('MYSQL_USER', 'root'),
+        'password': config.get('MYSQL_PASSWORD', ''),
+        'db': config.get('MYSQL_DB', 'curw'),
+        'rollups': config.get('MYSQL_ROLLUPS', False),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk load directories of timeseries CSV files',
+                                     epilog='Refer to the curwmysqladapter.loader module for the MAPPING format.')
+    parser.add_argument('directory', help='Root directory of the CSV files')
+    parser.add_argument('--mapping', required=True, help='JSON file which maps sub directories to meta data')
+    parser.add_argument('--config',
+                        help='JSON file with MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DB, MYSQL_ROLLUPS')
+    parser.add_argument('--workers', type=int, default=cpu_count(), help='Number of worker processes')
+    parser.add_argument('--state', help='State file to resume from. Default: <DIRECTORY>/%s' % STATE_FILE)
+    parser.add_argument('--no-upsert', dest='upsert', action='store_false',
+                        help='Fail on existing values instead of updating them')
+    parser.add_argument('--restart', action='store_true', help='Ignore the state file and load all the files')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    with open(args.mapping, 'r') as f:
+        mapping = json.loads(f.read())
+    state_file = args.state or os.path.join(args.directory, STATE_FILE)
+    loaded = set() if args.restart else read_state(state_file)
+    if args.restart and os.path.exists(state_file):
+        os.remove(state_file)
+
+    jobs = find_jobs(args.directory, mapping, loaded, args.upsert)
+    logging.info('Loading %s files with %s workers. Skipping %s already loaded files.',
+                 len(jobs), args.workers, len(loaded))
+
+    start = time.time()
+    total_rows = 0
+    failed = []
+    pool = Pool(args.workers, initializer=_init_worker, initargs=(get_connection_params(args),))
+    try:
+        with open(state_file, 'a') as state:
+            for i, (rel_path, rows, row_count, seconds, error) in enumerate(pool.imap_unordered(load_file, jobs)):
+                if error is not None:
+                    failed.append(rel_path)
+                    logging.error('[%s/%s] Failed %s: %s', i + 1, len(jobs), rel_path, error)
+                    continue
+                state.write(rel_path + '\n')
+                state.flush()
+                total_rows += rows
+                elapsed = time.time() - start
+                logging.info('[%s/%s] Loaded %s: %s rows (%s affected) in %.2fs. Total %s rows, %.0f rows/sec',
+                             i + 1, len(jobs), rel_path, rows, row_count, seconds, total_rows, total_rows / elapsed)
+    finally:
+        pool.close()
+        pool.join()
+
+    elapsed = time.time() - start
+    logging.info('Loaded %s files, %s rows in %.2fs (%.0f rows/sec). %s failed.',
+                 len(jobs) - len(failed), total_rows, elapsed, total_rows / elapsed if elapsed else 0, len(failed))
+    if failed:
+        logging.error('Failed files will be retried on the next run: %s', ', '.join(failed))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,47 +1,110 @@
 #!/usr/bin/python3
 
-import hashlib
-import json
 import logging
+import threading
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
 
 import pymysql.cursors
 from .station import Station
-from .data import Data, TimeseriesGroupOperation
+from .data import Data, InsertMethod, TimeseriesGroupOperation, UPSERT_CHANGES, to_group_operation
 from .Constants import COMMON_DATETIME_FORMAT, MYSQL_DATETIME_FORMAT
-from .Utils import validate_common_datetime
-from .SQLQueries import get_query
+from .Utils import validate_common_datetime, to_datetime, format_times, get_event_hash
+from .SQLQueries import grouped_timeseries_queries, update_rollups_queries, \
+    select_runs_dates_query, update_runs_dates, retrieve_timeseries_query, retrieve_timeseries_queries, \
+    select_existing_runs_query, insert_runs_query, select_station_query, select_stations_in_area_query, \
+    select_source_query, MYSQL_SELECT_RUN_DATES, MAX_EVENTS_PER_QUERY, MYSQL_SELECT_RUN_EXISTS, MYSQL_INSERT_RUN, \
+    MYSQL_DELETE_RUN, STATION_KEYS, SOURCE_KEYS, MYSQL_SELECT_STATION_MAX_ID, MYSQL_INSERT_STATION, \
+    MYSQL_DELETE_STATION, MYSQL_DELETE_STATION_BY_STATION_ID, MYSQL_SELECT_SOURCE_MAX_ID, MYSQL_INSERT_SOURCE, \
+    MYSQL_DELETE_SOURCE
 from .AdapterError import InvalidDataAdapterError, DatabaseConstrainAdapterError, DatabaseAdapterError
+from .bulkinsert import DEFAULT_MAX_PACKET_SIZE, DEFAULT_CHUNK_SIZE, prepare_rows, chunks, time_bounds, \
+    insert_literals, insert_values, load_data_lines, load_data_infile
+from .columnar import format_columns, row_literals, tsv_lines, to_columns, split_timeseries, validate_output, \
+    OUTPUT_LIST, OUTPUT_COLUMNAR
+from .rollup import plan_rollup
+from .resample import resample, to_rows, validate_engine, ENGINE_SQL, ENGINE_NUMPY
+from .dimensions import DimensionCache, DEFAULT_TTL
+from .queryplanner import EventQueryPlanner, META_STRUCT, FORECAST_HORIZON_TYPES, timeseries_events, \
+    set_timeseries
+from .readcache import TimeseriesCache
+from .pool import ConnectionPool, DEFAULT_MIN_SIZE, DEFAULT_MAX_SIZE, DEFAULT_HEALTH_CHECK_INTERVAL
+from .writebehind import WriteBehindWriter, DEFAULT_FLUSH_ROWS, DEFAULT_FLUSH_INTERVAL, DEFAULT_MAX_QUEUE_SIZE
 
 
 class MySQLAdapter:
-    def __init__(self, host="localhost", user="root", password="", db="curw"):
-        """Initialize Database Connection"""
-        # Open database connection
-        self.connection = pymysql.connect(host=host,
-                                          user=user,
-                                          password=password,
-                                          db=db)
-
-        # prepare a cursor object using cursor() method
-        cursor = self.connection.cursor()
+    def __init__(self, host="localhost", user="root", password="", db="curw",
+                 max_packet_size=DEFAULT_MAX_PACKET_SIZE, local_infile=False, dimension_cache_ttl=DEFAULT_TTL,
+                 timeseries_cache_size=0, pool_min_size=DEFAULT_MIN_SIZE, pool_max_size=DEFAULT_MAX_SIZE,
+                 pool_timeout=None, health_check_interval=DEFAULT_HEALTH_CHECK_INTERVAL, rollups=False):
+        """Initialize Database Connection Pool
+        Each method call checks out a connection from the pool and returns it afterwards, thus an adapter can be
+        shared by several threads. Nested calls in the same thread share the connection.
+
+        :param int max_packet_size: Maximum size of a bulk insert statement in bytes.
+        Should be less than the `max_allowed_packet` of the MySQL server.
+        :param boolean local_infile: Enable `LOAD DATA LOCAL INFILE` for InsertMethod.load_data
+        :param int dimension_cache_ttl: Time to live in seconds of the cached station, variable, unit, type
+        and source ids. Default is 300.
+        :param int timeseries_cache_size: Memory budget in bytes of the read-through cache of retrieve_timeseries.
+        Default is 0, which disables the cache. Counters are available with `adapter.timeseries_cache.get_stats()`.
+        NOTE: The cache is only invalidated by writes of this adapter instance.
+        :param int pool_min_size: Number of connections which are opened at the start. Default is 1.
+        :param int pool_max_size: Maximum number of connections. Default is 10.
+        :param float pool_timeout: Maximum time in seconds to wait for a free connection. Default is waiting forever.
+        :param float health_check_interval: Ping connections which were idle longer than this many seconds before
+        using them, and reconnect if needed. Default is 30.
+        :param boolean rollups: Maintain the 5 minute, hourly and daily rollups of `<data table>_rollup` tables on
+        each insert, and answer extract_grouped_time_series from them where possible. Default is False.
+        Create the tables with `schema/create_curw_rollup_table.sql`, and backfill the existing timeseries with
+        update_rollups. NOTE: All the writers of the database should enable the rollups.
+        """
+        # Open database connections
+        self.pool = ConnectionPool({
+            'host': host,
+            'user': user,
+            'password': password,
+            'db': db,
+            'local_infile': local_infile
+        }, min_size=pool_min_size, max_size=pool_max_size, timeout=pool_timeout,
+            health_check_interval=health_check_interval)
+        self._local = threading.local()
+        self._pinned = []
+        self.max_packet_size = max_packet_size
+        self.local_infile = local_infile
+        self.dimensions = DimensionCache(ttl=dimension_cache_ttl)
+        self.planner = EventQueryPlanner(self.dimensions)
+        self.timeseries_cache = TimeseriesCache(timeseries_cache_size) if timeseries_cache_size else None
+        self.rollups = rollups
+        self.connection_params = {
+            'host': host,
+            'user': user,
+            'password': password,
+            'db': db,
+            'max_packet_size': max_packet_size,
+            'local_infile': local_infile,
+            'dimension_cache_ttl': dimension_cache_ttl,
+            'timeseries_cache_size': timeseries_cache_size,
+            'pool_min_size': pool_min_size,
+            'pool_max_size': pool_max_size,
+            'pool_timeout': pool_timeout,
+            'health_check_interval': health_check_interval,
+            'rollups': rollups
+        }
 
-        # execute SQL query using execute() method.
-        cursor.execute("SELECT VERSION()")
+        with self._connection() as connection, connection.cursor() as cursor:
+            # execute SQL query using execute() method.
+            cursor.execute("SELECT VERSION()")
 
-        # Fetch a single row using fetchone() method.
-        data = cursor.fetchone()
+            # Fetch a single row using fetchone() method.
+            data = cursor.fetchone()
 
         logging.info("Database version : %s " % data)
 
-        self.meta_struct = {
-            'station': '',
-            'variable': '',
-            'unit': '',
-            'type': '',
-            'source': '',
-            'name': ''
-        }
+        self.meta_struct = dict(META_STRUCT)
         self.meta_struct_keys = sorted(self.meta_struct.keys())
 
         self.station_struct = {
@@ -62,6 +125,129 @@ class MySQLAdapter:
         }
         self.source_struct_keys = self.source_struct.keys()
 
+    @contextmanager
+    def _connection(self):
+        """Check out a connection from the pool for the current thread, and return it afterwards.
+        Nested calls in the same thread get the same connection. Uncommitted changes are rolled back when the
+        connection is returned into the pool.
+        With a connection pinned by the `connection` property, the outermost call rolls back on errors instead,
+        since the connection is not returned into the pool.
+        """
+        depth = getattr(self._local, 'depth', 0)
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            self._local.depth = depth + 1
+            try:
+                yield connection
+            except BaseException:
+                if depth == 0:
+                    self._local.invalidations = []
+                    try:
+                        connection.rollback()
+                    except Exception:
+                        logging.warning('Unable to rollback the pinned connection')
+                raise
+            finally:
+                self._local.depth = depth
+            return
+
+        connection = self.pool.acquire()
+        self._local.connection = connection
+        self._local.depth = 1
+        broken = False
+        try:
+            yield connection
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._local.connection = None
+            self._local.depth = 0
+            # Uncommitted changes are rolled back, thus the cache entries stay valid
+            self._local.invalidations = []
+            self.pool.release(connection, broken)
+
+    @contextmanager
+    def transaction(self):
+        """Run several adapter calls of the current thread in a single transaction s.t.
+
+            with adapter.transaction():
+                event_id = adapter.create_event_id(meta_data)
+                adapter.insert_timeseries(event_id, timeseries)
+
+        Inside the block, methods use the same connection and skip their own commits. Errors which the methods
+        normally log and swallow are raised instead. Everything is committed once at the end of the block, or
+        rolled back if an error is raised. Nested blocks join the outer transaction. Reads inside the block bypass
+        the timeseries cache.
+        NOTE: Reads with the `parallel` option use other connections, thus they do not see uncommitted changes of
+        the transaction. iter_timeseries can't be used inside the block.
+        """
+        if self._in_transaction():
+            yield self
+            return
+
+        with self._connection() as connection:
+            self._local.transaction = True
+            try:
+                yield self
+                connection.commit()
+                self._apply_invalidations()
+            except BaseException:
+                connection.rollback()
+                self._local.invalidations = []
+                # Stations and sources created inside the block may have been loaded into the dimension cache
+                self.dimensions.invalidate()
+                raise
+            finally:
+                self._local.transaction = False
+
+    def _in_transaction(self):
+        return getattr(self._local, 'transaction', False)
+
+    def _commit(self, connection):
+        """Commit, unless the connection is in a transaction() block which commits at the end"""
+        if not self._in_transaction():
+            connection.commit()
+            self._apply_invalidations()
+
+    def _invalidate_on_commit(self, method, *args):
+        """Call an invalidation method of the timeseries cache once the changes are committed, i.e. at the end of
+        the transaction() block. Invalidating before the commit lets concurrent reads cache the old rows again.
+        """
+        if self.timeseries_cache is None:
+            return
+        if not getattr(self._local, 'invalidations', None):
+            self._local.invalidations = []
+        self._local.invalidations.append((method, args))
+
+    def _apply_invalidations(self):
+        invalidations = getattr(self._local, 'invalidations', None)
+        self._local.invalidations = []
+        for method, args in invalidations or []:
+            getattr(self.timeseries_cache, method)(*args)
+
+    @property
+    def connection(self):
+        """Connection of the current thread. If the thread does not have one, check out a connection
+        and keep it for the thread until the adapter is closed. Adapter methods use that connection as well.
+        Prefer the adapter methods, which return the connections into the pool after each call.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.pool.acquire()
+            self._pinned.append(connection)
+        return connection
+
+    def get_pool_stats(self):
+        """Get counters of the connection pool. Refer to ConnectionPool.get_stats"""
+        return self.pool.get_stats()
+
+    def invalidate_dimensions(self):
+        """Drop the cached station, variable, unit, type and source ids.
+        Call after modifying those tables without the adapter, in order to see the changes before the TTL expires.
+        """
+        self.dimensions.invalidate()
+
     def get_meta_struct(self):
         """Get the Meta Data Structure of hash value
         NOTE: start_date and end_date is not using for hashing
@@ -91,27 +277,18 @@ class MySQLAdapter:
         :return str: sha256 hash value in hex format (length of 64 characters). If does not exists, return None.
         """
         event_id = None
-        m = hashlib.sha256()
-
-        hash_data = dict(self.meta_struct)
-        for i, value in enumerate(self.meta_struct_keys):
-            hash_data[value] = meta_data[value]
-        logging.debug('hash Data:: %s', hash_data)
-
-        m.update(json.dumps(hash_data, sort_keys=True).encode("ascii"))
-        possible_id = m.hexdigest()
+        possible_id = get_event_hash(meta_data)
         try:
-            with self.connection.cursor() as cursor:
-                sql = "SELECT 1 FROM `run` WHERE `id`=%s"
-
-                cursor.execute(sql, possible_id)
+            with self._connection() as connection, connection.cursor() as cursor:
+                cursor.execute(MYSQL_SELECT_RUN_EXISTS, possible_id)
                 is_exist = cursor.fetchone()
                 if is_exist is not None:
                     event_id = possible_id
         except Exception as e:
+            if self._in_transaction():
+                raise
             traceback.print_exc()
-        finally:
-            return event_id
+        return event_id
 
     def create_event_id(self, meta_data):
         """
@@ -131,54 +308,49 @@ class MySQLAdapter:
 
         :return str: sha256 hash value in hex format (length of 64 characters)
         """
-        hash_data = dict(self.meta_struct)
-        for i, value in enumerate(self.meta_struct_keys):
-            hash_data[value] = meta_data[value]
+        event_id = get_event_hash(meta_data)
+        try:
+            with self._connection() as connection, connection.cursor() as cursor:
+                cursor.execute(MYSQL_INSERT_RUN, self.planner.run_values(cursor, event_id, meta_data))
+                self._commit(connection)
+
+        except DatabaseConstrainAdapterError as ae:
+            logging.warning(ae.message)
+            raise ae
+        except Exception as e:
+            traceback.print_exc()
+            raise e
 
-        m = hashlib.sha256()
+        return event_id
+
+    def get_or_create_event_ids(self, meta_data_list):
+        """Get the event ids for a list of meta data, and create the missing events.
+        Hash values are generated locally, existence of all of them is checked with a single query,
+        and all the missing events are created with a single multi-row INSERT.
 
-        m.update(json.dumps(hash_data, sort_keys=True).encode("ascii"))
-        event_id = m.hexdigest()
+        :param list meta_data_list: List of Meta Data dicts. Refer to create_event_id for the structure.
+
+        :return list: sha256 hash values in hex format, in the same order as meta_data_list
+        """
+        event_ids = [get_event_hash(meta_data) for meta_data in meta_data_list]
+        if not event_ids:
+            return event_ids
         try:
-            with self.connection.cursor() as cursor:
-                sql = [
-                    "SELECT `id` as `station_id` FROM `station` WHERE `name`=%s",
-                    "SELECT `id` as `variable_id` FROM `variable` WHERE `variable`=%s",
-                    "SELECT `id` as `unit_id` FROM `unit` WHERE `unit`=%s",
-                    "SELECT `id` as `type_id` FROM `type` WHERE `type`=%s",
-                    "SELECT `id` as `source_id` FROM `source` WHERE `source`=%s"
-                ]
-
-                def check_foreign_key_reference(cursor_value, key_name, key_value):
-                    if cursor_value is not None:
-                        return cursor_value[0]
-                    else:
-                        raise DatabaseConstrainAdapterError("Could not find %s with value %s" % (key_name, key_value))
-
-                cursor.execute(sql[0], (meta_data['station']))
-                station_id = check_foreign_key_reference(cursor.fetchone(), 'station', meta_data['station'])
-                cursor.execute(sql[1], (meta_data['variable']))
-                variable_id = check_foreign_key_reference(cursor.fetchone(), 'variable', meta_data['variable'])
-                cursor.execute(sql[2], (meta_data['unit']))
-                unit_id = check_foreign_key_reference(cursor.fetchone(), 'unit', meta_data['unit'])
-                cursor.execute(sql[3], (meta_data['type']))
-                type_id = check_foreign_key_reference(cursor.fetchone(), 'type', meta_data['type'])
-                cursor.execute(sql[4], (meta_data['source']))
-                source_id = check_foreign_key_reference(cursor.fetchone(), 'source', meta_data['source'])
-
-                sql = "INSERT INTO `run` (`id`, `name`, `station`, `variable`, `unit`, `type`, `source`) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-
-                sql_values = (
-                    event_id,
-                    meta_data['name'],
-                    station_id,
-                    variable_id,
-                    unit_id,
-                    type_id,
-                    source_id
-                )
-                cursor.execute(sql, sql_values)
-                self.connection.commit()
+            with self._connection() as connection, connection.cursor() as cursor:
+                unique_ids = list(OrderedDict.fromkeys(event_ids))
+                cursor.execute(select_existing_runs_query(len(unique_ids)), unique_ids)
+                existing_ids = set(row[0] for row in cursor.fetchall())
+
+                missing = OrderedDict()
+                for event_id, meta_data in zip(event_ids, meta_data_list):
+                    if event_id not in existing_ids and event_id not in missing:
+                        missing[event_id] = self.planner.run_values(cursor, event_id, meta_data)
+
+                if missing:
+                    cursor.execute(insert_runs_query(len(missing)),
+                                   [value for run_values in missing.values() for value in run_values])
+                    self._commit(connection)
+                logging.debug('get_or_create_event_ids: %s exists, %s created', len(existing_ids), len(missing))
 
         except DatabaseConstrainAdapterError as ae:
             logging.warning(ae.message)
@@ -187,70 +359,355 @@ class MySQLAdapter:
             traceback.print_exc()
             raise e
 
-        return event_id
+        return event_ids
 
-    def insert_timeseries(self, event_id, timeseries, upsert=False, mode=Data.data):
+    def insert_timeseries(self, event_id, timeseries, upsert=False, mode=Data.data, method=InsertMethod.values,
+                          chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
         """Insert timeseries into the db against given event_id
 
         :param string event_id: Hex Hash value that need to store timeseries against.
 
         :param list   timeseries: List of time series of time & value list ['2017-05-01 00:00:00', 1.08]
         E.g. [ ['2017-05-01 00:00:00', 1.08], ['2017-05-01 01:00:00', 2.04], ... ]
+        It can be any iterable or generator of time & value items, s.t. csv.reader. Timeseries is consumed
+        in chunks, thus the memory usage does not grow with the length of the timeseries.
 
         :param boolean upsert: If True, upsert existing values ON DUPLICATE KEY. Default is False.
         Ref: 1). https://stackoverflow.com/a/14383794/1461060
              2). https://chartio.com/resources/tutorials/how-to-insert-if-row-does-not-exist-upsert-in-mysql/
+        If UPSERT_CHANGES ('changes'), upsert only the new or changed points, and return the counts of
+        upsert_timeseries_changes instead of the affected row count. `method`, `chunk_size` and `progress` are
+        not used in that mode.
+
+        :param Data mode: Data table to store timeseries s.t. Data.data | Data.processed_data. Default is Data.data
+
+        :param InsertMethod method: Bulk insert method s.t.
+        InsertMethod.values - Chunked multi-row INSERT statements, each less than `max_packet_size` (Default)
+        InsertMethod.load_data - Stream with LOAD DATA LOCAL INFILE. Adapter should create with `local_infile=True`.
+        NOTE: With InsertMethod.load_data and upsert=False, duplicate rows are ignored.
+
+        :param int chunk_size: Number of rows to insert and commit at once. Default is 10000.
+        If an error occurred, already committed chunks are kept.
+        The `start_date` and `end_date` of the run are widened to include each committed chunk.
+
+        :param function progress: Callback which is called after committing each chunk s.t.
+        progress(rows, row_count) where `rows` is the number of rows consumed so far
+        and `row_count` is the affected row count so far.
+
+        :return int: Affected row count.
+        """
+        if upsert == UPSERT_CHANGES:
+            return self.upsert_timeseries_changes(event_id, timeseries, mode)
+        if not isinstance(mode, Data):
+            raise InvalidDataAdapterError("Provided Data type %s is invalid" % mode)
+        if not isinstance(method, InsertMethod):
+            raise InvalidDataAdapterError("Provided InsertMethod %s is invalid" % method)
+        if method is InsertMethod.load_data and not self.local_infile:
+            raise InvalidDataAdapterError("InsertMethod.load_data requires an adapter with local_infile=True")
+
+        row_count = 0
+        try:
+            with self._connection() as connection, connection.cursor() as cursor:
+                rows = 0
+                for chunk in chunks(prepare_rows(timeseries), chunk_size):
+                    if method is InsertMethod.load_data:
+                        row_count += load_data_infile(cursor, mode.value, [(event_id, chunk)], upsert)
+                    else:
+                        row_count += insert_values(cursor, mode.value, [(event_id, chunk)], upsert,
+                                                   self.max_packet_size)
+                    self._update_runs_dates(cursor, mode, {event_id: time_bounds(chunk)})
+                    self._commit(connection)
+                    rows += len(chunk)
+                    logging.debug('Inserted chunk of %s rows into %s (total rows: %s)', len(chunk), event_id, rows)
+                    if progress is not None:
+                        progress(rows, row_count)
+
+        except Exception as e:
+            if self._in_transaction():
+                raise
+            traceback.print_exc()
+        return row_count
+
+    def upsert_timeseries_changes(self, event_id, timeseries, mode=Data.data):
+        """Upsert only the new or changed points of the timeseries against given event_id.
+        Same as insert_timeseries with upsert=UPSERT_CHANGES.
+        Existing values for the time range of the timeseries are read with a single query and compared with
+        the incoming values at the stored precision (3 decimal places). Unchanged points are not written.
+        The existing rows are locked with SELECT ... FOR UPDATE until the changes are committed, thus
+        concurrent calls for the same range are serialized and the counts are exact.
+
+        :param string event_id: Hex Hash value that need to store timeseries against.
 
-        :param dict opts: Options dict for insert timeseries s.t.
+        :param list   timeseries: List of time series of time & value list ['2017-05-01 00:00:00', 1.08]
+        E.g. [ ['2017-05-01 00:00:00', 1.08], ['2017-05-01 01:00:00', 2.04], ... ]
+
+        :param Data mode: Data table to store timeseries s.t. Data.data | Data.processed_data. Default is Data.data
+
+        :return dict: Dict of
         {
-            mode: 'data', 'processed_data', # Default is 'data'
+            inserted: 10, # Number of new points
+            updated: 2, # Number of points with changed values, or existing points without a value
+            skipped: 100 # Number of unchanged points
         }
+        """
+        if not isinstance(mode, Data):
+            raise InvalidDataAdapterError("Provided Data type %s is invalid" % mode)
+
+        response = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        try:
+            # If the same time exists more than once, the last value wins
+            incoming = {}
+            for time, value in prepare_rows(timeseries):
+                incoming[to_datetime(time)] = Decimal('%.3f' % value)
+            if not incoming:
+                return response
+
+            with self._connection() as connection, connection.cursor() as cursor:
+                sql = "SELECT `time`, `value` FROM `%s` WHERE `id`=%%s AND `time` BETWEEN %%s AND %%s FOR UPDATE" \
+                      % mode.value
+                cursor.execute(sql, (event_id, min(incoming), max(incoming)))
+                existing = dict(cursor.fetchall())
+
+                changes = []
+                for time, value in incoming.items():
+                    if time not in existing:
+                        response['inserted'] += 1
+                    elif existing[time] != value:
+                        response['updated'] += 1
+                    else:
+                        response['skipped'] += 1
+                        continue
+                    changes.append((time, value))
+
+                if changes:
+                    insert_values(cursor, mode.value, [(event_id, changes)], True, self.max_packet_size)
+                    self._update_runs_dates(cursor, mode, {event_id: time_bounds(changes)})
+                # Also releases the row locks if nothing changed
+                self._commit(connection)
+                logging.debug('Upsert changes of %s: %s', event_id, response)
+
+        except Exception as e:
+            if self._in_transaction():
+                raise
+            response = {'inserted': 0, 'updated': 0, 'skipped': 0}
+            logging.exception('Unable to upsert the changes of %s', event_id)
+        return response
+
+    def insert_timeseries_columns(self, event_id, times, values, upsert=False, mode=Data.data,
+                                  method=InsertMethod.values, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Insert columnar timeseries into the db against given event_id. Requires numpy.
+        Values are rounded and formatted in a vectorized way, without building per-row lists.
+        Values which are not finite or out of the DECIMAL(8,3) range are skipped.
+
+        :param string event_id: Hex Hash value that need to store timeseries against.
+
+        :param times: numpy datetime64 array, or a sequence of datetime objects or ISO 8601 datetime strings
+        E.g. numpy.array(['2017-05-01T00:00', '2017-05-01T01:00'], dtype='datetime64[m]')
+
+        :param values: numpy float array, or a sequence of numbers of the same length as times
+        E.g. numpy.array([1.08, 2.04])
+
+        :param boolean upsert: If True, upsert existing values ON DUPLICATE KEY. Default is False.
+
+        :param Data mode: Data table to store timeseries s.t. Data.data | Data.processed_data. Default is Data.data
+
+        :param InsertMethod method: Bulk insert method. Refer to insert_timeseries.
+
+        :param int chunk_size: Number of rows to insert and commit at once. Default is 10000.
 
         :return int: Affected row count.
         """
         if not isinstance(mode, Data):
             raise InvalidDataAdapterError("Provided Data type %s is invalid" % mode)
+        if not isinstance(method, InsertMethod):
+            raise InvalidDataAdapterError("Provided InsertMethod %s is invalid" % method)
+        if method is InsertMethod.load_data and not self.local_infile:
+            raise InvalidDataAdapterError("InsertMethod.load_data requires an adapter with local_infile=True")
 
+        times, values = format_columns(times, values)
         row_count = 0
         try:
-            with self.connection.cursor() as cursor:
-                sql_table = "INSERT INTO `%s`" % mode.value
-                sql = sql_table + " (`id`, `time`, `value`) VALUES (%s, %s, %s)"
-
-                if upsert:
-                    sql = sql_table + \
-                          " (`id`, `time`, `value`) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE `value`=VALUES(`value`)"
-
-                # Refer to performance in copy list : https://stackoverflow.com/a/2612990/1461060
-                timeseries_copy = []
-                for item in timeseries:
-                    timeseries_copy.append(item[:])
-
-                new_timeseries = []
-                for t in [i for i in timeseries_copy]:
-                    if len(t) > 1:
-                        # Format value into 3 decimal palaces
-                        t[1] = round(float(t[1]), 3)
-                        # Insert EventId in font of timestamp, value list
-                        t.insert(0, event_id)
-                        new_timeseries.append(t)
+            with self._connection() as connection, connection.cursor() as cursor:
+                escaped_event_id = connection.escape(event_id)
+                for start in range(0, len(times), chunk_size):
+                    chunk_times = times[start:start + chunk_size]
+                    chunk_values = values[start:start + chunk_size]
+                    if method is InsertMethod.load_data:
+                        row_count += load_data_lines(cursor, mode.value,
+                                                     tsv_lines(event_id, chunk_times, chunk_values), upsert)
                     else:
-                        logging.warning('Invalid timeseries data:: %s', t)
+                        row_count += insert_literals(cursor, mode.value,
+                                                     row_literals(escaped_event_id, chunk_times, chunk_values),
+                                                     upsert, self.max_packet_size)
+                    self._update_runs_dates(cursor, mode, {event_id: (str(chunk_times.min()), str(chunk_times.max()))})
+                    self._commit(connection)
 
-                logging.debug(new_timeseries[:10])
-                row_count = cursor.executemany(sql, new_timeseries)
-                self.connection.commit()
+        except Exception as e:
+            if self._in_transaction():
+                raise
+            traceback.print_exc()
+        return row_count
 
-                sql = "UPDATE `run` SET `start_date`=(SELECT MIN(time) from `data` WHERE id=%s), " +\
-                      "`end_date`=(SELECT MAX(time) from `data` WHERE id=%s) WHERE id=%s"
-                cursor.execute(sql, (event_id, event_id, event_id))
-                self.connection.commit()
+    def insert_timeseries_bulk(self, timeseries_dict, upsert=False, mode=Data.data, method=InsertMethod.values,
+                               raise_errors=False):
+        """Insert timeseries of several events in a single transaction.
+        Rows of all the events are merged into shared bulk statements, `start_date` and `end_date` of all the
+        touched runs are updated with a single statement, and everything is committed once.
 
+        :param dict timeseries_dict: Dict of timeseries against the event_id s.t.
+        {
+            'eventId1': [ ['2017-05-01 00:00:00', 1.08], ['2017-05-01 01:00:00', 2.04], ... ],
+            'eventId2': [ ... ],
+        }
+
+        :param boolean upsert: If True, upsert existing values ON DUPLICATE KEY. Default is False.
+
+        :param Data mode: Data table to store timeseries s.t. Data.data | Data.processed_data. Default is Data.data
+
+        :param InsertMethod method: Bulk insert method. Refer to insert_timeseries.
+
+        :param boolean raise_errors: If True, raise errors instead of logging them. Default is False.
+
+        :return int: Affected row count. If an error occurred, nothing is inserted and return 0.
+        """
+        if not isinstance(mode, Data):
+            raise InvalidDataAdapterError("Provided Data type %s is invalid" % mode)
+        if not isinstance(method, InsertMethod):
+            raise InvalidDataAdapterError("Provided InsertMethod %s is invalid" % method)
+        if method is InsertMethod.load_data and not self.local_infile:
+            raise InvalidDataAdapterError("InsertMethod.load_data requires an adapter with local_infile=True")
+
+        row_count = 0
+        try:
+            row_count = self._insert_timeseries_bulk(timeseries_dict, upsert, mode, method)
         except Exception as e:
+            if raise_errors or self._in_transaction():
+                raise
             traceback.print_exc()
-        finally:
+        return row_count
+
+    def _insert_timeseries_bulk(self, timeseries_dict, upsert, mode, method):
+        """Same as insert_timeseries_bulk, but raise on errors. Nothing is committed if an error occurred."""
+        run_dates = {}
+
+        def events():
+            for event_id, timeseries in timeseries_dict.items():
+                rows = list(prepare_rows(timeseries))
+                if rows:
+                    run_dates[event_id] = time_bounds(rows)
+                    yield event_id, rows
+
+        with self._connection() as connection, connection.cursor() as cursor:
+            if method is InsertMethod.load_data:
+                row_count = load_data_infile(cursor, mode.value, events(), upsert)
+            else:
+                row_count = insert_values(cursor, mode.value, events(), upsert, self.max_packet_size)
+            if run_dates:
+                self._update_runs_dates(cursor, mode, run_dates)
+            self._commit(connection)
+            logging.debug('Inserted %s rows into %s events', row_count, len(run_dates))
             return row_count
 
+    def _update_runs_dates(self, cursor, mode, run_dates):
+        """Widen `start_date` and `end_date` of the runs with the time ranges of newly inserted data,
+        update the rollups of those ranges if enabled, and invalidate them in the timeseries cache on commit.
+
+        :param dict run_dates: Dict of {event_id: (start_date, end_date)}
+        """
+        sql, sql_values = update_runs_dates(run_dates)
+        cursor.execute(sql, sql_values)
+        if self.rollups:
+            self._update_rollups(cursor, mode, run_dates)
+        for event_id, (start_date, end_date) in run_dates.items():
+            self._invalidate_on_commit('invalidate', (event_id, mode.value), to_datetime(start_date),
+                                       to_datetime(end_date))
+
+    def _update_rollups(self, cursor, mode, run_dates):
+        """Recompute the rollup buckets of all the resolutions which contain given time ranges.
+        Refer to SQLQueries.update_rollups_queries.
+
+        :param dict run_dates: Dict of {event_id: (start_date, end_date)}
+        """
+        for sql, sql_values in update_rollups_queries(mode.value, run_dates):
+            cursor.execute(sql, sql_values)
+
+    def update_rollups(self, event_ids, mode=Data.data):
+        """Recompute the rollups of the whole timeseries of given events, s.t. to backfill the timeseries which
+        were inserted before enabling the rollups.
+
+        :param list event_ids: list of event ids
+        :param Data mode: Data table of the timeseries. Default is `data`
+        :return int: Number of events which have timeseries
+        """
+        if not isinstance(mode, Data):
+            raise InvalidDataAdapterError("Provided Data type %s is invalid" % mode)
+        run_dates = {}
+        try:
+            with self._connection() as connection, connection.cursor() as cursor:
+                for i in range(0, len(event_ids), MAX_EVENTS_PER_QUERY):
+                    batch = list(event_ids[i:i + MAX_EVENTS_PER_QUERY])
+                    cursor.execute(select_runs_dates_query(len(batch)), batch)
+                    for event_id, start_date, end_date in cursor.fetchall():
+                        if start_date is not None and end_date is not None:
+                            run_dates[event_id] = (start_date, end_date)
+                if run_dates:
+                    self._update_rollups(cursor, mode, run_dates)
+                    self._commit(connection)
+        except Exception as e:
+            if self._in_transaction():
+                raise
+            traceback.print_exc()
+        return len(run_dates)
+
+    def write_behind(self, flush_rows=DEFAULT_FLUSH_ROWS, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                     max_queue_size=DEFAULT_MAX_QUEUE_SIZE, upsert=True):
+        """Create a write-behind writer for high-frequency producers.
+        Producers enqueue small batches with `writer.enqueue(event_id, timeseries)`, and a background thread
+        coalesces them by event and data table, then writes with insert_timeseries_bulk when flush_rows are
+        buffered or flush_interval seconds have elapsed since the first buffered batch.
+        The writer uses its own database connection, and shares the caches of this adapter.
+        Call `writer.close()` to flush and stop it.
+
+        :param int flush_rows: Number of buffered rows that triggers a flush. Default is 10000.
+        :param float flush_interval: Maximum time in seconds to buffer rows before flushing. Default is 5.
+        :param int max_queue_size: Maximum number of enqueued batches. When the queue is full, enqueue blocks.
+        :param boolean upsert: If True, upsert existing values ON DUPLICATE KEY. Default is True.
+
+        :return WriteBehindWriter: started writer
+        """
+        adapter = MySQLAdapter(**dict(self.connection_params, timeseries_cache_size=0))
+        # Share the caches, thus the flushes invalidate the cached timeseries of this adapter
+        adapter.dimensions = self.dimensions
+        adapter.planner = self.planner
+        adapter.timeseries_cache = self.timeseries_cache
+        writer = WriteBehindWriter(adapter, flush_rows=flush_rows, flush_interval=flush_interval,
+                                   max_queue_size=max_queue_size, upsert=upsert)
+        writer.start()
+        return writer
+
+    def repair_run_dates(self, event_id):
+        """Recompute `start_date` and `end_date` of the run with a full scan of `data` and `processed_data` tables.
+        insert_timeseries keeps those up to date incrementally, thus use this only to repair inconsistent runs.
+
+        :param string event_id: Hex Hash value of the run
+
+        :return tuple: (start_date, end_date) of the run. (None, None) if there isn't any data.
+        """
+        run_dates = (None, None)
+        try:
+            with self._connection() as connection, connection.cursor() as cursor:
+                cursor.execute(MYSQL_SELECT_RUN_DATES, (event_id, event_id))
+                run_dates = cursor.fetchone()
+                sql = "UPDATE `run` SET `start_date`=%s, `end_date`=%s WHERE `id`=%s"
+                cursor.execute(sql, (run_dates[0], run_dates[1], event_id))
+                self._commit(connection)
+
+        except Exception as e:
+            if self._in_transaction():
+                raise
+            traceback.print_exc()
+        return run_dates
+
     def delete_timeseries(self, event_id):
         """Delete given timeseries from the database
 
@@ -260,23 +717,22 @@ class MySQLAdapter:
         """
         row_count = 0
         try:
-            with self.connection.cursor() as cursor:
-                sql = [
-                    "DELETE FROM `run` WHERE `id`=%s",
-                ]
+            with self._connection() as connection, connection.cursor() as cursor:
                 ''' "DELETE FROM `data` WHERE `id`=%s"
                 NOTE: Since `data` table `id` foriegn key contain on `ON DELETE CASCADE`,
                 when deleting entries on `run` table will automatically delete the records
                 in `data` table
                 '''
 
-                row_count = cursor.execute(sql[0], event_id)
-                self.connection.commit()
+                row_count = cursor.execute(MYSQL_DELETE_RUN, event_id)
+                self._invalidate_on_commit('invalidate_event', event_id)
+                self._commit(connection)
 
         except Exception as e:
+            if self._in_transaction():
+                raise
             traceback.print_exc()
-        finally:
-            return row_count
+        return row_count
 
     def get_event_ids(self, meta_query=None, opts=None):
         """Get event ids set according to given meta data
@@ -291,13 +747,19 @@ class MySQLAdapter:
             'source': 'WRF',
             'name': 'Daily Forecast',
             'start_date': '2017-05-01 00:00:00',
-            'end_date': '2017-05-03 23:00:00'
+            'end_date': '2017-05-03 23:00:00',
+            'from': '2017-05-02 00:00:00', // Events which have timeseries in between from and to.
+            'to': '2017-05-02 23:00:00',   // Either can be omitted.
         }
 
         :param dict opts: Dict of options for searching and handling data s.t.
         {
-            'limit': 100,
-            'skip': 0
+            'limit': 100, # Maximum number of events to return. Default is returning all the matching events.
+            'skip': 0, # Number of matching events to skip
+            'after_id': 'eventId', # Keyset pagination: return the events after the given id (ordered by id).
+                                   # Use the id of the last event of the previous page, for deep paging.
+            'order_by': 'station', # Or a list ['station', '-start_date']. Prefix with '-' for descending order.
+                                   # Events are always ordered by id at last. Default is ordering by id.
         }
 
         :return list: Return list of event objects which matches the given scenario
@@ -307,55 +769,38 @@ class MySQLAdapter:
         if meta_query is None:
             meta_query = {}
         try:
-            if not opts.get('limit'):
-                opts['limit'] = 100
-            if not opts.get('skip'):
-                opts['skip'] = 0
-
-            with self.connection.cursor() as cursor:
-                out_order = []
-                sorted_keys = ['id'] + self.meta_struct_keys
-                for key in sorted_keys:
-                    out_order.append("`%s` as `%s`" % (key, key))
-                out_order = ','.join(out_order)
-
-                sql = "SELECT %s FROM `run_view` " % out_order
-                if meta_query:
-                    sql += "WHERE "
-                    cnt = 0
-                    for key in meta_query:
-                        if cnt:
-                            sql += "AND "
-
-                        # TODO: Need to update start and end date of timeseries
-                        if key is 'from':
-                            # sql += "`%s`>=\"%s\" " % ('start_date', meta_query[key])
-                            sql = sql[:-4]
-                        elif key is 'to':
-                            # sql += "`%s`<=\"%s\" " % ('start_date', meta_query[key])
-                            sql = sql[:-4]
-                        elif key is 'station' and isinstance(meta_query[key], list):
-                            sql += "`%s` in (%s) " % (key, ','.join('\"%s\"' % x for x in meta_query[key]))
-                        else:
-                            sql += "`%s`=\"%s\" " % (key, meta_query[key])
-                        cnt += 1
-
-                logging.debug('sql (get_event_ids):: %s', sql)
-                cursor.execute(sql)
-                events = cursor.fetchmany(opts.get('limit'))
-                logging.debug('Events (get_event_ids):: %s', events)
-                response = []
-                for event in events:
-                    meta_struct = dict(self.meta_struct)
-                    for i, value in enumerate(sorted_keys):
-                        meta_struct[sorted_keys[i]] = event[i]
-                    response.append(meta_struct)
-
-                return response
-
+            with self._connection() as connection, connection.cursor() as cursor:
+                query = self.planner.plan(cursor, meta_query, opts)
+                if query is None:
+                    logging.debug('No matching dimensions (get_event_ids):: %s', meta_query)
+                    return []
+                logging.debug('sql (get_event_ids):: %s, %s', query[0], query[1])
+                cursor.execute(query[0], query[1])
+                events = cursor.fetchall()
+                logging.debug('Events (get_event_ids):: %s', len(events))
+                return self.planner.to_events(cursor, events, self.meta_struct)
+
+        except InvalidDataAdapterError:
+            raise
         except Exception as e:
+            if self._in_transaction():
+                raise
             traceback.print_exc()
 
+    def explain_event_ids(self, meta_query=None, opts=None):
+        """Get the query execution plan of get_event_ids for given meta query and options
+
+        :return list: Rows of EXPLAIN as dicts s.t. [{'table': 'run', 'key': 'station_idx', ...}]
+        If no event can match the meta query, return empty list.
+        """
+        with self._connection() as connection, connection.cursor() as cursor:
+            query = self.planner.plan(cursor, meta_query or {}, opts or {})
+            if query is None:
+                return []
+            cursor.execute("EXPLAIN " + query[0], query[1])
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
     def retrieve_timeseries(self, meta_query=None, opts=None):
         """Get timeseries
 
@@ -376,6 +821,7 @@ class MySQLAdapter:
             ['eventId1', 'eventId2', ...] // List of strings
         Or
             [{id: 'eventId1'}, {id: 'eventId2'}, ...] // List of Objects
+        Timeseries of all the events are retrieved with a single query, or a query per MAX_EVENTS_PER_QUERY events.
 
         :param dict opts: Dict of options for searching and handling data s.t.
         {
@@ -384,9 +830,14 @@ class MySQLAdapter:
             'from': '2017-05-01 00:00:00',
             'to': '2017-05-06 23:00:00',
             'mode': Data.data | Data.processed_data, # Default is `Data.data`
+            'output': 'list' | 'columnar', # Default is `list`
+            'cache': True | False, # Read through the timeseries cache, if enabled. Default is True
+            'parallel': 4, # Split the events among 4 threads, each with its own connection. Default is 1
         }
+        With 'columnar' output, timeseries of each event is a tuple of (times, values) typed buffers instead of
+        a list of [datetime, Decimal] lists. Refer to columnar.to_columns.
 
-        :return list: Return list of objects with the timeseries data for given matching events
+        :return list: Return list of objects with the timeseries data for given matching events, in the same order
         """
         if opts is None:
             opts = {}
@@ -398,6 +849,11 @@ class MySQLAdapter:
             data_table = data_table.value
         else:
             raise InvalidDataAdapterError("Provided Data type %s is invalid" % data_table)
+        output = opts.get('output', OUTPUT_LIST)
+        validate_output(output)
+        columnar = output == OUTPUT_COLUMNAR
+        parallel = opts.get('parallel', 1)
+        self._validate_parallel(parallel)
 
         try:
             if not opts.get('limit'):
@@ -405,73 +861,326 @@ class MySQLAdapter:
             if not opts.get('skip'):
                 opts['skip'] = 0
 
-            with self.connection.cursor() as cursor:
-                if isinstance(meta_query, dict):
-                    event_ids = self.get_event_ids(meta_query)
-                else:
-                    event_ids = list(meta_query)
+            if isinstance(meta_query, dict):
+                event_ids = self.get_event_ids(meta_query)
+            else:
+                event_ids = list(meta_query)
 
-                logging.debug('event_ids :: %s', event_ids)
-                response = []
-                for event in event_ids:
-                    if isinstance(event, dict):
-                        event_id = event.get('id')
-                    else:
-                        event_id = event
-                        event = {'id': event_id}
+            logging.debug('event_ids :: %s', event_ids)
+            response, events = timeseries_events(event_ids, columnar)
 
-                    sql = "SELECT `time`,`value` FROM `%s` WHERE `id`=\"%s\" " % (data_table, event_id)
+            # Reads of a transaction() block may see its uncommitted changes, which must not be shared through the cache
+            use_cache = self.timeseries_cache is not None and opts.get('cache', True) and not self._in_transaction()
 
-                    if opts.get('from'):
-                        sql += "AND `%s`>=\"%s\" " % ('time', opts['from'])
-                    if opts.get('to'):
-                        sql += "AND `%s`<=\"%s\" " % ('time', opts['to'])
+            def select(cursor, group):
+                if columnar or not use_cache:
+                    return self._select_timeseries(cursor, data_table, group, opts.get('from'), opts.get('to'),
+                                                   columnar)
+                return self._select_timeseries_cached(cursor, data_table, group, opts.get('from'), opts.get('to'))
 
-                    logging.debug('sql (retrieve_timeseries):: %s', sql)
-                    cursor.execute(sql)
-                    timeseries = cursor.fetchall()
-                    event['timeseries'] = [[time, value] for time, value in timeseries]
-                    response.append(event)
+            event_id_list = list(events.keys())
+            group_size = max(1, -(-len(event_id_list) // parallel))
+            groups = [event_id_list[i:i + group_size] for i in range(0, len(event_id_list), group_size)]
+            for timeseries_dict in self._fan_out(select, groups, parallel):
+                set_timeseries(events, timeseries_dict, columnar)
 
-                return response
+            return response
         except Exception as e:
+            if self._in_transaction():
+                raise
             traceback.print_exc()
 
-    def extract_grouped_time_series(self, event_id, start_date, end_date, group_operation):
+    @staticmethod
+    def _validate_parallel(parallel):
+        if isinstance(parallel, bool) or not isinstance(parallel, int) or parallel < 1:
+            raise DatabaseAdapterError("Invalid parallel %s. Should be an integer of at least 1" % (parallel,))
+
+    def _fan_out(self, function, items, parallel=1):
+        """Call function(cursor, item) for each item, with up to `parallel` worker threads.
+        Each worker uses its own connection of the pool. The number of workers is also limited by the free
+        connections of the pool, thus the calls in flight never exceed the pool size.
+
+        :return list: Results in the same order as the items
+        """
+        holds_connection = getattr(self._local, 'connection', None) is not None
+        workers = min(parallel, len(items), self.pool.max_size - (1 if holds_connection else 0))
+
+        def run(item):
+            with self._connection() as connection, connection.cursor() as cursor:
+                return function(cursor, item)
+
+        if workers <= 1:
+            return [run(item) for item in items]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run, items))
+
+    def _select_timeseries(self, cursor, data_table, event_ids, from_date, to_date, columnar=False):
+        """Select timeseries of given events with a query per MAX_EVENTS_PER_QUERY events
+
+        :return dict: Dict of timeseries against the event_id. Events without any rows are omitted.
+        """
+        timeseries_dict = {}
+        for sql, args in retrieve_timeseries_queries(data_table, event_ids, from_date, to_date, columnar):
+            logging.debug('sql (retrieve_timeseries):: %s', sql)
+            cursor.execute(sql, args)
+            # Rows are ordered by id, thus split them into the events while iterating
+            timeseries_dict.update(split_timeseries(cursor, columnar))
+        return timeseries_dict
+
+    def _select_timeseries_cached(self, cursor, data_table, event_ids, from_date, to_date):
+        """Same as _select_timeseries, but read through the timeseries cache.
+        Only the missing sub ranges are selected, with a query per range for all the events which miss it.
+        """
+        from_date = to_datetime(from_date) if from_date else None
+        to_date = to_datetime(to_date) if to_date else None
+        generations = {}
+        missing_ranges = OrderedDict()
+        for event_id in event_ids:
+            missing, generations[event_id] = self.timeseries_cache.plan((event_id, data_table), from_date, to_date)
+            for missing_range in missing:
+                missing_ranges.setdefault(missing_range, []).append(event_id)
+
+        for (start, end), range_event_ids in missing_ranges.items():
+            fetched = self._select_timeseries(cursor, data_table, range_event_ids, start, end)
+            for event_id in range_event_ids:
+                self.timeseries_cache.fill((event_id, data_table), generations[event_id], start, end,
+                                           fetched.get(event_id, []))
+
+        timeseries_dict = {}
+        uncached = []
+        for event_id in event_ids:
+            timeseries = self.timeseries_cache.get((event_id, data_table), from_date, to_date)
+            if timeseries is None:
+                # Invalidated or evicted meanwhile
+                uncached.append(event_id)
+            elif timeseries:
+                timeseries_dict[event_id] = timeseries
+        if uncached:
+            timeseries_dict.update(self._select_timeseries(cursor, data_table, uncached, from_date, to_date))
+        return timeseries_dict
+
+    def iter_timeseries(self, event_id, from_date=None, to_date=None, mode=Data.data, chunk_size=None):
+        """Iterate the timeseries of given event lazily, with an unbuffered server side cursor.
+        Rows are read from the server while iterating, thus long timeseries can be exported in constant memory.
+        A connection is checked out from the pool for the iteration, and returned after the iteration is completed
+        or the generator is closed. Thus it raises DatabaseAdapterError inside a transaction() block, where it would
+        not see the uncommitted changes of the transaction.
+
+        :param string event_id: Hex Hash value of the event
+        :param from_date: start datetime [inclusive] s.t. '2017-05-01 00:00:00'
+        :param to_date: end datetime [inclusive] s.t. '2017-05-06 23:00:00'
+        :param Data mode: Data table s.t. Data.data | Data.processed_data. Default is `Data.data`
+        :param int chunk_size: If given, yield lists of up to chunk_size rows instead of single rows
+        :return: generator of [time, value] rows, or of lists of rows if chunk_size is given
+        """
+        if not isinstance(mode, Data):
+            raise InvalidDataAdapterError("Provided Data type %s is invalid" % mode)
+        if self._in_transaction():
+            raise DatabaseAdapterError("iter_timeseries can't be used inside a transaction")
+        return self._iter_timeseries(event_id, from_date, to_date, mode, chunk_size)
+
+    def _iter_timeseries(self, event_id, from_date, to_date, mode, chunk_size):
+        sql, args = retrieve_timeseries_query(mode.value, 1, from_date, to_date)
+        logging.debug('sql (iter_timeseries):: %s', sql)
+        connection = self.pool.acquire()
+        broken = False
+        cursor = connection.cursor(pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(sql, [event_id] + args)
+            if chunk_size:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield [[time, value] for _, time, value in rows]
+            else:
+                for _, time, value in cursor:
+                    yield [time, value]
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            broken = True
+            raise
+        finally:
+            try:
+                # Discards the unread rows of the result
+                cursor.close()
+            except Exception:
+                broken = True
+            self.pool.release(connection, broken)
+
+    def retrieve_stitched_timeseries(self, meta_query, opts=None):
+        """Get the continuous "best available" timeseries of a station, variable and source, stitched from the runs
+        of the chunked forecast types with a single query. For each time, take the value of the most preferred type,
+        by default the forecast with the shortest lead time;
+        'Forecast-0-d', 'Forecast-1-d-after', ..., 'Forecast-14-d-after', 'Forecast-1-d-before', ...,
+        'Forecast-14-d-before'. Among the runs of the same type, take the latest run by start_date.
+
+        :param dict meta_query: Dict of Meta Query s.t.
+        {
+            'station': 'Hanwella',
+            'variable': 'Precipitation',
+            'source': 'WRF',
+            'unit': 'mm', # Optional
+            'name': 'Daily Forecast', # Optional
+        }
+        :param dict opts: Dict of options s.t.
+        {
+            'from': '2017-05-01 00:00:00',
+            'to': '2017-05-06 23:00:00',
+            'mode': Data.data | Data.processed_data, # Default is `Data.data`
+            'output': 'list' | 'columnar', # Default is `list`
+            'types': ['Forecast-0-d', 'Forecast-1-d-after'], # Types in the order of preference
+        }
+        :return: timeseries, a list of list, [[datetime, value], [datetime, value], ...]
+        With 'columnar' output, a tuple of (times, values) typed buffers. Refer to columnar.to_columns.
+        """
+        if opts is None:
+            opts = {}
+        data_table = opts.get('mode', Data.data)
+        if not isinstance(data_table, Data):
+            raise InvalidDataAdapterError("Provided Data type %s is invalid" % data_table)
+        output = opts.get('output', OUTPUT_LIST)
+        validate_output(output)
+        columnar = output == OUTPUT_COLUMNAR
+
+        timeseries = to_columns([]) if columnar else []
+        try:
+            with self._connection() as connection, connection.cursor() as cursor:
+                query = self.planner.plan_stitch(cursor, meta_query, opts.get('types', FORECAST_HORIZON_TYPES),
+                                                 data_table.value, opts.get('from'), opts.get('to'), columnar)
+                if query is None:
+                    return timeseries
+                sql, sql_values = query
+                logging.debug('sql (retrieve_stitched_timeseries):: %s, %s', sql, sql_values)
+                cursor.execute(sql, sql_values)
+                if columnar:
+                    timeseries = to_columns(cursor)
+                else:
+                    timeseries = [[time, value] for time, value in cursor.fetchall()]
+        except InvalidDataAdapterError:
+            raise
+        except Exception as e:
+            if self._in_transaction():
+                raise
+            traceback.print_exc()
+        return timeseries
+
+    def extract_grouped_time_series(self, event_id, start_date, end_date, group_operation, output=OUTPUT_LIST,
+                                    parallel=1, mode=Data.data, engine=ENGINE_SQL):
         """
         Extract the grouped timeseries for the given event_id.
-        :param event_id: timeseries id
+        :param event_id: timeseries id, or a list of timeseries ids
         :param start_date: start datetime (early datetime) [exclusive]
         :param end_date: end datetime (late datetime) [inclusive]
-        :param group_operation: aggregation time interval and value operation
+        :param group_operation: aggregation time interval and value operation. GroupOperation, or a
+        TimeseriesGroupOperation preset
+        :param output: 'list' | 'columnar'. Default is `list`
+        :param int parallel: If a list of event ids is given, split them among up to `parallel` threads,
+        each with its own connection. Default is 1
+        :param Data mode: Data table to read from. Default is `data`
+        :param engine: 'sql' | 'numpy'. With 'sql', timeseries are grouped by the database server.
+        With 'numpy', raw timeseries are selected, and grouped on the client with numpy. Both give the same output.
+        Default is `sql`
         :return: timerseries, a list of list, [[datetime, value], [datetime, value], ...]
+        where datetime is the start of each time bucket. With a TimeseriesGroupOperation preset, datetime is
+        formatted as a string in the COMMON_DATETIME_FORMAT, as the presets always returned.
+        With 'columnar' output, a tuple of (times, values) typed buffers. Refer to columnar.to_columns.
+        If a list of event ids is given, return a list of timeseries in the same order.
+        """
+        event_ids = list(event_id) if isinstance(event_id, (list, tuple)) else [event_id]
+        timeseries_dict = self.extract_grouped_time_series_bulk(event_ids, start_date, end_date, group_operation,
+                                                                output, parallel, mode, engine)
+        if isinstance(event_id, (list, tuple)):
+            return [timeseries_dict[item] for item in event_ids]
+        return timeseries_dict[event_id]
+
+    def extract_grouped_time_series_bulk(self, event_ids, start_date, end_date, group_operation, output=OUTPUT_LIST,
+                                         parallel=1, mode=Data.data, engine=ENGINE_SQL):
         """
-        # Group operation should be of TimeseriesGroupOperation enum type.
-        if not isinstance(group_operation, TimeseriesGroupOperation):
-            raise InvalidDataAdapterError("Provided group_operation: %s is of not valid type" % group_operation)
+        Extract the grouped timeseries of several events with a single GROUP BY query,
+        or a query per MAX_EVENTS_PER_QUERY events.
+        :param list event_ids: list of timeseries ids
+        :param int parallel: Split the events among up to `parallel` threads, each with its own connection.
+        Default is 1
+        Refer to extract_grouped_time_series for the other parameters.
+        :return dict: Dict of grouped timeseries against the event_id s.t.
+        {
+            'eventId1': [[datetime, value], [datetime, value], ...],
+            'eventId2': [],
+        }
+        """
+        validate_output(output)
+        validate_engine(engine)
+        self._validate_parallel(parallel)
+        preset = isinstance(group_operation, TimeseriesGroupOperation)
+        group_operation = to_group_operation(group_operation)
+        if not isinstance(mode, Data):
+            raise InvalidDataAdapterError("Provided Data type %s is invalid" % mode)
 
         # Validate start and end dates.
         # Should be in the COMMON_DATETIME_FORMAT('%Y-%m-%d %H:%M:%S'). Should be in string format.
         if not validate_common_datetime(start_date) or not validate_common_datetime(end_date):
             raise InvalidDataAdapterError("Provided start_date: %s or end_date: %s is no in the '%s' format"
                                           % (start_date, end_date, COMMON_DATETIME_FORMAT))
-
-        # Get the SQL Query.
-        sql_query = get_query(group_operation, event_id, start_date, end_date)
-        # Execute the SQL Query.
-        timeseries = []
-        try:
-            with self.connection.cursor() as cursor:
-                cursor.execute(sql_query)
-                timeseries = cursor.fetchall()
-        except Exception as ex:
-            raise DatabaseAdapterError("An error occurred while executing sql query: %s, Exception Message: %s"
-                                       % (sql_query, ex.messsage))
-
-        # Prepare the output time series.
-        # If the retrieved data set is empty return empty list.
-        return [[time, value] for time, value in timeseries]
-
+        columnar = output == OUTPUT_COLUMNAR
+
+        # Read the whole buckets of the coarsest rollup which can answer exactly, and the rest from raw data
+        rollup = plan_rollup(group_operation, start_date, end_date) if self.rollups else None
+
+        def select(cursor, group):
+            if engine == ENGINE_NUMPY:
+                return self._resample_timeseries(cursor, mode.value, group, start_date, end_date, group_operation,
+                                                 columnar)
+            return self._select_grouped_timeseries(cursor, mode.value, group, start_date, end_date, group_operation,
+                                                   columnar, rollup)
+
+        event_id_list = list(OrderedDict.fromkeys(event_ids))
+        group_size = max(1, -(-len(event_id_list) // parallel))
+        groups = [event_id_list[i:i + group_size] for i in range(0, len(event_id_list), group_size)]
+        response = OrderedDict((event_id, to_columns([]) if columnar else []) for event_id in event_id_list)
+        for timeseries_dict in self._fan_out(select, groups, parallel):
+            response.update(timeseries_dict)
+        if preset and not columnar:
+            response = OrderedDict((event_id, format_times(timeseries)) for event_id, timeseries in response.items())
+        return response
+
+    def _select_grouped_timeseries(self, cursor, data_table, event_ids, start_date, end_date, group_operation,
+                                   columnar=False, rollup=None):
+        """Select grouped timeseries of given events with a query per MAX_EVENTS_PER_QUERY events
+
+        :param tuple rollup: (resolution, rollup_start, rollup_end) returned by plan_rollup, in order to read
+        the buckets in between from the rollup table. If None, read raw data only.
+        :return dict: Dict of grouped timeseries against the event_id. Events without any rows are omitted.
+        """
+        timeseries_dict = {}
+        for sql_query, args in grouped_timeseries_queries(data_table, group_operation, event_ids, start_date,
+                                                          end_date, columnar, rollup):
+            logging.debug('sql (extract_grouped_time_series):: %s', sql_query)
+            try:
+                cursor.execute(sql_query, args)
+                rows = cursor.fetchall()
+            except Exception as ex:
+                raise DatabaseAdapterError("An error occurred while executing sql query: %s, Exception Message: %s"
+                                           % (sql_query, ex))
+            # Rows are ordered by id, thus split them into the events while iterating
+            timeseries_dict.update(split_timeseries(rows, columnar))
+        return timeseries_dict
+
+    def _resample_timeseries(self, cursor, data_table, event_ids, start_date, end_date, group_operation,
+                             columnar=False):
+        """Same as _select_grouped_timeseries, but select the raw timeseries in columnar form, and group them on the
+        client with numpy, instead of the database server.
+        """
+        timeseries_dict = {}
+        raw_timeseries = self._select_timeseries(cursor, data_table, event_ids, start_date, end_date, columnar=True)
+        for event_id, (times, values) in raw_timeseries.items():
+            times, values = resample(times, values, group_operation, start_date)
+            if len(times) == 0:
+                continue
+            if columnar:
+                timeseries_dict[event_id] = (times, values)
+            else:
+                timeseries_dict[event_id] = to_rows(times, values, group_operation.aggregate)
+        return timeseries_dict
 
     def create_station(self, station=None):
         """Insert stations into the database
@@ -496,39 +1205,28 @@ class MySQLAdapter:
             station = []
         row_count = 0
         try:
-            with self.connection.cursor() as cursor:
-                if isinstance(station, tuple) and isinstance(station[0], Station):
-                    sql = "SELECT max(id) FROM `station` WHERE %s <= id AND id < %s" \
-                          % (station[0].value, station[0].value+Station.getRange(station[0]))
-                    logging.debug(sql)
-                    cursor.execute(sql)
-                    last_id = cursor.fetchone()
+            with self._connection() as connection, connection.cursor() as cursor:
+                if isinstance(station, (list, tuple)) and isinstance(station[0], Station):
                     station = list(station)
-                    if last_id[0] is not None:
-                        station[0] = last_id[0] + 1
-                    else:
-                        station[0] = station[0].value
-                if isinstance(station, list) and isinstance(station[0], Station):
-                    sql = "SELECT max(id) FROM `station` WHERE %s <= id AND id < %s" % (station[0].value, station[0].value+Station.getRange(station[0]))
-                    logging.debug(sql)
-                    cursor.execute(sql)
+                    cursor.execute(MYSQL_SELECT_STATION_MAX_ID,
+                                   (station[0].value, station[0].value + Station.getRange(station[0])))
                     last_id = cursor.fetchone()
                     if last_id[0] is not None:
                         station[0] = last_id[0] + 1
                     else:
                         station[0] = station[0].value
 
-                sql = "INSERT INTO `station` (`id`, `stationId`, `name`, `latitude`, `longitude`, `resolution`, `description`) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-
                 logging.debug('Create Station: %s', station)
-                row_count = cursor.execute(sql, station)
-                self.connection.commit()
+                row_count = cursor.execute(MYSQL_INSERT_STATION, station)
+                self._commit(connection)
+                self.dimensions.invalidate()
                 logging.debug('Created Station # %s', row_count)
 
         except Exception as e:
+            if self._in_transaction():
+                raise
             traceback.print_exc()
-        finally:
-            return row_count
+        return row_count
 
     def get_station(self, query={}):
         """
@@ -544,36 +1242,22 @@ class MySQLAdapter:
         """
         response = None
         try:
-            with self.connection.cursor() as cursor:
-                out_put_order = []
-                for key in self.station_struct_keys:
-                    out_put_order.append("`%s` as `%s`" % (key, key))
-                out_put_order = ','.join(out_put_order)
-
-                sql = "SELECT %s FROM `station` " % out_put_order
-                if query:
-                    sql += "WHERE "
-                    cnt = 0
-                    for key in query:
-                        if cnt:
-                            sql += "AND "
-
-                        sql += "`%s`=\"%s\" " % (key, query[key])
-                        cnt += 1
-
-                logging.debug('sql (get_station):: %s', sql)
-                cursor.execute(sql)
+            with self._connection() as connection, connection.cursor() as cursor:
+                sql, sql_values = select_station_query(query, STATION_KEYS)
+                logging.debug('sql (get_station):: %s, %s', sql, sql_values)
+                cursor.execute(sql, sql_values)
                 station = cursor.fetchone()
                 if station is not None:
                     response = {}
-                    for i, value in enumerate(self.station_struct_keys):
+                    for i, value in enumerate(STATION_KEYS):
                         response[value] = station[i]
                     logging.debug('station:: %s', response)
 
         except Exception as e:
+            if self._in_transaction():
+                raise
             traceback.print_exc()
-        finally:
-            return response
+        return response
 
     def delete_station(self, id=0, station_id=''):
         """Delete given station from the database
@@ -585,23 +1269,23 @@ class MySQLAdapter:
         """
         row_count = 0
         try:
-            with self.connection.cursor() as cursor:
+            with self._connection() as connection, connection.cursor() as cursor:
                 if id > 0:
-                    sql = "DELETE FROM `station` WHERE `id`=%s"
-                    row_count = cursor.execute(sql, (id))
-                    self.connection.commit()
+                    row_count = cursor.execute(MYSQL_DELETE_STATION, id)
+                    self._commit(connection)
+                    self.dimensions.invalidate()
                 elif station_id:
-                    sql = "DELETE FROM `station` WHERE `stationId`=%s"
-
-                    row_count = cursor.execute(sql, (station_id))
-                    self.connection.commit()
+                    row_count = cursor.execute(MYSQL_DELETE_STATION_BY_STATION_ID, station_id)
+                    self._commit(connection)
+                    self.dimensions.invalidate()
                 else:
                     logging.warning('Unable to find station')
 
         except Exception as e:
+            if self._in_transaction():
+                raise
             traceback.print_exc()
-        finally:
-            return row_count
+        return row_count
 
     def get_stations(self, query={}):
         """
@@ -628,33 +1312,11 @@ class MySQLAdapter:
         :return list: Return list of objects with the stations data which resign in given area.
         """
         try:
-            with self.connection.cursor() as cursor:
-                out_order = []
-                sorted_keys = sorted(self.station_struct.keys())
-                for key in sorted_keys:
-                    out_order.append("`%s` as `%s`" % (key, key))
-                out_order = ','.join(out_order)
-
-                sql = "SELECT %s FROM `station` " % (out_order)
-                if query:
-                    sql += "WHERE "
-                    cnt = 0
-                    for key in query:
-                        if cnt:
-                            sql += "AND "
-
-                        if key is 'latitude_lower':
-                            sql += "`%s`>=\"%s\" " % ('latitude', query[key])
-                        elif key is 'longitude_lower':
-                            sql += "`%s`>=\"%s\" " % ('longitude', query[key])
-                        elif key is 'latitude_upper':
-                            sql += "`%s`<=\"%s\" " % ('latitude', query[key])
-                        elif key is 'longitude_upper':
-                            sql += "`%s`<=\"%s\" " % ('longitude', query[key])
-                        cnt += 1
-
-                logging.debug('sql (get_stations):: %s', sql)
-                cursor.execute(sql)
+            with self._connection() as connection, connection.cursor() as cursor:
+                sorted_keys = sorted(STATION_KEYS)
+                sql, sql_values = select_stations_in_area_query(query, sorted_keys)
+                logging.debug('sql (get_stations):: %s, %s', sql, sql_values)
+                cursor.execute(sql, sql_values)
                 stations = cursor.fetchall()
                 response = []
                 for station in stations:
@@ -665,6 +1327,8 @@ class MySQLAdapter:
 
                 return response
         except Exception as e:
+            if self._in_transaction():
+                raise
             traceback.print_exc()
 
     def create_source(self, source=None):
@@ -692,13 +1356,9 @@ class MySQLAdapter:
 
         row_count = 0
         try:
-            with self.connection.cursor() as cursor:
-                sql = "INSERT INTO `source` (`id`, `source`, `parameters`) VALUES (%s, %s, %s)"
-
+            with self._connection() as connection, connection.cursor() as cursor:
                 if len(source) < 3:
-                    sql_source_id = "SELECT max(id) FROM `source`"
-                    logging.debug(sql_source_id)
-                    cursor.execute(sql_source_id)
+                    cursor.execute(MYSQL_SELECT_SOURCE_MAX_ID)
                     last_id = cursor.fetchone()
                     if isinstance(source, tuple):
                         source = list(source)
@@ -712,18 +1372,20 @@ class MySQLAdapter:
                     source = tuple(source)
 
                 logging.debug('Create Source: %s', source)
-                row_count = cursor.execute(sql, source)
-                self.connection.commit()
+                row_count = cursor.execute(MYSQL_INSERT_SOURCE, source)
+                self._commit(connection)
+                self.dimensions.invalidate()
                 logging.debug('Created Source # %s', row_count)
 
         except Exception as e:
+            if self._in_transaction():
+                raise
             logging.warning(e)
-        finally:
-            return {
-                'status': row_count > 0,
-                'row_count': row_count,
-                'source': source
-            }
+        return {
+            'status': row_count > 0,
+            'row_count': row_count,
+            'source': source
+        }
 
     def get_source(self, source_id=0, name=''):
         """
@@ -740,32 +1402,23 @@ class MySQLAdapter:
         """
         response = {}
         try:
-            with self.connection.cursor() as cursor:
-                output_order = []
-                for key in self.source_struct_keys:
-                    output_order.append("`%s` as `%s`" % (key, key))
-                output_order = ','.join(output_order)
-
-                sql = "SELECT %s FROM `source` " % output_order
-                if source_id > 0:
-                    sql += "WHERE id=%s" % source_id
-                elif name:
-                    sql += "WHERE source=\"%s\"" % name
-                else:
+            with self._connection() as connection, connection.cursor() as cursor:
+                if source_id <= 0 and not name:
                     logging.warning('Unable to find source')
-
-                logging.debug('sql (get_source):: %s', sql)
-                cursor.execute(sql)
+                sql, sql_values = select_source_query(source_id, name, SOURCE_KEYS)
+                logging.debug('sql (get_source):: %s, %s', sql, sql_values)
+                cursor.execute(sql, sql_values)
                 source = cursor.fetchone()
                 if source is not None:
-                    for i, value in enumerate(self.source_struct_keys):
+                    for i, value in enumerate(SOURCE_KEYS):
                         response[value] = source[i]
                     logging.debug('source:: %s', response)
 
         except Exception as e:
+            if self._in_transaction():
+                raise
             logging.warning(e)
-        finally:
-            return response
+        return response
 
     def delete_source(self, id=0):
         """Delete given source from the database
@@ -780,22 +1433,26 @@ class MySQLAdapter:
         """
         row_count = 0
         try:
-            with self.connection.cursor() as cursor:
+            with self._connection() as connection, connection.cursor() as cursor:
                 if id > 0:
-                    sql = "DELETE FROM `source` WHERE `id`=%s"
-                    row_count = cursor.execute(sql, id)
-                    self.connection.commit()
+                    row_count = cursor.execute(MYSQL_DELETE_SOURCE, id)
+                    self._commit(connection)
+                    self.dimensions.invalidate()
                 else:
                     logging.warning('Unable to find station')
 
         except Exception as e:
+            if self._in_transaction():
+                raise
             logging.warning(e)
-        finally:
-            return {
-                'status': row_count > 0,
-                'row_count': row_count
-            }
+        return {
+            'status': row_count > 0,
+            'row_count': row_count
+        }
 
     def close(self):
         # disconnect from server
-        self.connection.close()
+        for connection in self._pinned:
+            self.pool.release(connection)
+        self._pinned = []
+        self.pool.close()
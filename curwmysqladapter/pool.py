@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+from .AdapterError import DatabaseAdapterError
+
+DEFAULT_MIN_SIZE = 1
+DEFAULT_MAX_SIZE = 10
+DEFAULT_HEALTH_CHECK_INTERVAL = 30.0
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of pymysql connections.
+    Idle connections are pinged before checking out if they were idle longer than the health check interval,
+    and reconnected if the server has closed them. Broken connections are discarded when they are returned.
+    """
+
+    def __init__(self, connect_params, min_size=DEFAULT_MIN_SIZE, max_size=DEFAULT_MAX_SIZE, timeout=None,
+                 health_check_interval=DEFAULT_HEALTH_CHECK_INTERVAL):
+        """
+        :param dict connect_params: Arguments of pymysql.connect s.t. {'host': 'localhost', 'user': 'root', ...}
+        :param int min_size: Number of connections which are opened at the start and kept open
+        :param int max_size: Maximum number of open connections. When all are in use, acquire() waits.
+        :param float timeout: Maximum time in seconds to wait for a free connection. Default is waiting forever.
+        :param float health_check_interval: Ping connections which were idle longer than this many seconds.
+        If 0, ping on every checkout.
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise DatabaseAdapterError("Invalid pool size: min_size=%s, max_size=%s" % (min_size, max_size))
+        self.connect_params = connect_params
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._condition = threading.Condition()
+        # Idle connections as (connection, returned time). Most recently returned connections are at the end.
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'reconnects': 0,
+            'discarded': 0,
+        }
+        for i in range(min_size):
+            self._idle.append((self._connect(), time.time()))
+            self._size += 1
+
+    def _connect(self):
+        return pymysql.connect(**self.connect_params)
+
+    def acquire(self, timeout=None):
+        """
+        Check out a connection. Release it with release() after use.
+        :param float timeout: Maximum time in seconds to wait for a free connection. Default is the pool timeout.
+        :return: pymysql connection
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise DatabaseAdapterError("Connection pool is closed")
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reserve the slot, and connect without holding the lock
+                    self._size += 1
+                    connection, returned_at = None, None
+                    break
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise DatabaseAdapterError("Unable to get a connection from the pool within %ss" % timeout)
+                self._stats['waits'] += 1
+                self._condition.wait(remaining)
+            self._stats['checkouts'] += 1
+
+        try:
+            if connection is None:
+                connection = self._connect()
+            elif not connection.open or time.time() - returned_at >= self.health_check_interval:
+                connection.ping(reconnect=True)
+        except Exception:
+            logging.warning('Unable to reconnect to the database. Opening a new connection.')
+            try:
+                connection = self._connect()
+                with self._condition:
+                    self._stats['reconnects'] += 1
+            except Exception:
+                self._discard()
+                raise
+        return connection
+
+    def release(self, connection, broken=False):
+        """
+        Return a checked out connection into the pool. Uncommitted changes are rolled back.
+        :param connection: pymysql connection returned by acquire()
+        :param boolean broken: If True, close the connection instead of reusing it
+        """
+        if not broken and connection.open:
+            try:
+                if connection.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    # Also ends the read snapshot, thus the next user sees the latest committed data
+                    connection.rollback()
+            except Exception:
+                broken = True
+        if broken or not connection.open or self._closed:
+            try:
+                connection.close()
+            except Exception:
+                pass
+            self._discard()
+            return
+        with self._condition:
+            self._idle.append((connection, time.time()))
+            self._condition.notify()
+
+    def _discard(self):
+        with self._condition:
+            self._size -= 1
+            self._stats['discarded'] += 1
+            self._condition.notify()
+
+    def close(self):
+        """Close all the idle connections. Connections which are in use are closed when they are released."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for connection, returned_at in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def get_stats(self):
+        """Get counters of the pool
+
+        :return dict: Dict of counters s.t.
+        {
+            'size': 4, # Number of open connections
+            'idle': 3,
+            'in_use': 1,
+            'checkouts': 1200,
+            'waits': 2, # Number of times acquire() waited for a free connection
+            'reconnects': 1,
+            'discarded': 1, # Broken connections which were closed
+        }
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+        stats['in_use'] = stats['size'] - stats['idle']
+        return stats
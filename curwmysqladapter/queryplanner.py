@@ -0,0 +1,231 @@
+from collections import OrderedDict
+
+from .AdapterError import InvalidDataAdapterError, DatabaseConstrainAdapterError
+from .columnar import to_columns
+from .dimensions import DIMENSIONS
+from .SQLQueries import stitched_timeseries_query
+
+# Output columns of event ids queries
+EVENT_KEYS = ['id', 'name', 'source', 'station', 'type', 'unit', 'variable']
+# Meta Data Structure of the event objects
+META_STRUCT = {
+    'station': '',
+    'variable': '',
+    'unit': '',
+    'type': '',
+    'source': '',
+    'name': ''
+}
+# Columns of `run` which can be used to filter and to order events
+EVENT_QUERY_KEYS = EVENT_KEYS + ['start_date', 'end_date']
+# Conditions of the `from` and `to` keys of the meta query, which match the runs overlapping the time range
+RUN_OVERLAP_CONDITIONS = {
+    'from': "`run`.`end_date`>=%s",
+    'to': "`run`.`start_date`<=%s",
+}
+
+# Keys of the meta query for stitching timeseries. Runs are matched on all of them except `type`.
+STITCH_REQUIRED_KEYS = ['station', 'variable', 'source']
+STITCH_QUERY_KEYS = STITCH_REQUIRED_KEYS + ['unit', 'name']
+# Chunked forecast types in the order of preference for stitching. For each time, the forecast with the shortest
+# lead time is preferred, i.e. the chunk of the latest run. Chunks before the run dates are the last resort.
+FORECAST_HORIZON_TYPES = ['Forecast-0-d'] + ['Forecast-%s-d-after' % i for i in range(1, 15)] + \
+                         ['Forecast-%s-d-before' % i for i in range(1, 15)]
+
+_MYSQL_SELECT_RUN = "SELECT %s FROM `run` " % ','.join("`run`.`%s`" % key for key in EVENT_KEYS)
+
+
+class EventQueryPlanner:
+    """
+    Plan event ids queries against the `run` table, instead of the `run_view` which joins `run` with all
+    the dimension tables. Dimension names (station, variable, unit, type, source) of the meta query are
+    translated into ids with the DimensionCache, thus the query can use the indexes on the integer columns
+    of `run` s.t. `station_idx`, `type_idx`. Names of the returned events are mapped back from the cache.
+    """
+
+    def __init__(self, dimensions):
+        """
+        :param DimensionCache dimensions: cache of dimension ids
+        """
+        self.dimensions = dimensions
+
+    def plan(self, cursor, meta_query, opts):
+        """
+        Returns mysql query and its arguments for searching events in `run`.
+        :param cursor: pymysql cursor, which is used if the dimension cache needs to be reloaded
+        :param dict meta_query: Meta Query. Refer to MySQLAdapter.get_event_ids
+        :param dict opts: Options s.t. limit, skip, after_id and order_by. Refer to MySQLAdapter.get_event_ids
+        :return: tuple of (mysql query, list of query arguments). If no event can match, return None.
+        """
+        if opts.get('after_id') and opts.get('order_by') not in (None, 'id', ['id']):
+            raise InvalidDataAdapterError("after_id pagination only supports ordering by id")
+
+        conditions = []
+        args = []
+        for key, value in meta_query.items():
+            if key in RUN_OVERLAP_CONDITIONS:
+                # Runs which have timeseries within the range, i.e. [start_date, end_date] overlaps [from, to]
+                if value is not None:
+                    conditions.append(RUN_OVERLAP_CONDITIONS[key])
+                    args.append(value)
+                continue
+            if key not in EVENT_QUERY_KEYS:
+                raise InvalidDataAdapterError("Invalid meta query key %s. Should be one of %s"
+                                              % (key, EVENT_QUERY_KEYS))
+            values = list(value) if isinstance(value, (list, tuple)) else [value]
+            if key in DIMENSIONS:
+                values = [i for i in self.dimensions.get_ids(cursor, key, values) if i is not None]
+            if not values:
+                return None
+            if len(values) == 1:
+                conditions.append("`run`.`%s`=%%s" % key)
+            else:
+                conditions.append("`run`.`%s` IN (%s)" % (key, ','.join(['%s'] * len(values))))
+            args.extend(values)
+        if opts.get('after_id'):
+            conditions.append("`run`.`id`>%s")
+            args.append(opts['after_id'])
+
+        joins, order_by = self._order_by_clause(opts.get('order_by'))
+        sql = _MYSQL_SELECT_RUN + joins
+        if conditions:
+            sql += "WHERE " + ' AND '.join(conditions) + " "
+        sql += order_by
+        if opts.get('limit'):
+            sql += " LIMIT %s"
+            args.append(int(opts['limit']))
+            if opts.get('skip'):
+                sql += " OFFSET %s"
+                args.append(int(opts['skip']))
+        elif opts.get('skip'):
+            # MySQL does not support OFFSET without LIMIT
+            sql += " LIMIT 18446744073709551615 OFFSET %s"
+            args.append(int(opts['skip']))
+        return sql, args
+
+    def plan_stitch(self, cursor, meta_query, types, data_table, from_date=None, to_date=None, columnar=False):
+        """
+        Returns mysql query and its arguments for stitching the timeseries of the runs of given types.
+        :param cursor: pymysql cursor, which is used if the dimension cache needs to be reloaded
+        :param dict meta_query: Meta Query. Refer to MySQLAdapter.retrieve_stitched_timeseries
+        :param list types: Type names in the order of preference
+        :return: tuple of (mysql query, list of query arguments). If no run can match, return None.
+        """
+        for key in STITCH_REQUIRED_KEYS:
+            if key not in meta_query:
+                raise InvalidDataAdapterError("Meta query should have %s in order to stitch timeseries" % key)
+        run_filters = OrderedDict()
+        for key in STITCH_QUERY_KEYS:
+            if key not in meta_query:
+                continue
+            value = meta_query[key]
+            if key in DIMENSIONS:
+                value = self.dimensions.get_id(cursor, key, value)
+                if value is None:
+                    return None
+            run_filters[key] = value
+        for key in meta_query:
+            if key not in STITCH_QUERY_KEYS:
+                raise InvalidDataAdapterError("Invalid meta query key %s. Should be one of %s"
+                                              % (key, STITCH_QUERY_KEYS))
+        type_ids = [i for i in self.dimensions.get_ids(cursor, 'type', types) if i is not None]
+        if not type_ids:
+            return None
+        return stitched_timeseries_query(data_table, run_filters, type_ids, from_date, to_date, columnar)
+
+    @staticmethod
+    def _order_by_clause(order_by):
+        """
+        :param order_by: column name or list of column names. Prefix with '-' for descending order, e.g. '-start_date'
+        :return: tuple of (JOIN clauses, ORDER BY clause). Dimensions are ordered by their names, thus only
+        the dimension tables of those are joined. Always ends with `id` to have a deterministic order.
+        """
+        if not order_by:
+            order_by = []
+        elif not isinstance(order_by, (list, tuple)):
+            order_by = [order_by]
+
+        joins = OrderedDict()
+        columns = []
+        for key in order_by:
+            direction = 'DESC' if key.startswith('-') else 'ASC'
+            key = key.lstrip('-')
+            if key not in EVENT_QUERY_KEYS:
+                raise InvalidDataAdapterError("Unable to order by %s. Should be one of %s" % (key, EVENT_QUERY_KEYS))
+            if key in DIMENSIONS:
+                joins[key] = "JOIN `%s` ON `%s`.`id`=`run`.`%s` " % (key, key, key)
+                columns.append("`%s`.`%s` %s" % (key, DIMENSIONS[key], direction))
+            elif key != 'id':
+                columns.append("`run`.`%s` %s" % (key, direction))
+        columns.append("`run`.`id` ASC")
+        return ''.join(joins.values()), "ORDER BY " + ', '.join(columns)
+
+    def run_values(self, cursor, event_id, meta_data):
+        """
+        Get the values of a new `run` row in the order of MYSQL_INSERT_RUN, with dimension ids resolved
+        through the dimension cache.
+        :param cursor: pymysql cursor, which is used if the dimension cache needs to be reloaded
+        :param string event_id: Hex Hash value of the run
+        :param dict meta_data: Meta Data of the run. Refer to MySQLAdapter.create_event_id
+        :return tuple: values of the row
+        """
+        sql_values = [event_id, meta_data['name']]
+        for key in ['station', 'variable', 'unit', 'type', 'source']:
+            dimension_id = self.dimensions.get_id(cursor, key, meta_data[key])
+            if dimension_id is None:
+                raise DatabaseConstrainAdapterError("Could not find %s with value %s" % (key, meta_data[key]))
+            sql_values.append(dimension_id)
+        return tuple(sql_values)
+
+    def to_events(self, cursor, rows, meta_struct):
+        """
+        Map the rows of a planned query into event objects, with dimension names instead of ids.
+        :param cursor: pymysql cursor, which is used if the dimension cache needs to be reloaded
+        :param rows: rows of the planned query
+        :param dict meta_struct: Meta Data Structure of the event objects
+        :return: list of event objects
+        """
+        events = []
+        for row in rows:
+            event = dict(meta_struct)
+            for i, key in enumerate(EVENT_KEYS):
+                if key in DIMENSIONS:
+                    event[key] = self.dimensions.get_name(cursor, key, row[i])
+                else:
+                    event[key] = row[i]
+            events.append(event)
+        return events
+
+
+def timeseries_events(event_ids, columnar=False):
+    """
+    Prepare the event objects of a timeseries response, with empty timeseries.
+    :param list event_ids: list of event ids, or list of event objects with an `id`
+    :param boolean columnar: If True, empty timeseries are columnar
+    :return: tuple of (list of event objects in the same order, OrderedDict of the list of event objects against
+    each event id)
+    """
+    response = []
+    events = OrderedDict()
+    for event in event_ids:
+        if isinstance(event, dict):
+            event_id = event.get('id')
+        else:
+            event_id = event
+            event = {'id': event_id}
+        event['timeseries'] = to_columns([]) if columnar else []
+        response.append(event)
+        events.setdefault(event_id, []).append(event)
+    return response, events
+
+
+def set_timeseries(events, timeseries_dict, columnar=False):
+    """
+    Set the timeseries of the event objects returned by timeseries_events.
+    :param OrderedDict events: list of event objects against each event id
+    :param dict timeseries_dict: Dict of timeseries against the event id
+    :param boolean columnar: If False, each event object gets its own copy of the timeseries list
+    """
+    for event_id, timeseries in timeseries_dict.items():
+        for event in events.get(event_id, []):
+            event['timeseries'] = timeseries if columnar else list(timeseries)
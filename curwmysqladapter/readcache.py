@@ -0,0 +1,233 @@
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_MIN_TIME = datetime.min
+_MAX_TIME = datetime.max
+# Times are stored with a precision of seconds, thus [start, end - _EPSILON] covers the same rows as [start, end)
+_EPSILON = timedelta(microseconds=1)
+# Approximate memory usage of a cached row with a datetime, a Decimal and the list slots
+_ROW_BYTES = sys.getsizeof(datetime(2017, 1, 1)) + sys.getsizeof(Decimal('1.000')) + 2 * 8
+
+
+class _Entry:
+    def __init__(self):
+        # Sorted, disjoint and inclusive (start, end) time intervals which are loaded
+        self.intervals = []
+        self.times = []
+        self.values = []
+
+    def size(self):
+        return len(self.times) * _ROW_BYTES
+
+
+class TimeseriesCache:
+    """
+    Range aware read-through cache of timeseries, keyed by (event_id, data table).
+    Each entry keeps the time intervals which were loaded from the database, thus an overlapping request only
+    needs to fetch the missing sub ranges. Entries are evicted in LRU order to stay within max_bytes.
+    Reads are done in three steps, in order to query the database without holding the lock:
+        1. plan() - get the missing ranges of the request
+        2. fill() - add the fetched rows of the missing ranges
+        3. get() - read the request from the cache
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param int max_bytes: Approximate memory budget of the cached rows in bytes
+        """
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Incremented on each invalidation of a key, thus rows fetched before that are not cached
+        self._generations = {}
+        self._bytes = 0
+        self._stats = {
+            'hits': 0,
+            'partial_hits': 0,
+            'misses': 0,
+            'fetched_ranges': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    @staticmethod
+    def _bounds(start, end):
+        return start if start is not None else _MIN_TIME, end if end is not None else _MAX_TIME
+
+    def plan(self, key, start=None, end=None):
+        """
+        Get the sub ranges of [start, end] which are not in the cache.
+        :param tuple key: (event_id, data table)
+        :param datetime start: start datetime [inclusive]. None for unbounded.
+        :param datetime end: end datetime [inclusive]. None for unbounded.
+        :return: tuple of (list of missing (start, end) ranges, generation of the key). Unbounded ends are None.
+        """
+        start, end = self._bounds(start, end)
+        with self._lock:
+            entry = self._entries.get(key)
+            missing = []
+            current = start
+            for interval_start, interval_end in entry.intervals if entry is not None else []:
+                if interval_end < current:
+                    continue
+                if interval_start > end:
+                    break
+                if interval_start > current:
+                    missing.append((current, interval_start - _EPSILON))
+                if interval_end >= end:
+                    current = None
+                    break
+                current = interval_end + _EPSILON
+            if current is not None and current <= end:
+                missing.append((current, end))
+
+            if not missing:
+                self._stats['hits'] += 1
+            elif missing == [(start, end)]:
+                self._stats['misses'] += 1
+            else:
+                self._stats['partial_hits'] += 1
+            self._stats['fetched_ranges'] += len(missing)
+            generation = self._generations.get(key, 0)
+        return [(s if s != _MIN_TIME else None, e if e != _MAX_TIME else None) for s, e in missing], generation
+
+    def fill(self, key, generation, start, end, rows):
+        """
+        Add the rows of a missing range, unless the key was invalidated after planning.
+        :param tuple key: (event_id, data table)
+        :param int generation: generation of the key returned by plan()
+        :param datetime start: start datetime of the range [inclusive]. None for unbounded.
+        :param datetime end: end datetime of the range [inclusive]. None for unbounded.
+        :param list rows: list of [time, value] rows of the range, ordered by time
+        """
+        start, end = self._bounds(start, end)
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            self._bytes -= entry.size()
+
+            rows = [row for row in rows if start <= row[0] <= end]
+            lo = bisect_left(entry.times, start)
+            hi = bisect_right(entry.times, end)
+            entry.times[lo:hi] = [time for time, value in rows]
+            entry.values[lo:hi] = [value for time, value in rows]
+
+            intervals = sorted(entry.intervals + [(start, end)])
+            entry.intervals = [intervals[0]]
+            for interval_start, interval_end in intervals[1:]:
+                last_start, last_end = entry.intervals[-1]
+                if last_end == _MAX_TIME or interval_start <= last_end + _EPSILON:
+                    entry.intervals[-1] = (last_start, max(last_end, interval_end))
+                else:
+                    entry.intervals.append((interval_start, interval_end))
+
+            self._bytes += entry.size()
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def get(self, key, start=None, end=None):
+        """
+        Read [start, end] from the cache.
+        :return: list of [time, value] rows. If the range is not fully cached, return None.
+        """
+        start, end = self._bounds(start, end)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not any(s <= start and end <= e for s, e in entry.intervals):
+                return None
+            self._entries.move_to_end(key)
+            lo = bisect_left(entry.times, start)
+            hi = bisect_right(entry.times, end)
+            return [[time, value] for time, value in zip(entry.times[lo:hi], entry.values[lo:hi])]
+
+    def invalidate(self, key, start=None, end=None):
+        """
+        Drop [start, end] of the key from the cache, s.t. after inserting timeseries in that range.
+        :param tuple key: (event_id, data table)
+        :param datetime start: start datetime [inclusive]. None for unbounded.
+        :param datetime end: end datetime [inclusive]. None for unbounded.
+        """
+        start, end = self._bounds(start, end)
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._stats['invalidations'] += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            intervals = []
+            for interval_start, interval_end in entry.intervals:
+                if interval_end < start or interval_start > end:
+                    intervals.append((interval_start, interval_end))
+                    continue
+                if interval_start < start:
+                    intervals.append((interval_start, start - _EPSILON))
+                if interval_end > end:
+                    intervals.append((end + _EPSILON, interval_end))
+            if not intervals:
+                self._remove(key)
+                return
+
+            self._bytes -= entry.size()
+            lo = bisect_left(entry.times, start)
+            hi = bisect_right(entry.times, end)
+            del entry.times[lo:hi]
+            del entry.values[lo:hi]
+            entry.intervals = intervals
+            self._bytes += entry.size()
+
+    def invalidate_event(self, event_id):
+        """Drop all the cached timeseries of given event"""
+        with self._lock:
+            keys = [key for key in list(self._entries.keys()) + list(self._generations.keys()) if key[0] == event_id]
+        for key in set(keys):
+            self.invalidate(key)
+
+    def clear(self):
+        with self._lock:
+            for key in self._entries:
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        """Get counters of the cache
+
+        :return dict: Dict of counters s.t.
+        {
+            'hits': 10, # Requests which were served from the cache
+            'partial_hits': 5, # Requests which fetched only the missing sub ranges
+            'misses': 2, # Requests which fetched the whole range
+            'fetched_ranges': 8,
+            'evictions': 0,
+            'invalidations': 3,
+            'entries': 12,
+            'bytes': 102400, # Approximate memory usage of the cached rows
+            'max_bytes': 67108864,
+        }
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self._stats['evictions'] += 1
@@ -0,0 +1,90 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .data import Aggregate
+from .columnar import require_numpy
+from .AdapterError import InvalidDataAdapterError
+
+# Engines of grouped timeseries extraction
+ENGINE_SQL = 'sql'
+ENGINE_NUMPY = 'numpy'
+ENGINES = (ENGINE_SQL, ENGINE_NUMPY)
+
+# Decimal places of the aggregates as returned by MySQL for the DECIMAL(8,3) `value` column.
+# AVG adds div_precision_increment (4) places.
+_SCALE = 3
+_AVG_SCALE = _SCALE + 4
+_AVG_QUANTUM = Decimal(1).scaleb(-_AVG_SCALE)
+
+
+def validate_engine(engine):
+    if engine not in ENGINES:
+        raise InvalidDataAdapterError("Invalid engine %s. Should be one of %s" % (engine, ENGINES))
+    if engine == ENGINE_NUMPY:
+        require_numpy()
+
+
+def resample(times, values, group_operation, start_date=None):
+    """
+    Aggregate columnar timeseries into the time buckets of group_operation, in the same way as
+    SQLQueries.grouped_timeseries_query does on the database server.
+    :param times: numpy datetime64[s] array, sorted
+    :param values: numpy float64 array
+    :param GroupOperation group_operation: bucket interval, offset and aggregate
+    :param start_date: If given, keep only the times after start_date [exclusive], format: "%Y-%m-%d %H:%M:%S"
+    :return: tuple of (times, values) numpy arrays of datetime64[s] bucket start times and float64 aggregates
+    """
+    if start_date is not None:
+        after = np.searchsorted(times, np.datetime64(start_date, 's'), side='right')
+        times, values = times[after:], values[after:]
+    if len(times) == 0:
+        return np.array([], dtype='datetime64[s]'), np.array([], dtype=np.float64)
+    interval, offset = group_operation.interval, group_operation.offset
+    buckets = np.floor_divide(times.astype('datetime64[s]').astype(np.int64) - offset, interval)
+    # Times are sorted, thus each bucket is a contiguous slice
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.concatenate((starts[1:], [len(buckets)]))
+
+    aggregate = group_operation.aggregate
+    if aggregate is Aggregate.sum:
+        result = _exact_sums(values, starts) / 10.0 ** _SCALE
+    elif aggregate is Aggregate.max:
+        result = np.maximum.reduceat(values, starts)
+    elif aggregate is Aggregate.min:
+        result = np.minimum.reduceat(values, starts)
+    elif aggregate is Aggregate.avg:
+        # MySQL rounds the exact average half up, while np.round rounds half to even
+        result = np.array([float((Decimal(int(total)).scaleb(-_SCALE) / int(count)).quantize(
+            _AVG_QUANTUM, rounding=ROUND_HALF_UP)) for total, count in zip(_exact_sums(values, starts), ends - starts)],
+            dtype=np.float64)
+    elif aggregate is Aggregate.count:
+        result = (ends - starts).astype(np.float64)
+    elif aggregate is Aggregate.first:
+        result = values[starts]
+    elif aggregate is Aggregate.last:
+        result = values[ends - 1]
+    else:
+        raise InvalidDataAdapterError("Invalid aggregate: %s" % aggregate)
+    return (buckets[starts] * interval + offset).astype('datetime64[s]'), result
+
+
+def _exact_sums(values, starts):
+    """Sum the DECIMAL values of each bucket exactly, as integers of the smallest unit"""
+    return np.add.reduceat(np.rint(values * 10 ** _SCALE).astype(np.int64), starts)
+
+
+def to_rows(times, values, aggregate):
+    """
+    Convert resampled columns into rows of the `list` output, with the same types as MySQL returns s.t.
+    [[datetime, Decimal('1.080')], ...]. COUNT values are ints.
+    """
+    if aggregate is Aggregate.count:
+        row_values = [int(value) for value in values]
+    else:
+        value_format = '%%.%df' % (_AVG_SCALE if aggregate is Aggregate.avg else _SCALE)
+        row_values = [Decimal(value_format % value) for value in values]
+    return [[time, value] for time, value in zip(times.astype(object), row_values)]
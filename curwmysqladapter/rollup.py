@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from .data import Aggregate
+from .Utils import to_datetime
+
+# Bucket sizes of the rollup rows in seconds; 5 minutes, hourly and daily.
+# Each resolution is a multiple of the previous one, thus it is aggregated from the previous rollup rows.
+ROLLUP_RESOLUTIONS = (300, 3600, 86400)
+# Aggregates which can be computed from the `sum`, `min`, `max` and `count` of the rollup rows
+ROLLUP_AGGREGATES = (Aggregate.sum, Aggregate.min, Aggregate.max, Aggregate.count, Aggregate.avg)
+
+_EPOCH = datetime(1970, 1, 1)
+# Times are stored with a precision of seconds, thus (start, end] covers the same rows as [start + 1s, end + 1s)
+_SECOND = timedelta(seconds=1)
+
+
+def _floor(time, resolution):
+    seconds = int((time - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def _ceil(time, resolution):
+    floor = _floor(time, resolution)
+    return floor if floor == time else floor + timedelta(seconds=resolution)
+
+
+def rollup_ranges(run_dates, resolution):
+    """
+    Get the ranges of the rollup buckets which contain the time ranges of newly inserted data.
+    :param dict run_dates: dict of {event_id: (start_date, end_date)} of inclusive time ranges
+    :param int resolution: Bucket size of the rollup rows in seconds
+    :return dict: dict of {event_id: (start datetime [inclusive], end datetime [exclusive])} aligned to the buckets
+    """
+    return dict((event_id, (_floor(to_datetime(start_date), resolution),
+                            _floor(to_datetime(end_date), resolution) + timedelta(seconds=resolution)))
+                for event_id, (start_date, end_date) in run_dates.items())
+
+
+def plan_rollup(group_operation, start_date, end_date):
+    """
+    Choose the coarsest rollup which can answer a grouped extraction exactly. The interval and offset of the
+    group operation should be multiples of the rollup resolution, thus each rollup bucket falls into a single
+    group bucket. Only the whole rollup buckets in between start_date and end_date are read from the rollup,
+    and the edges outside of them from the data table.
+    :param GroupOperation group_operation: bucket interval, offset and aggregate
+    :param start_date: starting datetime (early datetime) [exclusive], format: "%Y-%m-%d %H:%M:%S"
+    :param end_date: ending datetime (late datetime) [inclusive], format: "%Y-%m-%d %H:%M:%S"
+    :return: tuple of (resolution, rollup start datetime [inclusive], rollup end datetime [exclusive]).
+    If no rollup can answer, return None.
+    """
+    if group_operation.aggregate not in ROLLUP_AGGREGATES:
+        return None
+    start = to_datetime(start_date) + _SECOND
+    end = to_datetime(end_date) + _SECOND
+    for resolution in reversed(ROLLUP_RESOLUTIONS):
+        if group_operation.interval % resolution or group_operation.offset % resolution:
+            continue
+        rollup_start, rollup_end = _ceil(start, resolution), _floor(end, resolution)
+        if rollup_start < rollup_end:
+            return resolution, rollup_start, rollup_end
+    return None
@@ -0,0 +1,232 @@
+import datetime
+import json
+import os
+import logging, logging.config
+import time
+import traceback
+from contextlib import contextmanager
+
+import unittest2 as unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from curwmysqladapter import MySQLAdapter, Data, InsertMethod, GroupOperation, Aggregate
+
+BENCHMARK_ROWS = int(os.environ.get('CURW_BENCHMARK_ROWS', 100000))
+
+
+@contextmanager
+def pooled_connection(adapter):
+    """Check out a connection from the pool of the adapter, and return it at the end"""
+    connection = adapter.pool.acquire()
+    try:
+        yield connection
+    finally:
+        adapter.pool.release(connection)
+
+
+def legacy_insert_timeseries(adapter, event_id, timeseries, upsert=False, mode=Data.data):
+    """Insert path of `insert_timeseries` up to v0.2.3, kept as the baseline for the benchmarks"""
+    with pooled_connection(adapter) as connection, connection.cursor() as cursor:
+        sql_table = "INSERT INTO `%s`" % mode.value
+        sql = sql_table + " (`id`, `time`, `value`) VALUES (%s, %s, %s)"
+        if upsert:
+            sql = sql_table + \
+                  " (`id`, `time`, `value`) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE `value`=VALUES(`value`)"
+
+        timeseries_copy = []
+        for item in timeseries:
+            timeseries_copy.append(item[:])
+
+        new_timeseries = []
+        for t in [i for i in timeseries_copy]:
+            if len(t) > 1:
+                t[1] = round(float(t[1]), 3)
+                t.insert(0, event_id)
+                new_timeseries.append(t)
+
+        row_count = cursor.executemany(sql, new_timeseries)
+        connection.commit()
+        return row_count
+
+
+def legacy_retrieve_timeseries(adapter, event_ids, mode=Data.data):
+    """Per event retrieve path of `retrieve_timeseries` up to v0.2.3, kept as the baseline for the benchmarks"""
+    response = []
+    with pooled_connection(adapter) as connection, connection.cursor() as cursor:
+        for event_id in event_ids:
+            cursor.execute("SELECT `time`,`value` FROM `%s` WHERE `id`=\"%s\" " % (mode.value, event_id))
+            response.append({'id': event_id, 'timeseries': [[time, value] for time, value in cursor.fetchall()]})
+    return response
+
+
+def synthetic_timeseries(size, start=datetime.datetime(2017, 1, 1)):
+    """Minutely timeseries of given size"""
+    return [[(start + datetime.timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S'), (i % 1000) / 7.0]
+            for i in range(size)]
+
+
+@unittest.skipUnless(os.environ.get('CURW_BENCHMARK'), 'Set CURW_BENCHMARK=1 to run benchmarks')
+class MySQLAdapterBenchmark(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        try:
+            root_dir = os.path.dirname(os.path.realpath(__file__))
+            config = json.loads(open(root_dir + '/CONFIG.json').read())
+
+            # Initialize Logger
+            logging_config = json.loads(open(root_dir + '/LOGGING_CONFIG.json').read())
+            logging.config.dictConfig(logging_config)
+            cls.logger = logging.getLogger('MySQLAdapterBenchmark')
+            cls.logger.addHandler(logging.StreamHandler())
+            cls.logger.info('setUpClass')
+
+            cls.adapter = MySQLAdapter(host=config.get('MYSQL_HOST', 'localhost'),
+                                       user=config.get('MYSQL_USER', 'root'),
+                                       password=config.get('MYSQL_PASSWORD', ''),
+                                       db=config.get('MYSQL_DB', 'curw'),
+                                       local_infile=True)
+            meta_data = {
+                'station': 'Hanwella',
+                'variable': 'Precipitation',
+                'unit': 'mm',
+                'type': 'Forecast-0-d',
+                'source': 'WRF',
+                'name': 'Benchmark Test',
+            }
+            cls.event_id = cls.adapter.get_event_id(meta_data)
+            if cls.event_id is None:
+                cls.event_id = cls.adapter.create_event_id(meta_data)
+        except Exception as e:
+            traceback.print_exc()
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            cls.adapter.delete_timeseries(cls.event_id)
+            cls.adapter.close()
+        except Exception as e:
+            traceback.print_exc()
+
+    def clear_timeseries(self):
+        with pooled_connection(self.adapter) as connection, connection.cursor() as cursor:
+            cursor.execute("DELETE FROM `data` WHERE `id`=%s", self.event_id)
+            connection.commit()
+
+    def report(self, name, rows, seconds):
+        self.logger.info('%-32s %8d rows in %7.3fs : %10.0f rows/sec', name, rows, seconds, rows / seconds)
+
+    def test_insertTimeseriesThroughput(self):
+        timeseries = synthetic_timeseries(BENCHMARK_ROWS)
+        benchmarks = [
+            ('executemany (v0.2.3)', lambda: legacy_insert_timeseries(self.adapter, self.event_id, timeseries)),
+            ('multi-row VALUES', lambda: self.adapter.insert_timeseries(self.event_id, timeseries)),
+            ('LOAD DATA LOCAL INFILE',
+             lambda: self.adapter.insert_timeseries(self.event_id, timeseries, method=InsertMethod.load_data)),
+        ]
+        if np is not None:
+            times = np.array([t for t, v in timeseries], dtype='datetime64[s]')
+            values = np.array([v for t, v in timeseries])
+            benchmarks.append(('numpy columns', lambda: self.adapter.insert_timeseries_columns(self.event_id,
+                                                                                                times, values)))
+        for name, insert in benchmarks:
+            self.clear_timeseries()
+            start = time.time()
+            row_count = insert()
+            self.report(name, len(timeseries), time.time() - start)
+            self.assertEqual(row_count, len(timeseries))
+
+    def test_getEventIdsPaging(self):
+        run_count = int(os.environ.get('CURW_BENCHMARK_RUNS', 20000))
+        page_size = 100
+        meta_data = {
+            'station': 'Hanwella',
+            'variable': 'Precipitation',
+            'unit': 'mm',
+            'type': 'Forecast-0-d',
+            'source': 'WRF',
+        }
+        start = time.time()
+        for i in range(0, run_count, 1000):
+            self.adapter.get_or_create_event_ids(
+                [dict(meta_data, name='Paging Benchmark %06d' % j) for j in range(i, min(i + 1000, run_count))])
+        self.report('create runs', run_count, time.time() - start)
+        try:
+            meta_query = {'station': 'Hanwella', 'variable': 'Precipitation'}
+
+            start = time.time()
+            skip_count = 0
+            while True:
+                page = self.adapter.get_event_ids(meta_query, {'limit': page_size, 'skip': skip_count})
+                if not page:
+                    break
+                skip_count += len(page)
+            self.report('page with LIMIT/OFFSET', skip_count, time.time() - start)
+
+            start = time.time()
+            keyset_count = 0
+            after_id = None
+            while True:
+                page = self.adapter.get_event_ids(meta_query, {'limit': page_size, 'after_id': after_id})
+                if not page:
+                    break
+                keyset_count += len(page)
+                after_id = page[-1]['id']
+            self.report('page with after_id', keyset_count, time.time() - start)
+            self.assertEqual(skip_count, keyset_count)
+            self.assertTrue(keyset_count >= run_count)
+        finally:
+            with pooled_connection(self.adapter) as connection, connection.cursor() as cursor:
+                cursor.execute("DELETE FROM `run` WHERE `name` LIKE 'Paging Benchmark %%'")
+                connection.commit()
+
+    def test_retrieveTimeseriesLatency(self):
+        meta_data = {
+            'station': 'Hanwella',
+            'variable': 'Precipitation',
+            'unit': 'mm',
+            'type': 'Forecast-0-d',
+            'source': 'WRF',
+        }
+        event_ids = self.adapter.get_or_create_event_ids(
+            [dict(meta_data, name='Retrieve Benchmark %04d' % i) for i in range(1000)])
+        try:
+            timeseries = synthetic_timeseries(96)
+            self.adapter.insert_timeseries_bulk(dict((event_id, timeseries) for event_id in event_ids), upsert=True)
+            for event_count in (10, 100, 1000):
+                start = time.time()
+                legacy = legacy_retrieve_timeseries(self.adapter, event_ids[:event_count])
+                self.report('per event query (%s events)' % event_count, 96 * event_count, time.time() - start)
+
+                start = time.time()
+                response = self.adapter.retrieve_timeseries(event_ids[:event_count])
+                self.report('IN query (%s events)' % event_count, 96 * event_count, time.time() - start)
+                self.assertEqual([e['timeseries'] for e in response], [e['timeseries'] for e in legacy])
+        finally:
+            with pooled_connection(self.adapter) as connection, connection.cursor() as cursor:
+                cursor.execute("DELETE FROM `run` WHERE `name` LIKE 'Retrieve Benchmark %%'")
+                connection.commit()
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_extractGroupedTimeseriesEngines(self):
+        start_date, end_date = '2016-12-31 23:59:59', '2018-01-01 00:00:00'
+        group_operations = [
+            ('5min sum', GroupOperation(datetime.timedelta(minutes=5), Aggregate.sum)),
+            ('hourly avg', GroupOperation(datetime.timedelta(hours=1), Aggregate.avg)),
+            ('daily last', GroupOperation(datetime.timedelta(days=1), Aggregate.last)),
+        ]
+        for size in sorted(set((1000, 10000, 100000, BENCHMARK_ROWS))):
+            self.clear_timeseries()
+            self.adapter.insert_timeseries(self.event_id, synthetic_timeseries(size))
+            for name, group_operation in group_operations:
+                results = []
+                for engine in ('sql', 'numpy'):
+                    start = time.time()
+                    results.append(self.adapter.extract_grouped_time_series(
+                        self.event_id, start_date, end_date, group_operation, output='columnar', engine=engine))
+                    self.report('%s with %s (%s rows)' % (name, engine, size), size, time.time() - start)
+                self.assertTrue(np.array_equal(results[0][0], results[1][0]))
+                self.assertTrue(np.allclose(results[0][1], results[1][1]))
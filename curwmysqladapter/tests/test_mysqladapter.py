@@ -1,14 +1,31 @@
+import asyncio
 import csv
 import datetime
 import json
 import os
 import logging, logging.config
+import shutil
+import tempfile
+import threading
 import traceback
+from decimal import Decimal
 from glob import glob
 
+import pymysql
 import unittest2 as unittest
 
-from curwmysqladapter import MySQLAdapter, Station, Data, AdapterError
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+from curwmysqladapter import MySQLAdapter, AsyncMySQLAdapter, Station, Data, AdapterError, loader, \
+    GroupOperation, Aggregate, TimeseriesGroupOperation, UPSERT_CHANGES
 
 
 class MySQLAdapterTest(unittest.TestCase):
@@ -173,6 +190,26 @@ class MySQLAdapterTest(unittest.TestCase):
     def tearDown(self):
         self.logger.info('tearDown')
 
+    # Meta data of the events which are created by the tests
+    EVENT_META_DATA = {
+        'station': 'Hanwella',
+        'variable': 'Precipitation',
+        'unit': 'mm',
+        'type': 'Forecast-0-d',
+        'source': 'WRF',
+    }
+
+    def get_or_create_event(self, name, adapter=None, **meta_data):
+        """Get the id of the test event with given name, and create it if it doesn't exist.
+        Keyword arguments override EVENT_META_DATA.
+        """
+        adapter = adapter or self.adapter
+        meta_data = dict(self.EVENT_META_DATA, name=name, **meta_data)
+        event_id = adapter.get_event_id(meta_data)
+        if event_id is None:
+            event_id = adapter.create_event_id(meta_data)
+        return event_id
+
     def test_getEventIdExists(self):
         meta_data = {
             'station': 'Hanwella',
@@ -245,6 +282,105 @@ class MySQLAdapterTest(unittest.TestCase):
             self.assertTrue(isinstance(de, AdapterError.DatabaseConstrainAdapterError))
             self.assertEqual(de.message, 'Could not find source with value HEC-HMS_Not_Exists')
 
+    def test_createEventIdWithNewStation(self):
+        # Load dimensions into the cache before creating the station
+        self.assertTrue(len(self.adapter.get_event_ids({'station': 'Hanwella'})) > 0)
+        # Missing names reload the snapshot once, until it's reloaded again
+        dimensions = self.adapter.dimensions
+        with self.adapter._connection() as connection, connection.cursor() as cursor:
+            self.assertIsNone(dimensions.get_id(cursor, 'station', 'Test Event Station'))
+            loaded_at = dimensions._loaded_at
+            self.assertEqual(dimensions.get_ids(cursor, 'station', ['Hanwella', 'Test Event Station'])[1:], [None])
+            self.assertEqual(dimensions._loaded_at, loaded_at)
+            self.assertEqual(dimensions.get_ids(cursor, 'Not a dimension', ['Hanwella']), [None])
+        station = (Station.CUrW, 'curw_test_event_station', 'Test Event Station', 7.11, 80.14, 0, "Testing Adapter")
+        self.assertEqual(self.adapter.create_station(station), 1)
+        meta_data = dict(self.EVENT_META_DATA, station='Test Event Station', type='Observed', source='WeatherStation',
+                         name='Dimension Cache Test')
+        try:
+            event_id = self.adapter.create_event_id(meta_data)
+            self.assertEqual(self.adapter.get_event_id(meta_data), event_id)
+            self.assertEqual(self.adapter.delete_timeseries(event_id), 1)
+        finally:
+            self.adapter.delete_station(station_id=station[1])
+        with self.assertRaises(AdapterError.DatabaseConstrainAdapterError):
+            self.adapter.create_event_id(meta_data)
+
+    def test_getOrCreateEventIds(self):
+        meta_data = {
+            'station': 'Hanwella',
+            'variable': 'Discharge',
+            'unit': 'm3/s',
+            'type': 'Forecast-0-d',
+            'source': 'HEC-HMS',
+            'name': 'Forecast Test'
+        }
+        existing_id = self.adapter.get_event_id(meta_data)
+        self.assertTrue(existing_id is not None)
+        new_meta_data = [dict(meta_data, name='Batch Event Test', type=t)
+                         for t in ['Forecast-0-d', 'Forecast-1-d-after', 'Forecast-2-d-after']]
+        meta_data_list = [new_meta_data[0], meta_data, new_meta_data[1], new_meta_data[2], new_meta_data[0]]
+        try:
+            event_ids = self.adapter.get_or_create_event_ids(meta_data_list)
+            self.assertEqual(len(event_ids), 5)
+            self.assertEqual(event_ids[1], existing_id)
+            self.assertEqual(event_ids[0], event_ids[4])
+            for i, m in enumerate(meta_data_list):
+                self.assertEqual(self.adapter.get_event_id(m), event_ids[i])
+            # All exist now
+            self.assertEqual(self.adapter.get_or_create_event_ids(meta_data_list), event_ids)
+        finally:
+            for m in new_meta_data:
+                self.adapter.delete_timeseries(self.adapter.get_event_id(m))
+
+    def test_getEventIdsWithPagination(self):
+        all_events = self.adapter.get_event_ids({}, {'order_by': 'id'})
+        self.assertEqual(len(all_events), 15)
+        # LIMIT / OFFSET
+        page1 = self.adapter.get_event_ids({}, {'limit': 10})
+        page2 = self.adapter.get_event_ids({}, {'limit': 10, 'skip': 10})
+        self.assertEqual(len(page1), 10)
+        self.assertEqual(len(page2), 5)
+        self.assertEqual([e['id'] for e in page1 + page2], [e['id'] for e in all_events])
+        # Keyset pagination
+        pages = []
+        after_id = None
+        while True:
+            page = self.adapter.get_event_ids({}, {'limit': 4, 'after_id': after_id})
+            if not page:
+                break
+            pages.extend(page)
+            after_id = page[-1]['id']
+        self.assertEqual([e['id'] for e in pages], [e['id'] for e in all_events])
+        # Order by
+        events = self.adapter.get_event_ids({'variable': 'Discharge'}, {'order_by': ['-type']})
+        self.assertEqual(len(events), 6)
+        self.assertEqual(events[0]['type'], 'Forecast-5-d-after')
+        # Dimensions are ordered by the names of their own tables, joining only those
+        events = self.adapter.get_event_ids({}, {'order_by': ['station', '-type']})
+        stations = [e['station'].lower() for e in events]
+        self.assertEqual(stations, sorted(stations))
+        plan = self.adapter.explain_event_ids({'variable': 'Discharge'}, {'order_by': ['station']})
+        self.assertEqual(sorted(row['table'] for row in plan), ['run', 'station'])
+
+    def test_getEventIdsWithDimensionIds(self):
+        meta_query = {
+            'station': 'Hanwella',
+            'variable': 'Precipitation',
+            'type': 'Forecast-0-d',
+        }
+        plan = self.adapter.explain_event_ids(meta_query)
+        self.assertEqual([row['table'] for row in plan], ['run'])
+        self.assertTrue(plan[0]['key'] is not None)
+        self.assertIn('station_idx', plan[0]['possible_keys'])
+        events = self.adapter.get_event_ids(meta_query)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['station'], 'Hanwella')
+        self.assertEqual(events[0]['unit'], 'mm')
+        # Unknown dimension names can't match any event
+        self.assertEqual(self.adapter.get_event_ids({'station': 'Unknown Station'}), [])
+        self.assertEqual(self.adapter.explain_event_ids({'station': 'Unknown Station'}), [])
+
     def test_getEventIdsForGivenStation(self):
         meta_query = {
             'station': 'Hanwella',
@@ -267,6 +403,100 @@ class MySQLAdapterTest(unittest.TestCase):
         timeseries = self.adapter.retrieve_timeseries(response)
         self.assertEqual(len(timeseries[0]['timeseries']), 96)
 
+    def test_retrieveTimeseriesForListOfEvents(self):
+        events = self.adapter.get_event_ids({'variable': 'Precipitation', 'type': 'Forecast-0-d'})
+        self.assertEqual(len(events), 2)
+        event_ids = [events[1]['id'], 'unknown-event-id', events[0]['id'], events[1]['id']]
+        timeseries = self.adapter.retrieve_timeseries(event_ids, {
+            'from': '2017-05-31 00:00:00',
+            'to': '2017-06-01 23:00:00'
+        })
+        self.assertEqual([t['id'] for t in timeseries], event_ids)
+        self.assertEqual([len(t['timeseries']) for t in timeseries], [48, 0, 48, 48])
+        self.assertEqual(timeseries[0]['timeseries'], timeseries[3]['timeseries'])
+
+    def test_retrieveTimeseriesColumnar(self):
+        meta_query = {
+            'station': 'Hanwella',
+            'variable': 'Precipitation',
+            'type': 'Forecast-0-d',
+        }
+        timeseries = self.adapter.retrieve_timeseries(meta_query)[0]['timeseries']
+        times, values = self.adapter.retrieve_timeseries(meta_query, {'output': 'columnar'})[0]['timeseries']
+        self.assertEqual(len(times), 96)
+        self.assertEqual(len(values), 96)
+        self.assertEqual([float(value) for time, value in timeseries], list(values))
+        if np is not None:
+            self.assertEqual(times.dtype, np.dtype('datetime64[s]'))
+            self.assertEqual(times[0], np.datetime64(timeseries[0][0]))
+        with self.assertRaises(AdapterError.InvalidDataAdapterError):
+            self.adapter.retrieve_timeseries(meta_query, {'output': 'dataframe'})
+
+    def test_retrieveTimeseriesInParallel(self):
+        event_ids = [e['id'] for e in self.adapter.get_event_ids({}, {'order_by': 'id'})]
+        event_ids.reverse()
+        expected = self.adapter.retrieve_timeseries(event_ids)
+        timeseries = self.adapter.retrieve_timeseries(event_ids, {'parallel': 4})
+        self.assertEqual([t['id'] for t in timeseries], event_ids)
+        self.assertEqual(timeseries, expected)
+        for parallel in (0, -1, 1.5):
+            with self.assertRaises(AdapterError.DatabaseAdapterError):
+                self.adapter.retrieve_timeseries(event_ids, {'parallel': parallel})
+
+    def test_iterTimeseries(self):
+        event_id = self.adapter.get_event_ids({
+            'station': 'Hanwella',
+            'variable': 'Precipitation',
+            'type': 'Forecast-0-d',
+        })[0]['id']
+        timeseries = self.adapter.retrieve_timeseries([event_id])[0]['timeseries']
+        self.assertEqual(list(self.adapter.iter_timeseries(event_id)), timeseries)
+        batches = list(self.adapter.iter_timeseries(event_id, chunk_size=40))
+        self.assertEqual([len(batch) for batch in batches], [40, 40, 16])
+        rows = list(self.adapter.iter_timeseries(event_id, '2017-05-31 00:00:00', '2017-06-01 23:00:00'))
+        self.assertEqual(len(rows), 48)
+        # Closing the generator early releases the connection
+        generator = self.adapter.iter_timeseries(event_id)
+        next(generator)
+        generator.close()
+        self.assertEqual(len(self.adapter.retrieve_timeseries([event_id])[0]['timeseries']), 96)
+        # Can't see the uncommitted changes of a transaction
+        with self.adapter.transaction():
+            with self.assertRaises(AdapterError.DatabaseAdapterError):
+                self.adapter.iter_timeseries(event_id)
+
+    def test_retrieveStitchedTimeseries(self):
+        start = datetime.datetime(2017, 7, 1)
+        # Hourly values of the type ordinal, in overlapping ranges
+        runs = [('Forecast-0-d', 0, 6), ('Forecast-1-d-after', 3, 9), ('Forecast-1-d-before', 6, 12)]
+        event_ids = []
+        for i, (type_name, first_hour, last_hour) in enumerate(runs):
+            event_id = self.get_or_create_event('Stitch Test', type=type_name)
+            event_ids.append(event_id)
+            self.adapter.insert_timeseries(event_id, [[start + datetime.timedelta(hours=h), i]
+                                                      for h in range(first_hour, last_hour)], upsert=True)
+        meta_query = {'station': 'Hanwella', 'variable': 'Precipitation', 'source': 'WRF', 'name': 'Stitch Test'}
+        try:
+            response = self.adapter.retrieve_stitched_timeseries(meta_query)
+            expected = [0] * 6 + [1] * 3 + [2] * 3
+            self.assertEqual(response, [[start + datetime.timedelta(hours=h), Decimal(expected[h])] for h in range(12)])
+
+            response = self.adapter.retrieve_stitched_timeseries(meta_query, {
+                'from': '2017-07-01 04:00:00',
+                'to': '2017-07-01 07:00:00',
+                'types': ['Forecast-1-d-after', 'Forecast-0-d'],
+            })
+            self.assertEqual(response, [[start + datetime.timedelta(hours=h), Decimal(1)] for h in range(4, 8)])
+            if np is not None:
+                times, values = self.adapter.retrieve_stitched_timeseries(meta_query, {'output': 'columnar'})
+                self.assertEqual(len(times), 12)
+                self.assertEqual(times[0], np.datetime64('2017-07-01T00:00:00'))
+                self.assertEqual(list(values), [float(value) for value in expected])
+            self.assertEqual(self.adapter.retrieve_stitched_timeseries(dict(meta_query, station='Unknown')), [])
+        finally:
+            for event_id in event_ids:
+                self.adapter.delete_timeseries(event_id)
+
     def test_retrieveTimeseriesFromToDate(self):
         meta_query = {
             'station': 'Hanwella',
@@ -335,6 +565,570 @@ class MySQLAdapterTest(unittest.TestCase):
         self.assertEqual(len(processed_timeseries[0]['timeseries']), 24)
         self.assertEqual(len(processed_timeseries), 1)
 
+    def test_insertTimeseriesInChunkedStatements(self):
+        # Force to split into several INSERT statements
+        adapter = MySQLAdapter(**dict(self.adapter.connection_params, max_packet_size=1000))
+        event_id = self.get_or_create_event('Chunked Insert Test', adapter)
+        start = datetime.datetime(2017, 6, 1)
+        timeseries = [[start + datetime.timedelta(hours=i), i / 3.0] for i in range(96)]
+        try:
+            row_count = adapter.insert_timeseries(event_id, timeseries)
+            self.assertEqual(row_count, 96)
+            response = self.adapter.retrieve_timeseries([event_id])
+            self.assertEqual(len(response[0]['timeseries']), 96)
+            self.assertEqual(float(response[0]['timeseries'][1][1]), 0.333)
+        finally:
+            adapter.delete_timeseries(event_id)
+            adapter.close()
+
+    def test_insertTimeseriesFromGenerator(self):
+        event_id = self.get_or_create_event('Streaming Insert Test')
+        start = datetime.datetime(2017, 6, 1)
+        timeseries = ([start + datetime.timedelta(minutes=i), i % 10] for i in range(1000))
+        progress = []
+        try:
+            row_count = self.adapter.insert_timeseries(event_id, timeseries, chunk_size=300,
+                                                       progress=lambda rows, count: progress.append((rows, count)))
+            self.assertEqual(row_count, 1000)
+            self.assertEqual(progress, [(300, 300), (600, 600), (900, 900), (1000, 1000)])
+        finally:
+            self.adapter.delete_timeseries(event_id)
+
+    def test_insertTimeseriesUpdateRunDates(self):
+        event_id = self.get_or_create_event('Run Dates Test')
+        try:
+            self.adapter.insert_timeseries(event_id, [['2017-06-02 00:00:00', 1], ['2017-06-02 01:00:00', 2]])
+            self.adapter.insert_timeseries(event_id, [['2017-06-01_23:00:00', 1]])
+            self.adapter.insert_timeseries(event_id, [['2017-06-03 00:00:00', 1]], mode=Data.processed_data)
+            run_dates = (datetime.datetime(2017, 6, 1, 23), datetime.datetime(2017, 6, 3))
+            events = self.adapter.get_event_ids({
+                'name': 'Run Dates Test',
+                'start_date': run_dates[0].strftime('%Y-%m-%d %H:%M:%S'),
+                'end_date': run_dates[1].strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            self.assertEqual([event['id'] for event in events], [event_id])
+            self.assertEqual(tuple(self.adapter.repair_run_dates(event_id)), run_dates)
+            # Runs overlapping the time range
+            for meta_query, count in [({'from': '2017-06-03 00:00:00'}, 1), ({'from': '2017-06-03 00:00:01'}, 0),
+                                      ({'to': '2017-06-01 23:00:00'}, 1), ({'to': '2017-06-01 22:59:59'}, 0),
+                                      ({'from': '2017-06-02 00:00:00', 'to': '2017-06-02 01:00:00'}, 1)]:
+                events = self.adapter.get_event_ids(dict(meta_query, name='Run Dates Test'))
+                self.assertEqual(len(events), count, meta_query)
+            # Times without zero padding
+            self.adapter.insert_timeseries(event_id, [['2017-6-4 10:00:00', 1], ['2017-6-4 9:00:00', 1]])
+            events = self.adapter.get_event_ids({'name': 'Run Dates Test', 'end_date': '2017-06-04 10:00:00'})
+            self.assertEqual([event['id'] for event in events], [event_id])
+            self.assertEqual(tuple(self.adapter.repair_run_dates(event_id)),
+                             (run_dates[0], datetime.datetime(2017, 6, 4, 10)))
+        finally:
+            self.adapter.delete_timeseries(event_id)
+
+    def test_insertTimeseriesBulk(self):
+        event_ids = [self.get_or_create_event('Bulk Insert Test', station=station)
+                     for station in ['Hanwella', 'Colombo']]
+        start = datetime.datetime(2017, 6, 1)
+        try:
+            row_count = self.adapter.insert_timeseries_bulk({
+                event_ids[0]: [[start + datetime.timedelta(hours=i), i] for i in range(24)],
+                event_ids[1]: [[start + datetime.timedelta(hours=i), i] for i in range(48)],
+            }, upsert=True)
+            self.assertEqual(row_count, 72)
+            response = self.adapter.retrieve_timeseries(event_ids)
+            self.assertEqual(len(response[0]['timeseries']), 24)
+            self.assertEqual(len(response[1]['timeseries']), 48)
+        finally:
+            for event_id in event_ids:
+                self.adapter.delete_timeseries(event_id)
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_insertTimeseriesColumns(self):
+        event_id = self.get_or_create_event('Columnar Insert Test')
+        times = np.arange('2017-06-01T00:00', '2017-06-02T00:00', dtype='datetime64[h]')
+        values = np.linspace(0, 1, len(times))
+        values[5] = np.nan
+        try:
+            row_count = self.adapter.insert_timeseries_columns(event_id, times, values, chunk_size=10)
+            self.assertEqual(row_count, 23)
+            response = self.adapter.retrieve_timeseries([event_id])
+            self.assertEqual(len(response[0]['timeseries']), 23)
+            self.assertEqual(response[0]['timeseries'][1], [datetime.datetime(2017, 6, 1, 1), Decimal('0.043')])
+        finally:
+            self.adapter.delete_timeseries(event_id)
+
+    def test_failedInsertWithPinnedConnection(self):
+        # Split rows of each event into separate INSERT statements
+        adapter = MySQLAdapter(**dict(self.adapter.connection_params, max_packet_size=1024))
+        event_id = self.get_or_create_event('Pinned Connection Test', adapter)
+        start = datetime.datetime(2017, 6, 1)
+        try:
+            # Legacy code pins the connection of the thread
+            self.assertTrue(adapter.connection.open)
+            row_count = adapter.insert_timeseries_bulk({
+                event_id: [[start + datetime.timedelta(hours=i), i] for i in range(24)],
+                'unknown-event-id': [[start + datetime.timedelta(hours=i), i] for i in range(24)],
+            })
+            self.assertEqual(row_count, 0)
+            # Next successful call commits only its own rows
+            self.assertEqual(adapter.insert_timeseries(event_id, [[start + datetime.timedelta(days=1), 1]]), 1)
+            response = self.adapter.retrieve_timeseries([event_id])
+            self.assertEqual(response[0]['timeseries'], [[start + datetime.timedelta(days=1), Decimal(1)]])
+        finally:
+            adapter.delete_timeseries(event_id)
+            adapter.close()
+
+    def test_transaction(self):
+        meta_data = dict(self.EVENT_META_DATA, name='Transaction Test')
+        start = datetime.datetime(2017, 6, 1)
+        timeseries = [[start + datetime.timedelta(hours=i), i] for i in range(24)]
+        with self.assertRaises(ValueError):
+            with self.adapter.transaction():
+                event_id = self.adapter.create_event_id(meta_data)
+                self.assertEqual(self.adapter.insert_timeseries(event_id, timeseries), 24)
+                raise ValueError('Rollback')
+        self.assertIsNone(self.adapter.get_event_id(meta_data))
+        # Rolled back stations are dropped from the dimension cache
+        station = (Station.CUrW, 'curw_test_rollback_station', 'Test Rollback Station', 7.11, 80.14, 0, "Testing")
+        station_meta_data = dict(meta_data, station='Test Rollback Station')
+        with self.assertRaises(ValueError):
+            with self.adapter.transaction():
+                self.assertEqual(self.adapter.create_station(station), 1)
+                self.adapter.create_event_id(station_meta_data)
+                raise ValueError('Rollback')
+        with self.assertRaises(AdapterError.DatabaseConstrainAdapterError):
+            self.adapter.create_event_id(station_meta_data)
+
+        with self.adapter.transaction():
+            event_id = self.adapter.create_event_id(meta_data)
+            with self.adapter.transaction():
+                self.adapter.insert_timeseries(event_id, timeseries)
+            self.assertEqual(len(self.adapter.retrieve_timeseries([event_id])[0]['timeseries']), 24)
+        try:
+            self.assertEqual(self.adapter.get_event_id(meta_data), event_id)
+            response = self.adapter.retrieve_timeseries([event_id])
+            self.assertEqual(len(response[0]['timeseries']), 24)
+        finally:
+            self.adapter.delete_timeseries(event_id)
+
+    def test_extractGroupedTimeseries(self):
+        event_id = self.get_or_create_event('Grouped Timeseries Test')
+        start = datetime.datetime(2017, 6, 1)
+        # 1 minute values of 3 hours, starting from 1
+        self.adapter.insert_timeseries(event_id, [[start + datetime.timedelta(minutes=i), i + 1] for i in range(180)],
+                                       upsert=True)
+        start_date, end_date = '2017-05-31 23:59:59', '2017-06-01 02:59:59'
+        try:
+            hourly_sum = self.adapter.extract_grouped_time_series(
+                event_id, start_date, end_date, GroupOperation(datetime.timedelta(hours=1), Aggregate.sum))
+            self.assertEqual(hourly_sum, [
+                [datetime.datetime(2017, 6, 1, 0), Decimal(sum(range(1, 61)))],
+                [datetime.datetime(2017, 6, 1, 1), Decimal(sum(range(61, 121)))],
+                [datetime.datetime(2017, 6, 1, 2), Decimal(sum(range(121, 181)))],
+            ])
+            expected = {
+                Aggregate.min: [1, 91],
+                Aggregate.max: [90, 180],
+                Aggregate.count: [90, 90],
+                Aggregate.first: [1, 91],
+                Aggregate.last: [90, 180],
+            }
+            for aggregate, values in expected.items():
+                group_operation = GroupOperation(datetime.timedelta(minutes=90), aggregate)
+                response = self.adapter.extract_grouped_time_series(event_id, start_date, end_date, group_operation)
+                self.assertEqual([value for time, value in response], values, aggregate)
+            # Daily buckets of +05:30 local days, which start at 18:30
+            response = self.adapter.extract_grouped_time_series(
+                event_id, start_date, end_date,
+                GroupOperation(datetime.timedelta(days=1), Aggregate.count, datetime.timedelta(hours=-5, minutes=-30)))
+            self.assertEqual(response, [[datetime.datetime(2017, 5, 31, 18, 30), 180]])
+            # Presets
+            response = self.adapter.extract_grouped_time_series(
+                event_id, start_date, end_date, TimeseriesGroupOperation.mysql_5min_max)
+            self.assertEqual(len(response), 36)
+            self.assertEqual(response[0], ['2017-06-01 00:00:00', Decimal(5)])
+        finally:
+            self.adapter.delete_timeseries(event_id)
+
+    def test_extractGroupedTimeseriesBulk(self):
+        event_ids = [self.get_or_create_event('Grouped Timeseries Bulk Test', station=station)
+                     for station in ['Hanwella', 'Colombo', 'Norwood']]
+        start = datetime.datetime(2017, 6, 1)
+        self.adapter.insert_timeseries_bulk({
+            event_ids[0]: [[start + datetime.timedelta(minutes=i), 1] for i in range(120)],
+            event_ids[1]: [[start + datetime.timedelta(minutes=i), 2] for i in range(60)],
+        }, upsert=True)
+        start_date, end_date = '2017-05-31 23:59:59', '2017-06-01 01:59:59'
+        group_operation = GroupOperation(datetime.timedelta(hours=1), Aggregate.sum)
+        try:
+            response = self.adapter.extract_grouped_time_series_bulk(event_ids, start_date, end_date,
+                                                                     group_operation)
+            self.assertEqual(list(response.keys()), event_ids)
+            self.assertEqual(response[event_ids[0]], [[datetime.datetime(2017, 6, 1, 0), Decimal(60)],
+                                                      [datetime.datetime(2017, 6, 1, 1), Decimal(60)]])
+            self.assertEqual(response[event_ids[1]], [[datetime.datetime(2017, 6, 1, 0), Decimal(120)]])
+            self.assertEqual(response[event_ids[2]], [])
+            # Same as extracting each event
+            for event_id in event_ids:
+                self.assertEqual(response[event_id], self.adapter.extract_grouped_time_series(
+                    event_id, start_date, end_date, group_operation))
+            self.assertEqual(self.adapter.extract_grouped_time_series(event_ids, start_date, end_date,
+                                                                      group_operation, parallel=2),
+                             [response[event_id] for event_id in event_ids])
+            with self.assertRaises(AdapterError.DatabaseAdapterError):
+                self.adapter.extract_grouped_time_series_bulk(event_ids, start_date, end_date, group_operation,
+                                                              parallel=0)
+            if np is not None:
+                columnar = self.adapter.extract_grouped_time_series_bulk(event_ids, start_date, end_date,
+                                                                         group_operation, output='columnar')
+                times, values = columnar[event_ids[0]]
+                self.assertEqual(list(times), [np.datetime64('2017-06-01T00:00:00'),
+                                               np.datetime64('2017-06-01T01:00:00')])
+                self.assertEqual(list(values), [60.0, 60.0])
+                self.assertEqual(len(columnar[event_ids[2]][0]), 0)
+        finally:
+            for event_id in event_ids:
+                self.adapter.delete_timeseries(event_id)
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_extractGroupedTimeseriesWithNumpy(self):
+        event_id = self.get_or_create_event('Grouped Timeseries Numpy Test')
+        start = datetime.datetime(2017, 6, 1)
+        self.adapter.insert_timeseries(event_id, [[start + datetime.timedelta(minutes=i), (i % 17) / 7.0]
+                                                  for i in range(600)], upsert=True)
+        # Starts in between the first bucket, which is exclusive
+        start_date, end_date = '2017-06-01 00:00:00', '2017-06-01 09:30:00'
+        try:
+            for aggregate in Aggregate:
+                for interval in (datetime.timedelta(minutes=5), datetime.timedelta(hours=3)):
+                    group_operation = GroupOperation(interval, aggregate, datetime.timedelta(minutes=-30))
+                    for output in ('list', 'columnar'):
+                        sql = self.adapter.extract_grouped_time_series(event_id, start_date, end_date,
+                                                                       group_operation, output=output)
+                        client = self.adapter.extract_grouped_time_series(event_id, start_date, end_date,
+                                                                          group_operation, output=output,
+                                                                          engine='numpy')
+                        if output == 'list':
+                            self.assertEqual(client, sql, group_operation)
+                        else:
+                            self.assertTrue(np.array_equal(client[0], sql[0]), group_operation)
+                            self.assertTrue(np.allclose(client[1], sql[1]), group_operation)
+            # Averages are rounded half up as MySQL does, i.e. 0.001 / 32 = 0.00003125 is 0.0000313
+            tie_start = datetime.datetime(2017, 6, 2)
+            tie_timeseries = [[tie_start + datetime.timedelta(minutes=i), 0] for i in range(32)]
+            tie_timeseries[0][1] = 0.001
+            self.adapter.insert_timeseries(event_id, tie_timeseries, upsert=True)
+            daily_avg = GroupOperation(datetime.timedelta(days=1), Aggregate.avg)
+            for output in ('list', 'columnar'):
+                sql = self.adapter.extract_grouped_time_series(event_id, '2017-06-01 23:59:59', '2017-06-02 23:59:59',
+                                                               daily_avg, output=output)
+                client = self.adapter.extract_grouped_time_series(event_id, '2017-06-01 23:59:59',
+                                                                  '2017-06-02 23:59:59', daily_avg, output=output,
+                                                                  engine='numpy')
+                if output == 'list':
+                    self.assertEqual(sql, [[tie_start, Decimal('0.0000313')]])
+                    self.assertEqual(client, sql)
+                else:
+                    self.assertEqual(list(client[1]), list(sql[1]))
+        finally:
+            self.adapter.delete_timeseries(event_id)
+
+    def test_extractGroupedTimeseriesFromRollups(self):
+        adapter = MySQLAdapter(**dict(self.adapter.connection_params, rollups=True))
+        event_id = self.get_or_create_event('Rollup Test', adapter)
+        start = datetime.datetime(2017, 6, 1)
+        # 1 minute values of 2 days, inserted in chunks
+        adapter.insert_timeseries(event_id, [[start + datetime.timedelta(minutes=i), (i % 13) / 4.0]
+                                             for i in range(2880)], chunk_size=1000)
+        try:
+            # Update a value in between, which should update the rollups
+            adapter.insert_timeseries(event_id, [[datetime.datetime(2017, 6, 1, 12, 30), 99]], upsert=True)
+            # Inserts through an adapter without rollups leave them stale, until they are recomputed
+            self.adapter.insert_timeseries(event_id, [[datetime.datetime(2017, 6, 1, 12, 31), 99]], upsert=True)
+            daily_sum = GroupOperation(datetime.timedelta(days=1), Aggregate.sum)
+            window = ('2017-05-31 23:59:59', '2017-06-02 23:59:59')
+            self.assertNotEqual(adapter.extract_grouped_time_series(event_id, window[0], window[1], daily_sum),
+                                self.adapter.extract_grouped_time_series(event_id, window[0], window[1], daily_sum))
+            self.assertEqual(adapter.update_rollups([event_id]), 1)
+
+            windows = [
+                ('2017-05-31 23:59:59', '2017-06-02 23:59:59'),  # Aligned to the daily rollups
+                ('2017-06-01 00:00:00', '2017-06-03 00:00:00'),  # Both edges from raw data
+                ('2017-06-01 05:07:00', '2017-06-02 17:43:00'),
+            ]
+            group_operations = [
+                GroupOperation(datetime.timedelta(days=1), aggregate) for aggregate in Aggregate
+            ] + [
+                GroupOperation(datetime.timedelta(hours=3), Aggregate.avg),
+                GroupOperation(datetime.timedelta(minutes=15), Aggregate.max),
+                GroupOperation(datetime.timedelta(days=1), Aggregate.sum, datetime.timedelta(hours=-5, minutes=-30)),
+            ]
+            for start_date, end_date in windows:
+                for group_operation in group_operations:
+                    self.assertEqual(
+                        adapter.extract_grouped_time_series(event_id, start_date, end_date, group_operation),
+                        self.adapter.extract_grouped_time_series(event_id, start_date, end_date, group_operation),
+                        (start_date, end_date, group_operation))
+        finally:
+            adapter.delete_timeseries(event_id)
+            adapter.close()
+
+    def test_connectionPool(self):
+        # Separate session, which is used to close the connections of the adapter on the server side
+        server = pymysql.connect(**dict((key, self.adapter.connection_params[key])
+                                        for key in ('host', 'user', 'password', 'db')))
+        server_cursor = server.cursor()
+        server_cursor.execute("SELECT `ID` FROM information_schema.PROCESSLIST")
+        existing_ids = set(row[0] for row in server_cursor.fetchall())
+        params = dict(self.adapter.connection_params, pool_max_size=3, health_check_interval=0)
+        adapter = MySQLAdapter(**params)
+        try:
+            meta_query = {'variable': 'Precipitation', 'type': 'Forecast-0-d'}
+            expected = adapter.retrieve_timeseries(meta_query)
+            results = []
+            errors = []
+
+            def worker():
+                try:
+                    for i in range(5):
+                        results.append(adapter.retrieve_timeseries(meta_query))
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=worker) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(len(results), 40)
+            for result in results:
+                self.assertEqual(result, expected)
+            stats = adapter.get_pool_stats()
+            self.assertTrue(stats['size'] <= 3)
+            self.assertEqual(stats['in_use'], 0)
+
+            # Reconnect transparently after the server closed the connection
+            server_cursor.execute("SELECT `ID` FROM information_schema.PROCESSLIST WHERE `ID`<>CONNECTION_ID()")
+            for row in server_cursor.fetchall():
+                if row[0] not in existing_ids:
+                    server_cursor.execute("KILL %s", row[0])
+            self.assertEqual(len(adapter.get_event_ids(meta_query)), 2)
+            self.assertTrue(adapter.get_pool_stats()['reconnects'] > 0)
+        finally:
+            adapter.close()
+            server.close()
+
+    @unittest.skipIf(aiomysql is None, 'aiomysql is not installed')
+    def test_asyncAdapter(self):
+        params = dict((key, self.adapter.connection_params[key]) for key in ('host', 'user', 'password', 'db'))
+        meta_data = dict(self.EVENT_META_DATA, name='Async Adapter Test')
+
+        rollup_adapter = MySQLAdapter(**dict(self.adapter.connection_params, rollups=True))
+
+        async def run():
+            adapter = await AsyncMySQLAdapter.create(rollups=True, **params)
+            try:
+                event_id = await adapter.get_event_id(meta_data)
+                if event_id is None:
+                    event_id = await adapter.create_event_id(meta_data)
+                self.assertEqual(event_id, self.adapter.get_event_id(meta_data))
+                try:
+                    timeseries = [[datetime.datetime(2017, 6, 1, i), i] for i in range(24)]
+                    self.assertEqual(await adapter.insert_timeseries(event_id, timeseries), 24)
+                    events = await adapter.get_event_ids({'name': 'Async Adapter Test'})
+                    self.assertEqual(events, self.adapter.get_event_ids({'name': 'Async Adapter Test'}))
+                    response = await adapter.retrieve_timeseries(events)
+                    self.assertEqual(response, self.adapter.retrieve_timeseries([event_id]))
+                    station = await adapter.get_station({'name': 'Hanwella'})
+                    self.assertEqual(station, self.adapter.get_station({'name': 'Hanwella'}))
+                    # Inserts maintain the rollups
+                    daily_sum = GroupOperation(datetime.timedelta(days=1), Aggregate.sum)
+                    window = ('2017-05-31 23:59:59', '2017-06-01 23:59:59')
+                    self.assertEqual(
+                        rollup_adapter.extract_grouped_time_series(event_id, window[0], window[1], daily_sum),
+                        [[datetime.datetime(2017, 6, 1), Decimal(sum(range(24)))]])
+                    # and answer the grouped extractions
+                    self.assertEqual(await adapter.extract_grouped_time_series(event_id, window[0], window[1],
+                                                                               daily_sum),
+                                     [[datetime.datetime(2017, 6, 1), Decimal(sum(range(24)))]])
+                finally:
+                    await adapter.delete_timeseries(event_id)
+            finally:
+                await adapter.close()
+
+        try:
+            asyncio.run(run())
+        finally:
+            rollup_adapter.close()
+
+    def test_writeBehindTimeseries(self):
+        event_id = self.get_or_create_event('Write Behind Test', type='Observed', source='WeatherStation')
+        start = datetime.datetime(2017, 6, 1)
+        writer = self.adapter.write_behind(flush_rows=1000, flush_interval=60)
+        try:
+            for i in range(10):
+                writer.enqueue(event_id, [[start + datetime.timedelta(minutes=i * 6 + j), j] for j in range(6)])
+            self.assertTrue(writer.flush(timeout=10))
+            stats = writer.get_stats()
+            self.assertEqual(stats['enqueued_batches'], 10)
+            self.assertEqual(stats['flushes'], 1)
+            self.assertEqual(stats['flushed_rows'], 60)
+            self.assertEqual(stats['queue_depth'], 0)
+            response = self.adapter.retrieve_timeseries([event_id])
+            self.assertEqual(len(response[0]['timeseries']), 60)
+            writer.close()
+            with self.assertRaises(AdapterError.DatabaseAdapterError):
+                writer.flush()
+        finally:
+            writer.close()
+            self.adapter.delete_timeseries(event_id)
+
+    def test_upsertTimeseriesChanges(self):
+        event_id = self.get_or_create_event('Upsert Changes Test')
+        start = datetime.datetime(2017, 6, 1)
+        try:
+            self.adapter.insert_timeseries(event_id, [[start + datetime.timedelta(hours=i), i] for i in range(24)])
+            # Rolling window: 20 unchanged, 4 changed and 6 new points
+            timeseries = [[(start + datetime.timedelta(hours=i)).strftime('%Y-%m-%d %H:%M:%S'), i + 0.0001]
+                          for i in range(20)]
+            timeseries += [[start + datetime.timedelta(hours=i), i + 0.5] for i in range(20, 30)]
+            response = self.adapter.insert_timeseries(event_id, timeseries, upsert=UPSERT_CHANGES)
+            self.assertEqual(response, {'inserted': 6, 'updated': 4, 'skipped': 20})
+            response = self.adapter.retrieve_timeseries([event_id])
+            self.assertEqual(len(response[0]['timeseries']), 30)
+            self.assertEqual(response[0]['timeseries'][29][1], Decimal('29.5'))
+            # Concurrent calls count each new point once
+            timeseries = [[start + datetime.timedelta(hours=i), i] for i in range(30, 60)]
+            responses = []
+            threads = [threading.Thread(target=lambda: responses.append(
+                self.adapter.upsert_timeseries_changes(event_id, timeseries))) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(sum(response['inserted'] for response in responses), 30)
+            self.assertEqual(sum(response['skipped'] for response in responses), 90)
+            # Invalid values are logged and nothing is written
+            self.assertEqual(self.adapter.upsert_timeseries_changes(event_id, [[start, None]]),
+                             {'inserted': 0, 'updated': 0, 'skipped': 0})
+        finally:
+            self.adapter.delete_timeseries(event_id)
+
+    def test_retrieveTimeseriesThroughCache(self):
+        adapter = MySQLAdapter(timeseries_cache_size=1024 * 1024, **{k: v for k, v in
+                                                                  self.adapter.connection_params.items()
+                                                                  if k != 'timeseries_cache_size'})
+        event_id = self.get_or_create_event('Timeseries Cache Test', adapter)
+        start = datetime.datetime(2017, 6, 1)
+        try:
+            adapter.insert_timeseries(event_id, [[start + datetime.timedelta(hours=i), i] for i in range(72)])
+            window = {'from': '2017-06-01 00:00:00', 'to': '2017-06-02 23:00:00'}
+            self.assertEqual(len(adapter.retrieve_timeseries([event_id], window)[0]['timeseries']), 48)
+            self.assertEqual(len(adapter.retrieve_timeseries([event_id], window)[0]['timeseries']), 48)
+            # Overlapping window only fetches the last day
+            window = {'from': '2017-06-02 00:00:00', 'to': '2017-06-03 23:00:00'}
+            timeseries = adapter.retrieve_timeseries([event_id], window)[0]['timeseries']
+            self.assertEqual(len(timeseries), 48)
+            self.assertEqual(timeseries[0][0], datetime.datetime(2017, 6, 2))
+            stats = adapter.timeseries_cache.get_stats()
+            self.assertEqual((stats['misses'], stats['hits'], stats['partial_hits']), (1, 1, 1))
+            self.assertTrue(stats['bytes'] > 0)
+            # Inserts invalidate the affected range
+            adapter.insert_timeseries(event_id, [[start + datetime.timedelta(hours=24), 100]], upsert=True)
+            timeseries = adapter.retrieve_timeseries([event_id], window)[0]['timeseries']
+            self.assertEqual(timeseries[0][1], Decimal('100'))
+            self.assertEqual(adapter.timeseries_cache.get_stats()['partial_hits'], 2)
+            # Inside a transaction, reads see the changes of the block, and other threads see them after commit
+            with adapter.transaction():
+                adapter.insert_timeseries(event_id, [[start + datetime.timedelta(hours=24), 200]], upsert=True)
+                timeseries = adapter.retrieve_timeseries([event_id], window)[0]['timeseries']
+                self.assertEqual(timeseries[0][1], Decimal('200'))
+            other = []
+            thread = threading.Thread(target=lambda: other.append(adapter.retrieve_timeseries([event_id], window)))
+            thread.start()
+            thread.join()
+            self.assertEqual(other[0][0]['timeseries'][0][1], Decimal('200'))
+            # Uncommitted reads of a block are not shared with other threads, neither before nor after a rollback
+            other = []
+
+            def read_in_other_thread():
+                thread = threading.Thread(target=lambda: other.append(
+                    adapter.retrieve_timeseries([event_id], window)[0]['timeseries'][0][1]))
+                thread.start()
+                thread.join()
+
+            with self.assertRaises(ValueError):
+                with adapter.transaction():
+                    adapter.insert_timeseries(event_id, [[start + datetime.timedelta(hours=24), 250]], upsert=True)
+                    timeseries = adapter.retrieve_timeseries([event_id], window)[0]['timeseries']
+                    self.assertEqual(timeseries[0][1], Decimal('250'))
+                    read_in_other_thread()
+                    raise ValueError('Rollback')
+            read_in_other_thread()
+            self.assertEqual(other, [Decimal('200'), Decimal('200')])
+            # Flushes of the write-behind writer invalidate the cache as well
+            writer = adapter.write_behind(flush_interval=60)
+            try:
+                writer.enqueue(event_id, [[start + datetime.timedelta(hours=24), 300]])
+                self.assertTrue(writer.flush(timeout=10))
+            finally:
+                writer.close()
+            timeseries = adapter.retrieve_timeseries([event_id], window)[0]['timeseries']
+            self.assertEqual(timeseries[0][1], Decimal('300'))
+            adapter.delete_timeseries(event_id)
+            self.assertEqual(adapter.timeseries_cache.get_stats()['entries'], 0)
+        finally:
+            adapter.delete_timeseries(event_id)
+            adapter.close()
+
+    def test_loadTimeseriesDirectory(self):
+        root_dir = os.path.dirname(os.path.realpath(__file__))
+        config = os.path.join(root_dir, 'CONFIG.json')
+        tmp_dir = tempfile.mkdtemp()
+        mapping_file = os.path.join(tmp_dir, 'MAPPING.json')
+        state_file = os.path.join(tmp_dir, 'STATE')
+        with open(mapping_file, 'w') as f:
+            f.write(json.dumps({
+                'Rainfall': {
+                    'delimiter': ' ',
+                    'meta_data': {
+                        'variable': 'Precipitation',
+                        'unit': 'mm',
+                        'source': 'WRF',
+                        'name': 'Loader Test'
+                    },
+                    'types': ['Forecast-0-d', 'Forecast-1-d-after'],
+                    'interval': 24
+                }
+            }))
+        args = [os.path.join(root_dir, 'data'), '--mapping', mapping_file, '--config', config,
+                '--state', state_file, '--workers', '2']
+        try:
+            self.assertEqual(loader.main(args), 0)
+            with open(state_file) as f:
+                self.assertEqual(len(f.readlines()), 9)
+            # Resume: all the files are already loaded
+            self.assertEqual(loader.main(args), 0)
+            with open(state_file) as f:
+                self.assertEqual(len(f.readlines()), 9)
+            response = self.adapter.get_event_ids({'name': 'Loader Test', 'type': 'Forecast-0-d'})
+            self.assertEqual(len(response), 3)
+            # Events of a failed file are rolled back along with its timeseries
+            bad_file = os.path.join(tmp_dir, 'Colombo-2017-06-01.csv')
+            with open(bad_file, 'w') as f:
+                f.write('2017-06-01 00:00:00,1.0\n2017-06-01 00:05:00,Not a value\n')
+            meta_data = {'variable': 'Precipitation', 'unit': 'mm', 'type': 'Forecast-0-d', 'source': 'WRF',
+                         'name': 'Loader Failure Test'}
+            loader._adapter = self.adapter
+            _, _, row_count, _, error = loader.load_file(('bad.csv', bad_file, {'meta_data': meta_data}, True))
+            self.assertEqual(row_count, 0)
+            self.assertIsNotNone(error)
+            self.assertEqual(self.adapter.get_event_ids({'name': 'Loader Failure Test'}), [])
+        finally:
+            loader._adapter = None
+            for event in self.adapter.get_event_ids({'name': 'Loader Test'}):
+                self.adapter.delete_timeseries(event['id'])
+            shutil.rmtree(tmp_dir)
+
     def test_createStation(self):
         station = (Station.CUrW, 'curw_test_station', 'Test Station', 7.111666667, 80.14983333, 0, "Testing Adapter")
         self.logger.info(station)
@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+import traceback
+from queue import Queue, Empty, Full
+
+from .data import Data
+from .AdapterError import InvalidDataAdapterError, DatabaseAdapterError
+
+DEFAULT_FLUSH_ROWS = 10000
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_MAX_QUEUE_SIZE = 1000
+
+_STOP = object()
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class WriteBehindWriter:
+    """
+    Buffer timeseries batches in memory and write them with bulk statements in a background thread.
+    Create with MySQLAdapter.write_behind().
+    """
+
+    def __init__(self, adapter, flush_rows=DEFAULT_FLUSH_ROWS, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_queue_size=DEFAULT_MAX_QUEUE_SIZE, upsert=True):
+        """
+        :param MySQLAdapter adapter: Adapter which is dedicated for the writer. It's closed with the writer.
+        :param int flush_rows: Number of buffered rows that triggers a flush
+        :param float flush_interval: Maximum time in seconds to buffer rows before flushing
+        :param int max_queue_size: Maximum number of enqueued batches
+        :param boolean upsert: If True, upsert existing values ON DUPLICATE KEY
+        """
+        self.adapter = adapter
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.upsert = upsert
+        self.queue = Queue(maxsize=max_queue_size)
+        self._thread = threading.Thread(target=self._run, name='curw-write-behind')
+        self._thread.daemon = True
+        self._closed = False
+
+        # Buffered rows s.t. {Data.data: {event_id: [[time, value], ...]}}. Only accessed by the writer thread.
+        self._buffer = {}
+        self._buffer_rows = 0
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued_batches': 0,
+            'flushes': 0,
+            'flushed_rows': 0,
+            'failed_flushes': 0,
+            'dropped_rows': 0,
+            'last_flush_latency': 0.0,
+            'max_flush_latency': 0.0,
+            'total_flush_latency': 0.0,
+        }
+
+    def start(self):
+        self._thread.start()
+
+    def enqueue(self, event_id, timeseries, mode=Data.data, timeout=None):
+        """Enqueue timeseries to be written against given event_id.
+        If the queue is full, block until there is a free slot (backpressure).
+
+        :param string event_id: Hex Hash value that need to store timeseries against.
+        :param list timeseries: List of time & value lists. Refer to MySQLAdapter.insert_timeseries.
+        :param Data mode: Data table to store timeseries s.t. Data.data | Data.processed_data. Default is Data.data
+        :param float timeout: Maximum time in seconds to wait for a free slot. Default is waiting forever.
+        """
+        if self._closed:
+            raise DatabaseAdapterError("Write-behind writer is closed")
+        if not isinstance(mode, Data):
+            raise InvalidDataAdapterError("Provided Data type %s is invalid" % mode)
+        try:
+            self.queue.put((event_id, list(timeseries), mode), timeout=timeout)
+        except Full:
+            raise DatabaseAdapterError("Write-behind queue is full. Unable to enqueue within %ss" % timeout)
+        with self._stats_lock:
+            self._stats['enqueued_batches'] += 1
+
+    def flush(self, timeout=None):
+        """Write all the batches which were enqueued before calling flush, and wait until it's done.
+
+        :param float timeout: Maximum time in seconds to wait. Default is waiting forever.
+        :return boolean: True if flushed within the timeout
+        """
+        if self._closed:
+            raise DatabaseAdapterError("Write-behind writer is closed")
+        request = _FlushRequest()
+        self.queue.put(request)
+        return request.done.wait(timeout)
+
+    def close(self):
+        """Flush the remaining batches, stop the writer thread and close its database connection."""
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(_STOP)
+        self._thread.join()
+        self.adapter.close()
+
+    def get_stats(self):
+        """Get counters of the writer
+
+        :return dict: Dict of counters s.t.
+        {
+            'queue_depth': 2, # Number of batches waiting in the queue
+            'buffered_rows': 120, # Number of rows waiting in the writer thread for the next flush
+            'enqueued_batches': 1000,
+            'flushes': 10,
+            'flushed_rows': 100000,
+            'failed_flushes': 0,
+            'dropped_rows': 0, # Rows of failed flushes
+            'last_flush_latency': 0.12, # In seconds
+            'max_flush_latency': 0.25,
+            'avg_flush_latency': 0.15,
+        }
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self.queue.qsize()
+        stats['buffered_rows'] = self._buffer_rows
+        stats['avg_flush_latency'] = stats.pop('total_flush_latency') / stats['flushes'] if stats['flushes'] else 0.0
+        return stats
+
+    def _run(self):
+        deadline = None
+        while True:
+            timeout = max(0.0, deadline - time.time()) if deadline is not None else None
+            try:
+                item = self.queue.get(timeout=timeout)
+            except Empty:
+                self._flush()
+                deadline = None
+                continue
+
+            if item is _STOP:
+                self._flush()
+                break
+            if isinstance(item, _FlushRequest):
+                self._flush()
+                deadline = None
+                item.done.set()
+                continue
+
+            event_id, timeseries, mode = item
+            self._buffer.setdefault(mode, {}).setdefault(event_id, []).extend(timeseries)
+            self._buffer_rows += len(timeseries)
+            if deadline is None:
+                deadline = time.time() + self.flush_interval
+            if self._buffer_rows >= self.flush_rows:
+                self._flush()
+                deadline = None
+
+    def _flush(self):
+        if not self._buffer_rows:
+            return
+        buffer, rows = self._buffer, self._buffer_rows
+        self._buffer, self._buffer_rows = {}, 0
+
+        start = time.time()
+        dropped_rows = 0
+        for mode, timeseries_dict in buffer.items():
+            try:
+                self.adapter.insert_timeseries_bulk(timeseries_dict, self.upsert, mode, raise_errors=True)
+            except Exception as e:
+                traceback.print_exc()
+                mode_rows = sum(len(t) for t in timeseries_dict.values())
+                logging.error('Write-behind flush failed. Dropped %s rows of %s events', mode_rows, len(timeseries_dict))
+                dropped_rows += mode_rows
+        latency = time.time() - start
+        logging.debug('Write-behind flushed %s rows in %.3fs', rows, latency)
+
+        with self._stats_lock:
+            self._stats['flushes'] += 1
+            self._stats['flushed_rows'] += rows - dropped_rows
+            self._stats['dropped_rows'] += dropped_rows
+            self._stats['last_flush_latency'] = latency
+            self._stats['max_flush_latency'] = max(self._stats['max_flush_latency'], latency)
+            self._stats['total_flush_latency'] += latency
+            if dropped_rows:
+                self._stats['failed_flushes'] += 1
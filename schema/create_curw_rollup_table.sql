@@ -0,0 +1,38 @@
+/*
+ * Optional rollup tables of the timeseries, for MySQLAdapter(rollups=True).
+ * Each row aggregates the values of an event in a time bucket of `resolution` seconds;
+ * 300 (5 minutes), 3600 (hourly) and 86400 (daily). Buckets are aligned to '1970-01-01 00:00:00'.
+ * $ mysql -h <host> -u <username> -p < create_curw_rollup_table.sql
+ */
+
+CREATE TABLE `curw`.`data_rollup` (
+  `id` VARCHAR(64) NOT NULL,
+  `resolution` INT NOT NULL COMMENT 'Bucket size in seconds',
+  `time` DATETIME NOT NULL COMMENT 'Start of the bucket',
+  `sum` DECIMAL(15,3) NOT NULL,
+  `min` DECIMAL(8,3) NOT NULL,
+  `max` DECIMAL(8,3) NOT NULL,
+  `count` INT NOT NULL,
+  PRIMARY KEY (`id`, `resolution`, `time`),
+  CONSTRAINT `rollup_id`
+    FOREIGN KEY (`id`)
+    REFERENCES `curw`.`run` (`id`)
+    ON DELETE CASCADE
+    ON UPDATE CASCADE
+);
+
+CREATE TABLE `curw`.`processed_data_rollup` (
+  `id` VARCHAR(64) NOT NULL,
+  `resolution` INT NOT NULL COMMENT 'Bucket size in seconds',
+  `time` DATETIME NOT NULL COMMENT 'Start of the bucket',
+  `sum` DECIMAL(15,3) NOT NULL,
+  `min` DECIMAL(8,3) NOT NULL,
+  `max` DECIMAL(8,3) NOT NULL,
+  `count` INT NOT NULL,
+  PRIMARY KEY (`id`, `resolution`, `time`),
+  CONSTRAINT `processed_rollup_id`
+    FOREIGN KEY (`id`)
+    REFERENCES `curw`.`run` (`id`)
+    ON DELETE CASCADE
+    ON UPDATE CASCADE
+);
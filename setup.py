@@ -16,6 +16,15 @@ setup(name='curwmysqladapter',
       install_requires=[
           'PyMySQL',
       ],
+      extras_require={
+          'numpy': ['numpy'],
+          'async': ['aiomysql'],
+      },
+      entry_points={
+          'console_scripts': [
+              'curw-load-timeseries=curwmysqladapter.loader:main',
+          ],
+      },
       test_suite='nose.collector',
       tests_require=[
           'nose',